@@ -1,18 +1,54 @@
-from flask import Flask, jsonify, request, abort
+from flask import Flask, jsonify, request, abort, Response, stream_with_context
 from flask_cors import CORS
 import subprocess
 import json
 import os
+import time
 from cpmodel_2025 import main as run_schedule_model
-from test_plup import run_auto_scheduling
+from schedule_jobs import ScheduleJobManager
+from solver_presets import load_presets
+from result_store import invalidate_results
 from supabase import create_client
+from postgrest.exceptions import APIError
 import logging
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, date
 
 # 載入環境變數
 load_dotenv()
 
+# 前端休假狀態 (leave_state) 對應的 offtype
+LEAVE_OFFTYPES = {1: '紅O', 2: '藍O', 3: '特休'}
+
+def is_missing_function(err):
+    """PostgREST 回報資料庫函式不存在（尚未部署）時為 True，其餘錯誤應照常拋出"""
+    return isinstance(err, APIError) and str(err.code) in ('PGRST202', '404')
+
+def diff_leaves(current, upserts, removals=(), replace=False):
+    """
+    計算休假的最小寫入集合（save_cycle_leaves 資料庫函式未部署時使用）
+    @param current: dict, {(employee_id, offdate): (uuid, offtype)} 資料庫中的休假
+    @param upserts: dict, {(employee_id, offdate): offtype} 應存在的休假
+    @param removals: iterable, 要刪除的 (employee_id, offdate)
+    @param replace: bool, upserts 為完整集合，不在其中的休假一律刪除
+    @return: dict, {'insert': [(鍵, offtype)], 'update': {offtype: [uuid]}, 'delete': [uuid], 'unchanged': int}
+    """
+    removed = set(current) - set(upserts) if replace else set(removals) & set(current)
+    insert, update, unchanged = [], {}, 0
+    for key, offtype in upserts.items():
+        if key not in current:
+            insert.append((key, offtype))
+        elif current[key][1] != offtype:
+            update.setdefault(offtype, []).append(current[key][0])
+        else:
+            unchanged += 1
+    return {
+        'insert': insert,
+        'update': update,
+        'delete': [current[key][0] for key in sorted(removed)],
+        'unchanged': unchanged
+    }
+
 def create_logger(app):
     """建立日誌記錄器"""
     if not app.debug:
@@ -47,9 +83,27 @@ class APIServer():
             self.supabase_client = create_client(self.supa_url, self.supa_api_key)
             self.logger.info("Successfully connected to Supabase.")
 
+        # 排班背景工作（行程池於第一次送出工作時才建立）
+        self.job_manager = ScheduleJobManager()
+
         # 註冊路由
         self.register_routes()
 
+    def resolve_employee_ids(self, names):
+        """
+        以單次 in_ 查詢取得多位員工的 id
+        @param names: iterable, 員工姓名
+        @return: dict, {姓名: employee_id}；找不到的姓名不會出現在結果中
+        """
+        names = sorted({name for name in names if name})
+        if not names:
+            return {}
+        response = self.supabase_client.table('employees') \
+            .select('id, name') \
+            .in_('name', names) \
+            .execute()
+        return {row['name']: row['id'] for row in response.data or []}
+
     def register_routes(self):
         """註冊所有 API 路由"""
         
@@ -135,6 +189,7 @@ class APIServer():
 
                 result = response.data[0] if response.data else None
                 self.logger.info(f'更新成功：{result}')
+                invalidate_results()
                 return jsonify(result)
             except Exception as err:
                 self.logger.error(f'更新員工偏好設定時發生錯誤：{str(err)}')
@@ -233,6 +288,7 @@ class APIServer():
                     }).execute()
 
                 self.logger.info(f'新增員工成功：{employee_id}')
+                invalidate_results()
                 return jsonify({'id': employee_id, 'name': name.strip()})
             except Exception as err:
                 self.logger.error(f'新增員工時發生錯誤：{str(err)}')
@@ -362,7 +418,15 @@ class APIServer():
 
         @self.app.route('/api/run-schedule', methods=['POST'])
         def run_schedule():
-            """執行排班模型"""
+            """
+            送出排班工作，立即回傳 job_id，求解於背景行程池執行
+            - 請求格式: {"cycle_id": 1, "force": false, "repair": false, "preset": "fast-draft"}
+              force 為 true 時忽略排班結果快取（輸入未變更時預設直接回傳上次的結果）
+              repair 為 true 時以上次草稿為基準，只重排受變更影響的員工與日期；
+              也可指定範圍 {"employees": ["張小明"], "dates": ["2025-09-10"]}
+              preset 為求解參數預設組名稱（見 solver_presets.json），未提供時使用 default
+            - 回傳: {"success": true, "job_id": "...", "status": "queued", ...}
+            """
             try:
                 data = request.get_json()
                 cycle_id = data.get('cycle_id')
@@ -375,14 +439,27 @@ class APIServer():
                         'data': None
                     }), 400
                 
-                # 執行排班模型
-                result = run_auto_scheduling(cycle_id=cycle_id)
-                
-                # 直接回傳 run_auto_scheduling 的結果，保持格式一致
-                if result['success']:
-                    return jsonify(result)
-                else:
-                    return jsonify(result), 500
+                # 送出背景排班工作
+                repair = data.get('repair')
+                if repair is not None and not isinstance(repair, (bool, dict)):
+                    return jsonify({
+                        'success': False,
+                        'message': 'repair 參數格式錯誤',
+                        'stage': 'error',
+                        'data': None
+                    }), 400
+                preset = data.get('preset')
+                if preset is not None and preset not in load_presets():
+                    return jsonify({
+                        'success': False,
+                        'message': f'找不到求解參數預設組 {preset}',
+                        'stage': 'error',
+                        'data': None
+                    }), 400
+                job = self.job_manager.submit(int(cycle_id), force=bool(data.get('force')), repair=repair or None,
+                                              preset=preset)
+                self.logger.info(f'已送出週期 #{cycle_id} 的排班工作：{job["job_id"]}')
+                return jsonify({'success': True, **job}), 202
                     
             except Exception as e:
                 return jsonify({
@@ -391,6 +468,126 @@ class APIServer():
                     'stage': 'error',
                     'data': None
                 }), 500
+
+        # 查詢排班工作狀態
+        @self.app.route('/api/schedule-jobs/<job_id>', methods=['GET'])
+        def get_schedule_job(job_id):
+            """
+            查詢排班工作的狀態、進度與結果
+            - 回傳: {job_id, cycle_id, status, progress, created_at, started_at, finished_at, result}
+            - result 於 status 為 succeeded/failed 時才有值，格式同 run_auto_scheduling
+            """
+            job = self.job_manager.get(job_id)
+            if not job:
+                return jsonify({'error': '找不到指定的排班工作'}), 404
+            return jsonify(job)
+
+        # 以 Server-Sent Events 串流排班中間解
+        @self.app.route('/api/schedule-jobs/<job_id>/events', methods=['GET'])
+        def stream_schedule_job(job_id):
+            """
+            以 SSE 串流排班工作的進度與每個更佳的中間解
+            - event: progress  data: {stage, message, updated_at}
+            - event: solution  data: {stage, solution_index, objective, elapsed, schedule}
+            - event: done      data: 工作快照（含 result），送出後關閉連線
+            """
+            if not self.job_manager.get(job_id):
+                return jsonify({'error': '找不到指定的排班工作'}), 404
+
+            def sse(event, payload):
+                return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+            def generate():
+                sent = 0
+                last_progress = None
+                last_write = time.time()
+                while True:
+                    job = self.job_manager.get(job_id)
+                    if not job:
+                        return
+                    for event in self.job_manager.events_since(job_id, sent) or []:
+                        sent += 1
+                        last_write = time.time()
+                        yield sse('solution', event)
+                    if job['progress'] != last_progress:
+                        last_progress = job['progress']
+                        last_write = time.time()
+                        yield sse('progress', last_progress)
+                    if job['status'] in ('succeeded', 'failed'):
+                        yield sse('done', job)
+                        return
+                    # 定期送出註解行，避免代理伺服器因閒置中斷連線
+                    if time.time() - last_write > 15:
+                        last_write = time.time()
+                        yield ': keep-alive\n\n'
+                    time.sleep(0.5)
+
+            return Response(
+                stream_with_context(generate()),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        # 提前停止排班工作，採用目前最佳解
+        @self.app.route('/api/schedule-jobs/<job_id>/stop', methods=['POST'])
+        def stop_schedule_job(job_id):
+            """
+            要求求解器停止搜尋並採用目前最佳解
+            - 回傳: {"status": "success"}
+            """
+            if not self.job_manager.request_stop(job_id):
+                return jsonify({'error': '找不到執行中的排班工作'}), 404
+            self.logger.info(f'排班工作 {job_id} 已要求提前停止')
+            return jsonify({'status': 'success'})
+
+        # 列出排班工作
+        @self.app.route('/api/schedule-jobs', methods=['GET'])
+        def list_schedule_jobs():
+            """
+            列出記憶體中保留的排班工作（不含結果）
+            - 查詢參數: cycle_id (int, 可選)
+            """
+            cycle_id = request.args.get('cycle_id')
+            try:
+                jobs = self.job_manager.list(int(cycle_id) if cycle_id else None)
+                return jsonify(jobs)
+            except ValueError:
+                return jsonify({'error': '無效的 cycle_id'}), 400
+
+        # 同一日期區間內的多個班別群組同時排班
+        @self.app.route('/api/run-schedule-range', methods=['POST'])
+        def run_schedule_range():
+            """
+            送出日期區間的分組排班工作，立即回傳 job_id：依班別群組拆解區間內的所有週期，成員互不重疊的週期同時求解，
+            合併結果並以單次 upsert 寫入 employee_schedules
+            - 請求格式: {"start_date": "2025-09-01", "end_date": "2025-09-30",
+                         "deadline": 120, "force": false, "save": true}
+            - 回傳: {"success": true, "job_id": "...", "status": "queued", ...}；
+              狀態、SSE 與停止同 /api/schedule-jobs/<job_id>，result 格式同 decomposition.run_decomposition
+            """
+            data = request.get_json() or {}
+            start_date, end_date = data.get('start_date'), data.get('end_date')
+            if not start_date or not end_date:
+                return jsonify({
+                    'success': False,
+                    'message': '缺少開始或結束日期',
+                    'stage': 'error',
+                    'data': None
+                }), 400
+            try:
+                job = self.job_manager.submit_range(start_date, end_date, deadline=data.get('deadline'),
+                                                    force=bool(data.get('force')),
+                                                    save=data.get('save', True) is not False)
+                self.logger.info(f'已送出 {start_date} ~ {end_date} 的分組排班工作：{job["job_id"]}')
+                return jsonify({'success': True, **job}), 202
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'message': f'執行排班時發生錯誤：{str(e)}',
+                    'stage': 'error',
+                    'data': None
+                }), 500
+
         #查詢排班週期
         @self.app.route('/api/schedule-cycles', methods=['GET'])
         def get_cycle():
@@ -473,6 +670,7 @@ class APIServer():
                     .execute()
                 
                 self.logger.info(f'成功刪除週期 #{cycle_id}')
+                invalidate_results(cycle_id)
                 
                 return jsonify({
                     'status': 'success',
@@ -643,6 +841,7 @@ class APIServer():
                 
                 if cycle_employees_required:
                     self.supabase_client.table('schedule_cycle_members').insert(cycle_employees_required).execute()
+                invalidate_results(int(cycle_id))
 
                 return jsonify({'status': 'success', 'count': len(cycle_employees_required)})
             except Exception as err:
@@ -676,11 +875,12 @@ class APIServer():
         @self.app.route('/api/schedule-cycle-leaves', methods=['POST'])
         def save_schedule_cycle_leaves():
             """
-            儲存指定週期的休假資料到 schedule_cycle_temp_offdays 表格
-            - 請求格式: {
+            儲存指定週期的休假資料到 schedule_cycle_temp_offdays 表格，只寫入有差異的資料列
+            - 請求格式（完整集合，週期中不在其中的休假會被刪除）: {
                 "cycle_id": 1,
                 "leave_data": [
                     {
+                        "employee_id": 3,
                         "employee_name": "張小明",
                         "date": "2025-01-01",
                         "leave_state": 1,
@@ -688,87 +888,142 @@ class APIServer():
                     }
                 ]
             }
-            - 回傳: {"status": "success", "count": 5}
+            - 或只送出變更: {
+                "cycle_id": 1,
+                "delta": {
+                    "added": [格式同 leave_data],
+                    "changed": [格式同 leave_data],
+                    "removed": [{"employee_id": 3, "employee_name": "張小明", "date": "2025-01-02"}]
+                }
+            }
+              employee_id 可省略，缺少時以 employee_name 查詢（所有姓名合併為單次查詢）
+            - 以資料庫函式 save_cycle_leaves（db_functions.sql）在單一交易中套用新增、更新與刪除；
+              函式尚未部署（PGRST202/404）時才改為分別寫入，其餘錯誤直接回報
+            - date 缺少或格式錯誤時回傳 400，整份資料不寫入
+            - 回傳: {"status": "success", "count": 寫入筆數, "inserted", "updated", "deleted", "unchanged",
+                     "skipped": [找不到的員工姓名]}
             """
             try:
                 data = request.get_json()
                 cycle_id = data.get('cycle_id')
                 leave_data = data.get('leave_data', [])
+                delta = data.get('delta')
                 
                 if not cycle_id:
                     return jsonify({'error': '缺少 cycle_id 參數'}), 400
                 
-                if not leave_data:
+                if delta is None and not leave_data:
                     return jsonify({'status': 'success', 'count': 0, 'message': '沒有休假資料需要儲存'})
                 
+                cycle_id = int(cycle_id)
+                replace = delta is None
+                if replace:
+                    items, removed_items = leave_data, []
+                else:
+                    items = (delta.get('added') or []) + (delta.get('changed') or [])
+                    removed_items = delta.get('removed') or []
                 self.logger.info(f'開始儲存週期 #{cycle_id} 的休假資料...')
-                self.logger.info(f'休假資料數量: {len(leave_data)}')
+                self.logger.info(f'休假資料數量: {len(items)}，刪除: {len(removed_items)}')
                 
-                # 先清除該週期的舊休假資料
-                self.supabase_client.table('schedule_cycle_temp_offdays') \
-                    .delete() \
-                    .eq('cycle_id', int(cycle_id)) \
-                    .execute()
-                
-                self.logger.info(f'已清除週期 #{cycle_id} 的舊休假資料')
-                
-                # 準備新的休假資料
-                offdays_data = []
-                for leave_item in leave_data:
-                    employee_name = leave_item.get('employee_name')
-                    date = leave_item.get('date')
-                    leave_state = leave_item.get('leave_state')
-                    
-                    # 根據 leave_state 決定 offtype
-                    if leave_state == 1:
-                        offtype = "紅O"
-                    elif leave_state == 2:
-                        offtype = "藍O"
-                    elif leave_state == 3:
-                        offtype = "特休"
-                    else:
-                        continue  # 跳過無效狀態
-                    
-                    # 根據員工姓名查詢 employee_id
-                    employee_response = self.supabase_client.table('employees') \
-                        .select('id') \
-                        .eq('name', employee_name) \
-                        .execute()
-                    
-                    if not employee_response.data:
-                        self.logger.warning(f'找不到員工: {employee_name}')
+                # 先在記憶體中驗證整份資料，轉為 {(employee_id, offdate): offtype}（查詢次數與資料筆數無關）
+                name_to_id = self.resolve_employee_ids(
+                    item.get('employee_name') for item in items + removed_items if not item.get('employee_id'))
+                skipped, invalid = set(), []
+
+                def leave_key(item):
+                    try:
+                        offdate = date.fromisoformat(str(item.get('date'))).isoformat()
+                    except ValueError:
+                        invalid.append(item)
+                        return None
+                    employee_id = item.get('employee_id') or name_to_id.get(item.get('employee_name'))
+                    if not employee_id:
+                        self.logger.warning(f"找不到員工: {item.get('employee_name')}")
+                        skipped.add(item.get('employee_name'))
+                        return None
+                    return int(employee_id), offdate
+
+                upserts, removals = {}, set()
+                for leave_item in items:
+                    key = leave_key(leave_item)
+                    if key is None:
                         continue
-                    
-                    employee_id = employee_response.data[0]['id']
-                    
-                    offdays_data.append({
-                        'cycle_id': int(cycle_id),
-                        'employee_id': employee_id,
-                        'offdate': date,
-                        'offtype': offtype
-                    })
-                
-                # 批次插入休假資料
-                if offdays_data:
-                    response = self.supabase_client.table('schedule_cycle_temp_offdays') \
-                        .insert(offdays_data) \
+                    # 根據 leave_state 決定 offtype；無效狀態在完整集合中略過，在變更中視為刪除
+                    offtype = LEAVE_OFFTYPES.get(leave_item.get('leave_state'))
+                    if offtype is not None:
+                        upserts[key] = offtype
+                    elif not replace:
+                        removals.add(key)
+                for leave_item in removed_items:
+                    key = leave_key(leave_item)
+                    if key is not None:
+                        removals.add(key)
+                removals -= set(upserts)
+                if invalid:
+                    # 日期格式錯誤時整份資料不寫入
+                    return jsonify({'error': '休假日期格式錯誤（需為 YYYY-MM-DD）', 'invalid': invalid}), 400
+
+                try:
+                    response = self.supabase_client.rpc('save_cycle_leaves', {
+                        'p_cycle_id': cycle_id,
+                        'p_upserts': [{'employee_id': employee_id, 'offdate': offdate, 'offtype': offtype}
+                                      for (employee_id, offdate), offtype in upserts.items()],
+                        'p_removals': [{'employee_id': employee_id, 'offdate': offdate}
+                                       for employee_id, offdate in sorted(removals)],
+                        'p_replace': replace
+                    }).execute()
+                    counts = response.data
+                except APIError as err:
+                    if not is_missing_function(err):
+                        raise
+                    # 資料庫函式尚未部署：於此計算差異後分別寫入（非單一交易）
+                    self.logger.warning(f'save_cycle_leaves 呼叫失敗，改為分別寫入差異：{str(err)}')
+                    current_response = self.supabase_client.table('schedule_cycle_temp_offdays') \
+                        .select('uuid, employee_id, offdate, offtype') \
+                        .eq('cycle_id', cycle_id) \
                         .execute()
-                    
-                    inserted_count = len(response.data) if response.data else 0
-                    self.logger.info(f'成功儲存 {inserted_count} 筆休假資料')
-                    
-                    return jsonify({
-                        'status': 'success',
-                        'count': inserted_count,
-                        'message': f'成功儲存 {inserted_count} 筆休假資料'
-                    })
-                else:
-                    return jsonify({
-                        'status': 'success',
-                        'count': 0,
-                        'message': '沒有有效的休假資料需要儲存'
-                    })
-                    
+                    current = {
+                        (row['employee_id'], str(row['offdate'])): (row['uuid'], row['offtype'])
+                        for row in current_response.data or []
+                    }
+                    diff = diff_leaves(current, upserts, removals, replace)
+                    if diff['delete']:
+                        self.supabase_client.table('schedule_cycle_temp_offdays') \
+                            .delete() \
+                            .in_('uuid', diff['delete']) \
+                            .execute()
+                    for offtype, uuids in diff['update'].items():
+                        self.supabase_client.table('schedule_cycle_temp_offdays') \
+                            .update({'offtype': offtype}) \
+                            .in_('uuid', uuids) \
+                            .execute()
+                    if diff['insert']:
+                        self.supabase_client.table('schedule_cycle_temp_offdays') \
+                            .insert([{'cycle_id': cycle_id, 'employee_id': employee_id, 'offdate': offdate,
+                                      'offtype': offtype}
+                                     for (employee_id, offdate), offtype in diff['insert']]) \
+                            .execute()
+                    counts = {
+                        'inserted': len(diff['insert']),
+                        'updated': sum(len(uuids) for uuids in diff['update'].values()),
+                        'deleted': len(diff['delete']),
+                        'unchanged': diff['unchanged']
+                    }
+
+                written = counts['inserted'] + counts['updated']
+                if written or counts['deleted']:
+                    invalidate_results(cycle_id)
+                self.logger.info(f"週期 #{cycle_id} 休假資料：新增 {counts['inserted']}、更新 {counts['updated']}、"
+                                 f"刪除 {counts['deleted']}、未變更 {counts['unchanged']}")
+
+                return jsonify({
+                    'status': 'success',
+                    'count': written,
+                    **counts,
+                    'skipped': sorted(name for name in skipped if name),
+                    'message': f"成功儲存 {written} 筆休假資料，刪除 {counts['deleted']} 筆"
+                })
+
             except Exception as err:
                 self.logger.error(f'儲存週期休假資料時發生錯誤：{str(err)}')
                 return jsonify({'error': '儲存休假資料失敗'}), 500
@@ -840,6 +1095,7 @@ class APIServer():
                     .execute()
                 
                 self.logger.info(f'成功清除週期 #{cycle_id} 的 {delete_count} 筆休假資料')
+                invalidate_results(int(cycle_id))
                 
                 return jsonify({
                     'status': 'success',
@@ -966,13 +1222,19 @@ class APIServer():
                 "cycle_id": 1,
                 "changes": [
                     {
+                        "employee_id": 3,
                         "employee_name": "張小明",
                         "shift_type": "A",
                         "required_days": 5
                     }
                 ]
             }
-            - 回傳: {"status": "success", "count": 3}
+              employee_id 可省略，缺少時以 employee_name 對應
+            - 以資料庫函式 update_cycle_requirements（db_functions.sql）單次套用；
+              函式尚未部署（PGRST202/404）時才改為逐筆更新，其餘錯誤直接回報
+            - 回傳: {"status": "success", "count": 3,
+                     "results": [{employee_id, employee_name, shift_type, required_days, status}, ...]}
+              status: updated | invalid | unknown_employee | not_found
             """
             try:
                 data = request.get_json()
@@ -988,48 +1250,73 @@ class APIServer():
                 self.logger.info(f'開始更新週期 #{cycle_id} 的員工需求...')
                 self.logger.info(f'變更數量: {len(changes)}')
                 
-                updated_count = 0
-                
+                # 先在記憶體中驗證，同一員工同一班別以最後一筆為準
+                results = []
+                valid = {}
                 for change in changes:
+                    employee_id = change.get('employee_id')
                     employee_name = change.get('employee_name')
                     shift_type = change.get('shift_type')
                     required_days = change.get('required_days')
-                    
-                    if not all([employee_name, shift_type, required_days is not None]):
+                    # employee_id 可省略，提供時需為正整數；bool 雖為 int 的子類別也視為無效
+                    valid_id = employee_id in (None, '') or (
+                        not isinstance(employee_id, bool) and str(employee_id).isdigit())
+                    if not valid_id or not (employee_id or employee_name) or shift_type not in ('A', 'B', 'C') \
+                            or isinstance(required_days, bool) or not isinstance(required_days, int) \
+                            or required_days < 0:
                         self.logger.warning(f'跳過無效的變更資料: {change}')
+                        results.append({
+                            'employee_id': employee_id,
+                            'employee_name': employee_name,
+                            'shift_type': shift_type,
+                            'required_days': required_days,
+                            'status': 'invalid'
+                        })
                         continue
-                    
-                    # 根據員工姓名查詢 employee_id
-                    employee_response = self.supabase_client.table('employees') \
-                        .select('id') \
-                        .eq('name', employee_name) \
-                        .execute()
-                    
-                    if not employee_response.data:
-                        self.logger.warning(f'找不到員工: {employee_name}')
-                        continue
-                    
-                    employee_id = employee_response.data[0]['id']
-                    
-                    # 更新 schedule_cycle_members 表格中的需求資料
-                    response = self.supabase_client.table('schedule_cycle_members') \
-                        .update({'required_days': required_days}) \
-                        .eq('cycle_id', int(cycle_id)) \
-                        .eq('employee_id', employee_id) \
-                        .eq('shift_type', shift_type) \
-                        .execute()
-                    
-                    if response.data:
-                        updated_count += 1
-                        self.logger.info(f'成功更新員工 {employee_name} 的 {shift_type} 需求為 {required_days}')
-                    else:
-                        self.logger.warning(f'無法更新員工 {employee_name} 的 {shift_type} 需求')
-                
+                    valid[(employee_id or employee_name, shift_type)] = {
+                        'employee_id': int(employee_id) if employee_id else None,
+                        'employee_name': employee_name,
+                        'shift_type': shift_type,
+                        'required_days': required_days
+                    }
+
+                if valid:
+                    try:
+                        # 以資料庫函式 update_cycle_requirements（db_functions.sql）單次套用全部變更
+                        response = self.supabase_client.rpc('update_cycle_requirements', {
+                            'p_cycle_id': int(cycle_id),
+                            'p_changes': list(valid.values())
+                        }).execute()
+                        results += response.data or []
+                    except APIError as err:
+                        if not is_missing_function(err):
+                            raise
+                        # 資料庫函式尚未部署：姓名以單次查詢取得 id，再逐筆更新
+                        self.logger.warning(f'update_cycle_requirements 呼叫失敗，改為逐筆更新：{str(err)}')
+                        name_to_id = self.resolve_employee_ids(
+                            item['employee_name'] for item in valid.values() if not item['employee_id'])
+                        for item in valid.values():
+                            employee_id = item['employee_id'] or name_to_id.get(item['employee_name'])
+                            status = 'unknown_employee'
+                            if employee_id:
+                                response = self.supabase_client.table('schedule_cycle_members') \
+                                    .update({'required_days': item['required_days']}) \
+                                    .eq('cycle_id', int(cycle_id)) \
+                                    .eq('employee_id', employee_id) \
+                                    .eq('shift_type', item['shift_type']) \
+                                    .execute()
+                                status = 'updated' if response.data else 'not_found'
+                            results.append({**item, 'employee_id': employee_id, 'status': status})
+
+                updated_count = sum(1 for item in results if item['status'] == 'updated')
                 self.logger.info(f'成功更新 {updated_count} 筆需求資料')
+                if updated_count:
+                    invalidate_results(int(cycle_id))
                 
                 return jsonify({
                     'status': 'success',
                     'count': updated_count,
+                    'results': results,
                     'message': f'成功更新 {updated_count} 筆需求資料'
                 })
                 
@@ -1199,6 +1486,7 @@ class APIServer():
                 
                 shift_group = response.data[0]
                 self.logger.info(f'新增班別群組成功：{shift_group}')
+                invalidate_results()
                 return jsonify(shift_group)
             except Exception as err:
                 self.logger.error(f'新增班別群組時發生錯誤：{str(err)}')
@@ -1241,6 +1529,7 @@ class APIServer():
                 
                 shift_group = response.data[0]
                 self.logger.info(f'更新班別群組成功：{shift_group}')
+                invalidate_results()
                 return jsonify(shift_group)
             except Exception as err:
                 self.logger.error(f'更新班別群組時發生錯誤：{str(err)}')
@@ -1258,6 +1547,7 @@ class APIServer():
                     return jsonify({'error': '找不到指定的班別群組'}), 404
                 
                 self.logger.info(f'刪除班別群組成功：UUID {group_uuid}')
+                invalidate_results()
                 return jsonify({'status': 'success', 'message': '班別群組已刪除'})
             except Exception as err:
                 self.logger.error(f'刪除班別群組時發生錯誤：{str(err)}')
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+batch_schedule.py
+
+月底批次排班：一次為多個週期產生班表。
+
+1. 以 fetch_cycles_inputs 批次預先載入所有週期的輸入（每張資料表只查詢一次）
+2. 以 ProcessPoolExecutor 同時求解多個週期
+3. CPU 執行緒在工作之間平均分配（每個工作 threads // workers 條），而不是每個都使用 8 條
+4. 輸出每個週期的狀態、目標值與耗時，可另存為 CSV
+
+用法：
+    python batch_schedule.py --cycles 14 15 16 --workers 3
+    python batch_schedule.py --all-drafts --engine cpmodel --deadline 120 --output summary.csv
+"""
+
+import io
+import os
+import csv
+import sys
+import time
+import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from supabase_client import fetch_cycles_inputs, fetch_draft_cycle_ids
+
+SUMMARY_FIELDS = ['cycle_id', 'status', 'stage', 'objective', 'wall_time', 'message']
+
+
+def _solve_cycle(cycle_id, inputs, engine, deadline, num_workers, force):
+    """worker 行程的進入點：求解單一週期並回傳摘要"""
+    # 延遲匯入，避免主行程載入求解器
+    from test_plup import run_auto_scheduling, shift_group_demand
+    from cpmodel_2025 import CPMODEL
+    from portfolio_solver import prepare_inputs, cycle_dates
+    from feasibility import format_report
+    from verify_shift import verify_shift_violations
+
+    started = time.time()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if engine == 'cpmodel':
+                model = CPMODEL(cycle_id, inputs=prepare_inputs(inputs))
+                feasibility = model.precheck()
+                if not feasibility['feasible']:
+                    row = {
+                        'status': 'failed',
+                        'stage': 'precheck',
+                        'objective': None,
+                        'message': format_report(feasibility)
+                    }
+                else:
+                    model.add_constraints()
+                    model.add_preferences()
+                    solver, status = model.solve(time_limit=deadline, num_workers=num_workers)
+                    result = model.print_results(solver, status)
+                    success = result['status'] == 'success'
+                    message = result['message'].split('\n')[0]
+                    stage = 'complete' if success else 'cpmodel'
+                    if success:
+                        # 與兩階段排班、portfolio 相同：班表需通過 verify_shift 驗證才算成功
+                        success, violations = verify_shift_violations(
+                            result['schedules'], cycle_dates(inputs), shift_group_demand(inputs['shift_group'])
+                        )
+                        if not success:
+                            stage = 'verify'
+                            message = f'班表未通過驗證（{len(violations)} 項違規）'
+                    row = {
+                        'status': 'success' if success else 'failed',
+                        'stage': stage,
+                        'objective': result['penalty'] if result['status'] == 'success' else None,
+                        'message': message
+                    }
+            else:
+                result = run_auto_scheduling(cycle_id, inputs=inputs, deadline=deadline,
+                                             num_workers=num_workers, force=force)
+                data = result['data'] or {}
+                row = {
+                    'status': 'success' if result['success'] else 'failed',
+                    'stage': result['stage'],
+                    'objective': data.get('objective'),
+                    'message': result['message']
+                }
+    except Exception as e:
+        row = {'status': 'error', 'stage': 'error', 'objective': None, 'message': str(e)}
+    row.update(cycle_id=cycle_id, wall_time=round(time.time() - started, 2))
+    return row
+
+
+def run_batch(cycle_ids, engine='two_phase', workers=None, threads=None, deadline=None, force=False):
+    """
+    批次求解多個週期
+    @param cycle_ids: list, 週期 ID
+    @param engine: str, 'two_phase' (test_plup) 或 'cpmodel' (cpmodel_2025)
+    @param workers: int, 同時求解的週期數，預設 min(週期數, CPU 核心數 // 4)
+    @param threads: int, 所有工作合計的求解執行緒數，預設為 CPU 核心數
+    @param deadline: float, 每個週期的求解時間上限（秒，可選）
+    @param force: bool, 忽略排班結果快取
+    @return: list, 每個週期的摘要 dict（依 cycle_id 排序）
+    """
+    threads = threads or os.cpu_count() or 1
+    inputs_by_cycle = fetch_cycles_inputs(cycle_ids)
+    summary = [
+        {'cycle_id': cycle_id, 'status': 'error', 'stage': 'error', 'objective': None,
+         'wall_time': 0, 'message': f'找不到 cycle_id={cycle_id} 的週期資料'}
+        for cycle_id in cycle_ids if cycle_id not in inputs_by_cycle
+    ]
+    if inputs_by_cycle:
+        workers = max(1, min(workers or max(1, threads // 4), len(inputs_by_cycle)))
+        num_workers = max(1, threads // workers)
+        print(f'共 {len(inputs_by_cycle)} 個週期，{workers} 個行程，每個行程 {num_workers} 條求解執行緒')
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+            futures = [
+                executor.submit(_solve_cycle, cycle_id, inputs, engine, deadline, num_workers, force)
+                for cycle_id, inputs in inputs_by_cycle.items()
+            ]
+            for future in as_completed(futures):
+                row = future.result()
+                print(f"週期 #{row['cycle_id']} {row['status']} ({row['wall_time']}s)")
+                summary.append(row)
+    return sorted(summary, key=lambda row: row['cycle_id'])
+
+
+def print_summary(summary):
+    print(f"{'cycle_id':>8} {'status':<8} {'stage':<10} {'objective':>10} {'wall_time':>10}  message")
+    for row in summary:
+        objective = '-' if row['objective'] is None else f"{row['objective']:.0f}"
+        print(f"{row['cycle_id']:>8} {row['status']:<8} {row['stage']:<10} {objective:>10} "
+              f"{row['wall_time']:>10}  {row['message']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批次為多個週期排班')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--cycles', type=int, nargs='+', help='週期 ID 清單')
+    target.add_argument('--all-drafts', action='store_true', help='所有 status = draft 的週期')
+    parser.add_argument('--engine', choices=['two_phase', 'cpmodel'], default='two_phase')
+    parser.add_argument('--workers', type=int, help='同時求解的週期數')
+    parser.add_argument('--threads', type=int, help='合計求解執行緒數（預設為 CPU 核心數）')
+    parser.add_argument('--deadline', type=float, help='每個週期的求解時間上限（秒）')
+    parser.add_argument('--force', action='store_true', help='忽略排班結果快取')
+    parser.add_argument('--output', help='摘要另存為 CSV 檔')
+    args = parser.parse_args()
+
+    cycle_ids = args.cycles or fetch_draft_cycle_ids()
+    if not cycle_ids:
+        print('沒有需要排班的週期')
+        return 0
+
+    summary = run_batch(cycle_ids, args.engine, args.workers, args.threads, args.deadline, args.force)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+            writer.writeheader()
+            writer.writerows(summary)
+    return 0 if all(row['status'] == 'success' for row in summary) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+bench_build.py
+
+量測大型週期的建模時間、Python 記憶體峰值與取值時間（不求解最佳解）：
+- stage1  : OffdayPlanner.build_model
+- stage2  : ShiftAssignmentSolver.add_constraints + add_soft_constraints（以固定的上班/休假列建立）
+- cpmodel : CPMODEL 建構 + add_constraints + add_preferences
+
+取值時間以一個可行解（第一個解即停止）量測 format_result / get_result / print_results。
+
+用法：
+    python bench_build.py --employees 200 --days 92
+"""
+
+import io
+import time
+import argparse
+import tracemalloc
+import contextlib
+
+from ortools.sat.python import cp_model
+
+from cpmodel_2025 import CPMODEL
+from test_plup import OffdayPlanner, ShiftAssignmentSolver
+from synthetic_instances import make_cycle_inputs
+
+
+def model_size(model):
+    proto = model.Proto()
+    return len(proto.variables), len(proto.constraints)
+
+
+def measure(build):
+    """
+    建模兩次：第一次量測時間，第二次以 tracemalloc 量測記憶體（tracemalloc 會拖慢建模）
+    @return: (建模結果, 秒數, Python 記憶體峰值 MB)
+    """
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    build()
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def first_solution(model, time_limit):
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    solver.parameters.stop_after_first_solution = True
+    status = solver.Solve(model)
+    return solver, status
+
+
+def work_rows(inputs, days):
+    """固定的上班/休假列（每 7 天休 2 天，依員工錯開），只用來建立第二階段模型"""
+    return {emp['name']: [int((d + e) % 7 >= 2) for d in range(days)] for e, emp in enumerate(inputs['employees'])}
+
+
+def bench(employees, days, time_limit):
+    inputs = make_cycle_inputs(employees=employees, days=days)
+    rows = []
+
+    def build_stage1():
+        planner = OffdayPlanner(0, inputs=inputs)
+        planner.build_model()
+        return planner
+    planner, elapsed, peak = measure(build_stage1)
+    solver, status = first_solution(planner.model, time_limit)
+    extract = None
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        started = time.perf_counter()
+        planner.format_result(solver, status)
+        extract = time.perf_counter() - started
+    rows.append(('stage1',) + model_size(planner.model) + (elapsed, peak, extract))
+
+    def build_stage2():
+        shift_solver = ShiftAssignmentSolver(work_rows(inputs, days), inputs['shift_requirements'],
+                                             inputs['offdays'], inputs['shift_group'], dates=planner.dates)
+        shift_solver.add_constraints()
+        shift_solver.add_soft_constraints()
+        return shift_solver
+    shift_solver, elapsed, peak = measure(build_stage2)
+    solver, status = first_solution(shift_solver.model, time_limit)
+    extract = None
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        started = time.perf_counter()
+        shift_solver.get_result(solver, status)
+        extract = time.perf_counter() - started
+    rows.append(('stage2',) + model_size(shift_solver.model) + (elapsed, peak, extract))
+
+    def build_cpmodel():
+        model = CPMODEL(0, inputs=inputs)
+        model.add_constraints()
+        model.add_preferences()
+        return model
+    model, elapsed, peak = measure(build_cpmodel)
+    solver, status = first_solution(model.model, time_limit)
+    extract = None
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.print_results(solver, status)
+        extract = time.perf_counter() - started
+    rows.append(('cpmodel',) + model_size(model.model) + (elapsed, peak, extract))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='大型週期建模時間與記憶體量測')
+    parser.add_argument('--employees', type=int, nargs='+', default=[200])
+    parser.add_argument('--days', type=int, nargs='+', default=[92])
+    parser.add_argument('--time-limit', type=float, default=60, help='取得第一個解的時間上限（秒）')
+    args = parser.parse_args()
+
+    print(f"{'engine':<8} {'E':>4} {'D':>4} {'vars':>8} {'cons':>8} {'build(s)':>9} {'peak(MB)':>9} {'extract(s)':>10}")
+    for days in args.days:
+        for employees in args.employees:
+            with contextlib.redirect_stdout(io.StringIO()):
+                rows = bench(employees, days, args.time_limit)
+            for engine, n_vars, n_cons, elapsed, peak, extract in rows:
+                extract = '-' if extract is None else f'{extract:.3f}'
+                print(f"{engine:<8} {employees:>4} {days:>4} {n_vars:>8} {n_cons:>8} "
+                      f"{elapsed:>9.2f} {peak:>9.1f} {extract:>10}")
+
+
+if __name__ == '__main__':
+    main()
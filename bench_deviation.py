@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+bench_deviation.py
+
+比較班別天數偏差懲罰的兩種寫法：
+- legacy : 舊寫法，每個員工×班別三個 BoolVar，各自 AddAbsEquality 加兩條 reified 等式
+- tiered : cp_utils.add_tiered_deviation_penalty，單一偏差變數 + element 查表
+
+在合成的 30 天週期上分別建立 CPMODEL 與第二階段 ShiftAssignmentSolver，
+輸出變數數、約束數、求解狀態、目標值與求解時間。
+
+用法：
+    python bench_deviation.py --employees 8 16 --days 30 --time-limit 30
+"""
+
+import io
+import time
+import argparse
+import contextlib
+
+from ortools.sat.python import cp_model
+
+import cpmodel_2025
+import test_plup
+from cp_utils import add_tiered_deviation_penalty
+from synthetic_instances import make_cycle_inputs
+
+
+def legacy_deviation_penalty(model, total, required, name):
+    """舊版寫法（僅供比較）：三個 BoolVar 分別對應正負 1/2/3 天"""
+    diff = model.NewIntVar(-100, 100, f'{name}_diff')
+    model.Add(diff == total - required)
+    terms = []
+    for days, weight in [(1, 15), (2, 30), (3, 50)]:
+        penalty = model.NewBoolVar(f'{name}_penalty{days}')
+        model.AddAbsEquality(penalty, diff)
+        model.Add(penalty == days).OnlyEnforceIf(penalty)
+        model.Add(penalty != days).OnlyEnforceIf(penalty.Not())
+        terms.append(penalty * weight)
+    return sum(terms)
+
+
+ENCODINGS = {
+    'legacy': legacy_deviation_penalty,
+    'tiered': add_tiered_deviation_penalty,
+}
+
+
+def model_size(model):
+    proto = model.Proto()
+    return len(proto.variables), len(proto.constraints)
+
+
+def solve_and_measure(model, time_limit):
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    started = time.time()
+    status = solver.Solve(model)
+    objective = solver.ObjectiveValue() if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None
+    return solver.StatusName(status), objective, time.time() - started
+
+
+def bench_cpmodel(inputs, encoding, time_limit):
+    cpmodel_2025.add_tiered_deviation_penalty = ENCODINGS[encoding]
+    model = cpmodel_2025.CPMODEL(inputs['cycle']['cycle_id'], inputs=inputs)
+    model.add_constraints()
+    model.add_preferences()
+    return model_size(model.model) + solve_and_measure(model.model, time_limit)
+
+
+def bench_second_stage(inputs, first_stage, encoding, time_limit):
+    test_plup.add_tiered_deviation_penalty = ENCODINGS[encoding]
+    solver = test_plup.ShiftAssignmentSolver(
+        first_stage['schedule'],
+        inputs['shift_requirements'],
+        inputs['offdays'],
+        inputs['shift_group'],
+        dates=first_stage['dates']
+    )
+    solver.add_constraints()
+    solver.add_soft_constraints()
+    return model_size(solver.model) + solve_and_measure(solver.model, time_limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='班別天數偏差懲罰寫法效能比較')
+    parser.add_argument('--employees', type=int, nargs='+', default=[8, 16])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seeds', type=int, default=2)
+    parser.add_argument('--time-limit', type=float, default=30)
+    args = parser.parse_args()
+
+    print(f"{'engine':<8} {'E':>4} {'seed':>4} {'encoding':<8} {'vars':>7} {'cons':>7} {'status':<10} {'obj':>7} {'time(s)':>8}")
+    for employees in args.employees:
+        for seed in range(args.seeds):
+            inputs = make_cycle_inputs(employees=employees, days=args.days, seed=seed)
+            with contextlib.redirect_stdout(io.StringIO()):
+                planner = test_plup.OffdayPlanner(cycle_id=0, inputs=inputs)
+                first_stage = planner.run(time_limit=args.time_limit)
+            rows = []
+            for encoding in ENCODINGS:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    rows.append(('cpmodel', encoding) + bench_cpmodel(inputs, encoding, args.time_limit))
+                    if first_stage['status'] == 'success':
+                        rows.append(('stage2', encoding) +
+                                    bench_second_stage(inputs, first_stage, encoding, args.time_limit))
+            for engine, encoding, n_vars, n_cons, status, objective, elapsed in sorted(rows):
+                objective = '-' if objective is None else f'{objective:.0f}'
+                print(f"{engine:<8} {employees:>4} {seed:>4} {encoding:<8} {n_vars:>7} {n_cons:>7} "
+                      f"{status:<10} {objective:>7} {elapsed:>8.2f}")
+    cpmodel_2025.add_tiered_deviation_penalty = add_tiered_deviation_penalty
+    test_plup.add_tiered_deviation_penalty = add_tiered_deviation_penalty
+
+
+if __name__ == '__main__':
+    main()
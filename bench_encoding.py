@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+bench_encoding.py
+
+比較班別銜接（11 小時休息）與連續上班限制的兩種寫法：
+- pairwise  : 逐對約束 (C→A、C→B、B→A) 與 7 天滑動視窗
+- automaton : 每位員工一條 AddAutomaton（cp_utils.sequence_automaton）
+
+在不同人數與週期長度（月、季）的合成週期上分別建立第一階段 OffdayPlanner、
+第二階段 ShiftAssignmentSolver 與 CPMODEL，輸出變數數、約束數、求解狀態、目標值與求解時間，
+並以 verify_shift_violations 檢查結果。
+
+用法：
+    python bench_encoding.py --employees 8 16 32 --days 30 91 --time-limit 30
+"""
+
+import io
+import time
+import argparse
+import contextlib
+from datetime import date, timedelta
+
+from ortools.sat.python import cp_model
+
+from cp_utils import ENCODINGS
+from cpmodel_2025 import CPMODEL
+from test_plup import OffdayPlanner, ShiftAssignmentSolver, shift_group_demand
+from synthetic_instances import make_cycle_inputs
+from verify_shift import verify_shift_violations
+
+
+def model_size(model):
+    proto = model.Proto()
+    return len(proto.variables), len(proto.constraints)
+
+
+def solve_and_measure(model, time_limit):
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    started = time.time()
+    status = solver.Solve(model)
+    return solver, status, time.time() - started
+
+
+def bench_stages(inputs, encoding, time_limit):
+    """回傳第一階段與第二階段的量測結果"""
+    rows = []
+    planner = OffdayPlanner(cycle_id=0, inputs=inputs, encoding=encoding)
+    planner.build_model()
+    solver, status, elapsed = solve_and_measure(planner.model, time_limit)
+    rows.append(('stage1',) + model_size(planner.model) + (solver, status, elapsed, None))
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return rows
+
+    first_stage = planner.format_result(solver, status)
+    shift_solver = ShiftAssignmentSolver(
+        first_stage['schedule'], inputs['shift_requirements'], inputs['offdays'], inputs['shift_group'],
+        dates=first_stage['dates'], encoding=encoding
+    )
+    shift_solver.add_constraints()
+    shift_solver.add_soft_constraints()
+    solver, status, elapsed = solve_and_measure(shift_solver.model, time_limit)
+    schedule = shift_solver.get_result(solver, status) if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None
+    rows.append(('stage2',) + model_size(shift_solver.model) + (solver, status, elapsed, schedule))
+    return rows
+
+
+def bench_cpmodel(inputs, encoding, time_limit):
+    model = CPMODEL(0, inputs=inputs, encoding=encoding)
+    model.add_constraints()
+    model.add_preferences()
+    solver, status, elapsed = solve_and_measure(model.model, time_limit)
+    schedule = None
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        schedule = model.print_results(solver, status)['schedules']
+    return [('cpmodel',) + model_size(model.model) + (solver, status, elapsed, schedule)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='班別銜接與連續上班限制寫法效能比較')
+    parser.add_argument('--employees', type=int, nargs='+', default=[8, 16, 32])
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 91])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--time-limit', type=float, default=30)
+    args = parser.parse_args()
+
+    print(f"{'engine':<8} {'E':>4} {'D':>4} {'encoding':<10} {'vars':>7} {'cons':>7} "
+          f"{'status':<10} {'obj':>7} {'time(s)':>8} {'verified':>8}")
+    for days in args.days:
+        for employees in args.employees:
+            inputs = make_cycle_inputs(employees=employees, days=days, seed=args.seed)
+            start = date.fromisoformat(inputs['cycle']['start_date'])
+            dates = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+            demand = shift_group_demand(inputs['shift_group'])
+            for encoding in ENCODINGS:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    rows = bench_stages(inputs, encoding, args.time_limit)
+                    rows += bench_cpmodel(inputs, encoding, args.time_limit)
+                for engine, n_vars, n_cons, solver, status, elapsed, schedule in rows:
+                    solved = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+                    objective = f'{solver.ObjectiveValue():.0f}' if solved else '-'
+                    verified = '-'
+                    if schedule:
+                        # 只檢查班別銜接與連續上班，人數不足屬軟限制不列入
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            _, violations = verify_shift_violations(schedule, dates, demand)
+                        verified = 'yes' if not [v for v in violations if v['rule'] != 'daily_staffing'] else 'no'
+                    print(f"{engine:<8} {employees:>4} {days:>4} {encoding:<10} {n_vars:>7} {n_cons:>7} "
+                          f"{solver.StatusName(status):<10} {objective:>7} {elapsed:>8.2f} {verified:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+cp_utils.py
+
+CP-SAT 建模共用工具，供 cpmodel_2025 (CPMODEL) 與 test_plup (兩階段排班) 共用。
+"""
+
+from ortools.sat.python import cp_model
+
+# 班別天數與需求相差 0/1/2/3 天時的懲罰分數
+DEVIATION_PENALTIES = (0, 15, 30, 50)
+
+
+def penalty_segments(penalties=DEVIATION_PENALTIES):
+    """
+    分段懲罰為凸函數時，回傳每一段的線性下界 [(k, slope, penalties[k])]：
+    懲罰 >= slope * (偏差 - k) + penalties[k]，斜率相同的相鄰段只保留一段；非凸時回傳空清單
+    """
+    slopes = [penalties[k + 1] - penalties[k] for k in range(len(penalties) - 1)]
+    if slopes != sorted(slopes):
+        return []
+    return [(k, slope, penalties[k]) for k, slope in enumerate(slopes) if k == 0 or slope != slopes[k - 1]]
+
+
+def deviation_penalty(deviation, penalties=DEVIATION_PENALTIES):
+    """
+    偏差天數對應的懲罰分數（與 add_tiered_deviation_penalty 相同），用於在模型外為班表計分；
+    超過上限的偏差以最後一段的斜率外插
+    """
+    deviation = abs(int(deviation))
+    max_deviation = len(penalties) - 1
+    if deviation <= max_deviation:
+        return penalties[deviation]
+    return penalties[-1] + (deviation - max_deviation) * (penalties[-1] - penalties[-2])
+
+
+def add_tiered_deviation_penalty(model, total, required, name, penalties=DEVIATION_PENALTIES):
+    """
+    以單一偏差變數表示「實際天數與需求天數相差幾天」，再用 element 約束查表得到懲罰分數。
+    偏差上限為 len(penalties) - 1 天（預設 3 天），超過即不可行。
+
+    @param model: cp_model.CpModel
+    @param total: 線性運算式, 實際天數（如 sum(x[e, d, s])）
+    @param required: int, 需求天數
+    @param name: str, 變數名稱前綴
+    @param penalties: tuple, 偏差 0, 1, 2... 天對應的懲罰分數
+    @return: IntVar, 懲罰分數（直接加入目標函數）
+    """
+    max_deviation = len(penalties) - 1
+    diff = model.NewIntVar(-max_deviation, max_deviation, f'{name}_diff')
+    model.Add(diff == total - required)
+    deviation = model.NewIntVar(0, max_deviation, f'{name}_dev')
+    model.AddAbsEquality(deviation, diff)
+    penalty = model.NewIntVarFromDomain(cp_model.Domain.FromValues(list(penalties)), f'{name}_penalty')
+    model.AddElement(deviation, list(penalties), penalty)
+    # 懲罰分數為凸函數時，另加入每一段的線性下界（冗餘約束），讓 LP 鬆弛也能看到懲罰，加快證明最佳解
+    for k, slope, base in penalty_segments(penalties):
+        model.Add(penalty >= slope * (diff - k) + base)
+        model.Add(penalty >= slope * (-diff - k) + base)
+    return penalty
+
+
+# ===================== 班別序列自動機 =====================
+
+# 班別整數代碼（AddAutomaton 的標籤）
+SHIFT_LABELS = {'O': 0, 'A': 1, 'B': 2, 'C': 3}
+# 班與班之間需休息超過 11 小時：C 後不可接 A/B，B 後不可接 A
+FORBIDDEN_TRANSITIONS = (('C', 'A'), ('C', 'B'), ('B', 'A'))
+# 班別限制的寫法：pairwise 為逐對/滑動視窗約束，automaton 為每位員工一條 AddAutomaton
+ENCODINGS = ('pairwise', 'automaton')
+
+
+def check_encoding(encoding):
+    if encoding not in ENCODINGS:
+        raise ValueError(f"未知的限制寫法 encoding={encoding}，可用：{', '.join(ENCODINGS)}")
+    return encoding
+
+
+def sequence_automaton(labels=SHIFT_LABELS, forbidden=FORBIDDEN_TRANSITIONS, max_run=None, rest='O'):
+    """
+    將「相鄰兩天禁止的班別銜接」與「最多連續上班 max_run 天」編譯成一個確定性自動機。
+    狀態為 (前一天班別, 目前連續上班天數)，只產生由起始狀態可到達的狀態。
+
+    @param labels: dict, {班別: 整數標籤}
+    @param forbidden: iterable, 禁止的 (前一天, 後一天) 班別組合
+    @param max_run: int, 最多連續上班天數；None 表示不限制
+    @param rest: str, 代表休息的班別
+    @return: tuple, (起始狀態, 終止狀態清單, 轉移清單 [(狀態, 標籤, 下一狀態), ...])
+    """
+    forbidden = set(forbidden)
+    start = (rest, 0)
+    state_ids = {start: 0}
+    transitions = []
+    queue = [start]
+    while queue:
+        state = queue.pop()
+        last, run = state
+        for shift, label in labels.items():
+            if (last, shift) in forbidden:
+                continue
+            next_run = 0 if shift == rest else run + 1
+            if max_run is not None and next_run > max_run:
+                continue
+            # 不限制連續天數時只需記住前一天班別
+            next_state = (shift, next_run if max_run is not None else 0)
+            if next_state not in state_ids:
+                state_ids[next_state] = len(state_ids)
+                queue.append(next_state)
+            transitions.append((state_ids[state], label, state_ids[next_state]))
+    return 0, list(state_ids.values()), transitions
+
+
+def add_sequence_automaton(model, variables, **kwargs):
+    """
+    對一位員工的每日班別變數加入一條 AddAutomaton
+    @param model: cp_model.CpModel
+    @param variables: list, 每日班別整數變數（標籤同 labels）
+    @param kwargs: 傳給 sequence_automaton 的參數
+    """
+    start, finals, transitions = sequence_automaton(**kwargs)
+    return model.AddAutomaton(variables, start, finals, transitions)
+
+
+# ===================== 對稱性破除 =====================
+
+def symmetry_groups(signatures):
+    """
+    將輸入完全相同（可互換）的員工分組
+    @param signatures: dict, {員工: 可比較相等的特徵（需求、偏好、休假...）}
+    @return: list, 每組至少兩人的員工清單，組內依原本順序排列
+    """
+    groups = {}
+    for name, signature in signatures.items():
+        groups.setdefault(repr(signature), []).append(name)
+    return [names for names in groups.values() if len(names) > 1]
+
+
+def add_lex_greater_equal(model, row_a, row_b, name):
+    """
+    限制 row_a 在字典序上大於等於 row_b。
+    eq_k 表示前 k+1 天兩列相同；前綴相同時下一天 row_a 不可小於 row_b，前綴相同但當天不同時需嚴格大於。
+
+    @param model: cp_model.CpModel
+    @param row_a: list, 整數變數或線性運算式（如每日是否上班、每日班別代碼）
+    @param row_b: list, 與 row_a 等長
+    @param name: str, 變數名稱前綴
+    """
+    prev = []
+    for k, (a, b) in enumerate(zip(row_a, row_b)):
+        model.Add(a >= b).OnlyEnforceIf(prev)
+        if k == len(row_a) - 1:
+            break
+        eq = model.NewBoolVar(f'{name}_eq_{k}')
+        model.Add(a == b).OnlyEnforceIf(eq)
+        model.Add(a >= b + 1).OnlyEnforceIf(prev + [eq.Not()])
+        if prev:
+            model.AddImplication(eq, prev[0])
+        prev = [eq]
+
+
+def add_lex_chain(model, rows, name):
+    """
+    對一組可互換員工的每日變數加入字典序遞減鏈 rows[0] >= rows[1] >= ...，
+    只保留組內排列的其中一種，縮小搜尋空間
+    @param rows: list, 每位員工一列，各列等長
+    """
+    for i in range(len(rows) - 1):
+        add_lex_greater_equal(model, rows[i], rows[i + 1], f'{name}_{i}')
+
@@ -1,5 +1,7 @@
+import numpy as np
 from ortools.sat.python import cp_model
 import calendar,json
+import time
 from datetime import datetime, timedelta
 from supabase_client import (
     fetch_employees,
@@ -8,29 +10,64 @@ from supabase_client import (
     fetch_temp_offdays,
     fetch_schedule_cycle
 )
+from test_plup import shift_group_demand
+from cp_utils import add_tiered_deviation_penalty, add_sequence_automaton, check_encoding, SHIFT_LABELS
+from feasibility import analyze_feasibility
+from schedule_index import bool_var_array, var_indices, solution_values
+from solver_presets import configure_solver
+
+# explain=True 時未加 assumption 的硬限制；衝突核心為空時即由這些限制造成
+UNGUARDED_CONSTRAINTS = (
+    "每人每天僅上一班",
+    "各班別天數與需求最多相差 3 天",
+    "自動機寫法（encoding='automaton'）的班別銜接與連續上班限制",
+)
 
 
 class CPMODEL:
-    def __init__(self, cycle_id):
+    def __init__(self, cycle_id, inputs=None, encoding='pairwise', explain=False, preset=None):
+        """
+        @param cycle_id: 週期 ID
+        @param inputs: dict, 預先取得的輸入資料（格式同 supabase_client.fetch_cycle_inputs），
+                       未提供時由 Supabase 查詢
+        @param encoding: str, 'pairwise' 以逐對約束與 7 天滑動視窗限制班別銜接與連續上班；
+                         'automaton' 改為每位員工一條 AddAutomaton
+        @param explain: bool, 每條硬限制加上 enforcement literal 並設為 assumption，
+                        無解時可由 explain_infeasibility 找出互相衝突的限制。
+                        AddAutomaton 不支援 enforcement literal，explain=True 時一律使用 pairwise
+        @param preset: str, 求解參數預設組名稱（見 solver_presets.py）
+        """
         # 建立模型
         self.model = cp_model.CpModel()
         self.cycle_id = cycle_id
+        self.encoding = 'pairwise' if explain else check_encoding(encoding)
+        self.explain = explain
+        self.preset = preset
+        # assumption literal 與其對應的限制說明 {literal index: {'rule', 'employee', 'date', ...}}
+        self.assumption_literals = []
+        self.assumption_info = {}
         # 取得週期資訊
-        cycle_info = fetch_schedule_cycle(cycle_id)
+        cycle_info = inputs['cycle'] if inputs else fetch_schedule_cycle(cycle_id)
         if not cycle_info:
             raise ValueError(f"找不到 cycle_id={cycle_id} 的週期資料")
-        self.start_date = datetime.fromisoformat(cycle_info['start_date']).date()
-        self.end_date = datetime.fromisoformat(cycle_info['end_date']).date()
+        self.start_date = datetime.fromisoformat(str(cycle_info['start_date'])).date()
+        self.end_date = datetime.fromisoformat(str(cycle_info['end_date'])).date()
         self.days = (self.end_date - self.start_date).days + 1
         # 取得所有日期清單
         self.date_list = [self.start_date + timedelta(days=i) for i in range(self.days)]
         # 判斷每一天是否為工作日
         self.workdays = [d for d in self.date_list if (d.weekday() < 5)]
         # 從 Supabase 獲取資料
-        self.employees_data = fetch_employees()
-        self.shift_requirements_data = fetch_shift_requirements(cycle_id)
-        self.employee_preferences_data = fetch_employee_preferences()
-        self.offdays_data = fetch_temp_offdays(cycle_id)
+        if inputs:
+            self.employees_data = inputs['employees']
+            self.shift_requirements_data = inputs['shift_requirements']
+            self.employee_preferences_data = inputs['preferences']
+            self.offdays_data = inputs['offdays']
+        else:
+            self.employees_data = fetch_employees()
+            self.shift_requirements_data = fetch_shift_requirements(cycle_id)
+            self.employee_preferences_data = fetch_employee_preferences()
+            self.offdays_data = fetch_temp_offdays(cycle_id)
         # 從本地抓取資料
         # self.employees_data = json.load(open('simulate_employees.json'))
         # self.shift_requirements_data = json.load(open('simulate_shiftrequirements.json'))
@@ -40,6 +77,9 @@ class CPMODEL:
         self.employees = [emp['name'] for emp in self.employees_data]
         self.shifts = ['A', 'B', 'C', 'O']  # A: 白班, B: 小夜班, C: 大夜班, O:休息
         self.shift_hours = {'A': (8,16), 'B': (16,24), 'C': (0,8), 'O': (0,0)}
+        # 班別在決策變數第三維的位置
+        self.shift_idx = {s: k for k, s in enumerate(self.shifts)}
+        self.O = self.shift_idx['O']
 
         # 2024年3月
         #self.year, self.month = 2024, 3
@@ -51,176 +91,265 @@ class CPMODEL:
         # 從 Supabase 獲取員工偏好設定
         #self.employee_preferences = self.employee_preferences_data
 
-        # 每日所需班次
+        # 每日所需班次（有班別群組資料時依群組設定，否則使用預設需求）
+        shift_group = shift_group_demand(inputs['shift_group']) if inputs and inputs.get('shift_group') else None
         self.daily_requirements = {}
         for idx, day in enumerate(self.date_list, 1):
             weekday = day.weekday()
-            if weekday == 5:  # 週六
+            if shift_group is not None:
+                self.daily_requirements[idx] = {s: shift_group.get(weekday, {}).get(s, 0) for s in ['A', 'B', 'C']}
+            elif weekday == 5:  # 週六
                 self.daily_requirements[idx] = {'A':2, 'B':1, 'C':1}
             elif weekday == 6:  # 週日
                 self.daily_requirements[idx] = {'A':1, 'B':1, 'C':1}
             else:
                 self.daily_requirements[idx] = {'A':3, 'B':2, 'C':1}
-        # 建立決策變數
-        self.shifts_var = {}
-        for e in self.employees:
-            for d in range(1, self.days+1):
-                for s in self.shifts:
-                    self.shifts_var[(e,d,s)] = self.model.NewBoolVar(f'{e}_{d}_{s}')
+        # 每日各班別需求矩陣 (天數 x 3)
+        self.demand = np.array([[self.daily_requirements[d][s] for s in ['A', 'B', 'C']]
+                                for d in range(1, self.days+1)], dtype=np.int64)
+        # 建立決策變數：x[員工索引, 日索引(0 起算), 班別索引]
+        self.x = bool_var_array(self.model, (len(self.employees), self.days, len(self.shifts)), 'x')
+        self.x_index = var_indices(self.x)
+
+    def guard(self, rule, **info):
+        """
+        explain=True 時為一條（或一組）硬限制建立 enforcement literal，回傳傳給 OnlyEnforceIf 的清單；
+        explain=False 時回傳空清單（限制照常強制成立）
+        @param rule: str, 限制類別（daily_demand, offday, rest_window, shift_connection, required_days）
+        @param info: 對應的員工、日期、班別等資訊
+        """
+        if not self.explain:
+            return []
+        literal = self.model.NewBoolVar(f'assume_{rule}_{len(self.assumption_literals)}')
+        self.assumption_literals.append(literal)
+        self.assumption_info[literal.Index()] = {'rule': rule, **info}
+        return [literal]
 
     def add_constraints(self):
+        x, O, Sum = self.x, self.O, cp_model.LinearExpr.Sum
         # 限制：每天每班人數需求
-        for d in range(1, self.days+1):
-            for s in ['A', 'B', 'C']:
-                self.model.Add(
-                    sum(self.shifts_var[(e,d,s)] for e in self.employees) == self.daily_requirements[d][s]
-                )
+        for d in range(self.days):
+            for k, s in enumerate(['A', 'B', 'C']):
+                required = int(self.demand[d, k])
+                self.model.Add(Sum(x[:, d, k].tolist()) == required).OnlyEnforceIf(
+                    self.guard('daily_demand', date=str(self.date_list[d]), shift=s, required=required))
 
         # 限制：每人每天僅上一班
-        for e in self.employees:
-            for d in range(1, self.days+1):
-                self.model.Add(sum(self.shifts_var[(e,d,s)] for s in self.shifts) == 1)
+        for e in range(len(self.employees)):
+            for d in range(self.days):
+                self.model.AddExactlyOne(x[e, d].tolist())
 
         # 限制：每位員工各班次指定天數
-        for e in self.employees:
-            if e in self.shift_requirements_data:
-                for s in ['A','B','C']:
-                    self.model.Add(
-                        sum(self.shifts_var[(e,d,s)] for d in range(1,self.days+1)) == self.shift_requirements_data[e][s]
-                    )
-
-        # 限制：班與班之間必須休息超過11小時
-        for e in self.employees:
-            for d in range(1, self.days):
-                self.model.Add(self.shifts_var[(e,d,'C')] + self.shifts_var[(e,d+1,'A')] <= 1)
-                self.model.Add(self.shifts_var[(e,d,'C')] + self.shifts_var[(e,d+1,'B')] <= 1)
-                self.model.Add(self.shifts_var[(e,d,'B')] + self.shifts_var[(e,d+1,'A')] <= 1)
-
-        # 限制：7天內休息至少1天
-        for e in self.employees:
-            for start in range(1, self.days-6):
-                self.model.Add(sum(self.shifts_var[(e,d,'O')] for d in range(start, start+7)) >= 1)
+        for e, name in enumerate(self.employees):
+            if name in self.shift_requirements_data:
+                for k, s in enumerate(['A', 'B', 'C']):
+                    required = self.shift_requirements_data[name][s]
+                    self.model.Add(Sum(x[e, :, k].tolist()) == required).OnlyEnforceIf(
+                        self.guard('required_days', employee=name, shift=s, required=required))
+
+        A, B, C = (self.shift_idx[s] for s in ['A', 'B', 'C'])
+        if self.encoding == 'automaton':
+            # 限制：班與班之間必須休息超過11小時 + 7天內休息至少1天（最多連續上班6天），合併為一個自動機
+            # 班別變數以 OnlyEnforceIf 由布林變數導出（線性加權和的傳遞效果較差）
+            labels = [SHIFT_LABELS[s] for s in self.shifts]
+            for e, name in enumerate(self.employees):
+                day_shifts = []
+                for d in range(self.days):
+                    shift_var = self.model.NewIntVar(0, 3, f'{name}_{d+1}_shift')
+                    for k, label in enumerate(labels):
+                        self.model.Add(shift_var == label).OnlyEnforceIf(x[e, d, k])
+                    day_shifts.append(shift_var)
+                add_sequence_automaton(self.model, day_shifts, max_run=6)
+        else:
+            # 限制：班與班之間必須休息超過11小時
+            for e, name in enumerate(self.employees):
+                connection = self.guard('shift_connection', employee=name)
+                for d in range(self.days - 1):
+                    self.model.Add(x[e, d, C] + x[e, d+1, A] <= 1).OnlyEnforceIf(connection)
+                    self.model.Add(x[e, d, C] + x[e, d+1, B] <= 1).OnlyEnforceIf(connection)
+                    self.model.Add(x[e, d, B] + x[e, d+1, A] <= 1).OnlyEnforceIf(connection)
+
+            # 限制：7天內休息至少1天
+            for e, name in enumerate(self.employees):
+                for start in range(self.days - 7):
+                    self.model.Add(Sum(x[e, start:start+7, O].tolist()) >= 1).OnlyEnforceIf(
+                        self.guard('rest_window', employee=name, start=str(self.date_list[start]),
+                                   end=str(self.date_list[start+6]), rest=1))
 
         # 限制：14天內休息至少兩天
-        for e in self.employees:
-            for start in range(1, self.days-13):
-                self.model.Add(sum(self.shifts_var[(e,d,'O')] for d in range(start, start+14)) >= 2)
+        for e, name in enumerate(self.employees):
+            for start in range(self.days - 14):
+                self.model.Add(Sum(x[e, start:start+14, O].tolist()) >= 2).OnlyEnforceIf(
+                    self.guard('rest_window', employee=name, start=str(self.date_list[start]),
+                               end=str(self.date_list[start+13]), rest=2))
 
         # 新增：員工預先選定的休假日期（紅O/特休為硬性休假）
-        for e in self.employees:
-            offdays = self.offdays_data.get(e, [])
-            for off in offdays:
-                day_idx = (off['date'] - self.start_date).days + 1
-                if 1 <= day_idx <= self.days:
-                    if off['type'] in ['紅O', '特休']:
-                        # 硬性限制：必須休假
-                        self.model.Add(self.shifts_var[(e, day_idx, 'O')] == 1)
-                    # 藍O 於 add_preferences 處理
+        for e, name in enumerate(self.employees):
+            for off in self.offdays_data.get(name, []):
+                d = (off['date'] - self.start_date).days
+                if 0 <= d < self.days and off['type'] in ['紅O', '特休']:
+                    # 硬性限制：必須休假
+                    self.model.Add(x[e, d, O] == 1).OnlyEnforceIf(
+                        self.guard('offday', employee=name, date=str(off['date']), type=off['type']))
+                # 藍O 於 add_preferences 處理
 
     def add_preferences(self):
+        x, O, Sum = self.x, self.O, cp_model.LinearExpr.Sum
+        C = self.shift_idx['C']
         # 偏好設定 (軟性限制)
         self.penalties = []
 
         # 調整：每位員工各班次指定天數（允許正負1~3天但有懲罰分數，0天嚴格禁止）
-        for e in self.employees:
-            if e in self.shift_requirements_data:
-                for s in ['A','B','C']:
-                    required = self.shift_requirements_data[e][s]
-                    total = sum(self.shifts_var[(e,d,s)] for d in range(1,self.days+1))
+        for e, name in enumerate(self.employees):
+            if name in self.shift_requirements_data:
+                for k, s in enumerate(['A', 'B', 'C']):
+                    required = self.shift_requirements_data[name][s]
+                    total = Sum(x[e, :, k].tolist())
                     if required == 0:
                         # 嚴格禁止此班別
-                        self.model.Add(total == 0)
+                        self.model.Add(total == 0).OnlyEnforceIf(self.guard('required_days', employee=name, shift=s,
+                                                                            required=0))
                     else:
-                        # 允許正負1~3天但有懲罰
-                        diff = self.model.NewIntVar(-self.days, self.days, f'{e}_{s}_diff')
-                        self.model.Add(diff == total - required)
-                        # 懲罰正負1天
-                        penalty1 = self.model.NewBoolVar(f'{e}_{s}_penalty1')
-                        self.model.AddAbsEquality(penalty1, diff)
-                        self.model.Add(penalty1 == 1).OnlyEnforceIf(penalty1)
-                        self.model.Add(penalty1 != 1).OnlyEnforceIf(penalty1.Not())
-                        self.penalties.append((penalty1, 15))
-                        # 懲罰正負2天
-                        penalty2 = self.model.NewBoolVar(f'{e}_{s}_penalty2')
-                        self.model.AddAbsEquality(penalty2, diff)
-                        self.model.Add(penalty2 == 2).OnlyEnforceIf(penalty2)
-                        self.model.Add(penalty2 != 2).OnlyEnforceIf(penalty2.Not())
-                        self.penalties.append((penalty2, 30))
-                        # 懲罰正負3天
-                        penalty3 = self.model.NewBoolVar(f'{e}_{s}_penalty3')
-                        self.model.AddAbsEquality(penalty3, diff)
-                        self.model.Add(penalty3 == 3).OnlyEnforceIf(penalty3)
-                        self.model.Add(penalty3 != 3).OnlyEnforceIf(penalty3.Not())
-                        self.penalties.append((penalty3, 50))
+                        # 允許正負1~3天但有懲罰（15/30/50）
+                        penalty = add_tiered_deviation_penalty(self.model, total, required, f'{name}_{s}')
+                        self.penalties.append((penalty, 1))
 
         # 1️⃣ 偏好不連續上班超過5天
-        for e in self.employees:
-            if self.employee_preferences_data[e]['max_continuous_days']:
-                for start in range(1, self.days - 5):
-                    work_7days = self.model.NewBoolVar(f'{e}_work7_{start}')
-                    self.model.Add(sum(self.shifts_var[e, d, 'O'] for d in range(start, start + 6)) == 0).OnlyEnforceIf(work_7days)
-                    self.model.Add(sum(self.shifts_var[e, d, 'O'] for d in range(start, start + 6)) > 0).OnlyEnforceIf(work_7days.Not())
+        for e, name in enumerate(self.employees):
+            if self.employee_preferences_data[name]['max_continuous_days']:
+                for start in range(self.days - 6):
+                    work_7days = self.model.NewBoolVar(f'{name}_work7_{start+1}')
+                    rest = Sum(x[e, start:start+6, O].tolist())
+                    self.model.Add(rest == 0).OnlyEnforceIf(work_7days)
+                    self.model.Add(rest > 0).OnlyEnforceIf(work_7days.Not())
                     self.penalties.append((work_7days, 10))
 
         # 2️⃣ 偏好C班盡量連續排
-        for e in self.employees:
-            if self.employee_preferences_data[e]['continuous_C']:
-                for d in range(1, self.days - 1):
-                    interrupted_C = self.model.NewBoolVar(f'{e}_interrupted_C_{d}')
-                    self.model.AddBoolAnd([
-                        self.shifts_var[e, d, 'C'],
-                        self.shifts_var[e, d + 1, 'O'],
-                        self.shifts_var[e, d + 2, 'C']
-                    ]).OnlyEnforceIf(interrupted_C)
+        for e, name in enumerate(self.employees):
+            if self.employee_preferences_data[name]['continuous_C']:
+                for d in range(self.days - 2):
+                    interrupted_C = self.model.NewBoolVar(f'{name}_interrupted_C_{d+1}')
+                    self.model.AddBoolAnd([x[e, d, C], x[e, d+1, O], x[e, d+2, C]]).OnlyEnforceIf(interrupted_C)
                     self.model.AddBoolOr([
-                        self.shifts_var[e, d, 'C'].Not(),
-                        self.shifts_var[e, d + 1, 'O'].Not(),
-                        self.shifts_var[e, d + 2, 'C'].Not()
+                        x[e, d, C].Not(), x[e, d+1, O].Not(), x[e, d+2, C].Not()
                     ]).OnlyEnforceIf(interrupted_C.Not())
                     self.penalties.append((interrupted_C, 10))
 
         # 3️⃣ 大夜後偏好連續休兩天
-        for e in self.employees:
-            if self.employee_preferences_data[e]['double_off_after_C']:
-                for d in range(1, self.days - 2):
-                    prefer_double_off = self.model.NewBoolVar(f'{e}_double_off_after_C_{d}')
+        for e, name in enumerate(self.employees):
+            if self.employee_preferences_data[name]['double_off_after_C']:
+                for d in range(self.days - 3):
+                    prefer_double_off = self.model.NewBoolVar(f'{name}_double_off_after_C_{d+1}')
                     # 違反條件：(C->O->非O)，這種情況為違反雙休
-                    self.model.AddBoolAnd([
-                        self.shifts_var[e, d, 'C'],
-                        self.shifts_var[e, d + 1, 'O'],
-                        self.shifts_var[e, d + 2, 'O'].Not()
-                    ]).OnlyEnforceIf(prefer_double_off)
+                    self.model.AddBoolAnd([x[e, d, C], x[e, d+1, O], x[e, d+2, O].Not()]).OnlyEnforceIf(prefer_double_off)
                     self.model.AddBoolOr([
-                        self.shifts_var[e, d, 'C'].Not(),
-                        self.shifts_var[e, d + 1, 'O'].Not(),
-                        self.shifts_var[e, d + 2, 'O']
+                        x[e, d, C].Not(), x[e, d+1, O].Not(), x[e, d+2, O]
                     ]).OnlyEnforceIf(prefer_double_off.Not())
                     self.penalties.append((prefer_double_off, 10))
 
         # 新增：藍O為軟性偏好
-        for e in self.employees:
-            offdays = self.offdays_data.get(e, [])
-            for off in offdays:
-                day_idx = (off['date'] - self.start_date).days + 1
-                if 1 <= day_idx <= self.days:
-                    if off['type'] == '藍O':
-                        prefer_blue_off = self.model.NewBoolVar(f'{e}_blueO_{day_idx}')
-                        self.model.Add(self.shifts_var[(e, day_idx, 'O')] == 0).OnlyEnforceIf(prefer_blue_off)
-                        self.model.Add(self.shifts_var[(e, day_idx, 'O')] == 1).OnlyEnforceIf(prefer_blue_off.Not())
-                        self.penalties.append((prefer_blue_off, 5))
+        for e, name in enumerate(self.employees):
+            for off in self.offdays_data.get(name, []):
+                d = (off['date'] - self.start_date).days
+                if 0 <= d < self.days and off['type'] == '藍O':
+                    prefer_blue_off = self.model.NewBoolVar(f'{name}_blueO_{d+1}')
+                    self.model.Add(x[e, d, O] == 0).OnlyEnforceIf(prefer_blue_off)
+                    self.model.Add(x[e, d, O] == 1).OnlyEnforceIf(prefer_blue_off.Not())
+                    self.penalties.append((prefer_blue_off, 5))
 
         # 目標函數：最小化總懲罰
-        self.model.Minimize(sum(var * weight for var, weight in self.penalties))
-
-    def solve(self):
-        solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 300
-        solver.parameters.enumerate_all_solutions = True
+        self.penalty_index = var_indices([var for var, _ in self.penalties])
+        self.penalty_weights = np.array([weight for _, weight in self.penalties], dtype=np.int64)
+        self.model.Minimize(cp_model.LinearExpr.WeightedSum(
+            [var for var, _ in self.penalties], self.penalty_weights.tolist()))
+
+    def solve(self, time_limit=None, num_workers=None):
+        solver = configure_solver(cp_model.CpSolver(), 'cpmodel', self.preset, time_limit, num_workers)
+        if self.explain:
+            self.model.ClearAssumptions()
+            self.model.AddAssumptions(self.assumption_literals)
         status = solver.Solve(self.model)
         print(cp_model.FEASIBLE,cp_model.OPTIMAL)
         print(status)
         return solver, status
 
+    def roster_of(self, values):
+        """
+        @param values: 完整解的變數值（CpSolverResponse.solution 或 additional_solutions[i].values）
+        @return: (np.ndarray 員工 x 天數的班別索引矩陣, int 總懲罰分數)
+        """
+        values = np.asarray(values, dtype=np.int64)
+        return values[self.x_index].argmax(axis=2), int(values[self.penalty_index] @ self.penalty_weights)
+
+    def solve_top_k(self, k=3, time_limit=300, num_workers=None, min_distance=1, pool_size=None):
+        """
+        一次求解取得 k 個懲罰分數最低且彼此不同的班表，供主管挑選：
+        1. 求解時開啟 solution pool，並以 RosterCollector 收集每個更佳的中間解
+        2. 依懲罰分數由低到高挑選，與已選班表的 Hamming 距離（班別不同的格子數）皆需 >= min_distance
+        3. 不足 k 個時，在剩餘時間內於模型副本加入 no-good cut 排除已選班表後補解（原模型不變）
+        @param k: int, 班表數量
+        @param time_limit: float, 整體求解時間上限（秒）
+        @param num_workers: int, 求解執行緒數（可選）
+        @param min_distance: int, 任兩個班表至少相差的格子數
+        @param pool_size: int, solution pool 大小，預設 4 * k
+        @return: dict, {'status', 'solutions': [{'rank', 'penalty', 'schedules', 'distances'}], 'message'}
+        """
+        started = time.time()
+        solver = configure_solver(cp_model.CpSolver(), 'cpmodel', self.preset, time_limit, num_workers)
+        solver.parameters.solution_pool_size = pool_size or 4 * k
+        solver.parameters.fill_additional_solutions_in_response = True
+        if self.explain:
+            self.model.ClearAssumptions()
+            self.model.AddAssumptions(self.assumption_literals)
+        collector = RosterCollector(self)
+        status = solver.Solve(self.model, collector)
+        if status not in [cp_model.FEASIBLE, cp_model.OPTIMAL]:
+            return {'status': 'error', 'solutions': [], 'message': f"找不到可行解（{solver.StatusName(status)}）"}
+
+        candidates = dict(collector.rosters)
+        for solution in solver.ResponseProto().additional_solutions:
+            roster, penalty = self.roster_of(solution.values)
+            candidates.setdefault(roster.tobytes(), (penalty, roster))
+        selected = select_diverse(candidates.values(), k, min_distance)
+
+        if len(selected) < k:
+            # 模型副本中的變數索引與原模型相同
+            extra = self.model.Clone()
+            x = np.vectorize(extra.GetBoolVarFromProtoIndex, otypes=[object])(self.x_index)
+            cells = len(self.employees) * self.days
+            cut = 0
+            while len(selected) < k:
+                remaining = time_limit - (time.time() - started)
+                if remaining < 1:
+                    break
+                # no-good cut：與每個已選班表相同的格子數不得超過 cells - min_distance
+                for _, roster in selected[cut:]:
+                    chosen = np.take_along_axis(x, roster[:, :, None], axis=2).ravel().tolist()
+                    extra.Add(cp_model.LinearExpr.Sum(chosen) <= cells - min_distance)
+                cut = len(selected)
+                check = cp_model.CpSolver()
+                check.parameters.max_time_in_seconds = remaining / (k - len(selected))
+                if num_workers:
+                    check.parameters.num_search_workers = num_workers
+                if check.Solve(extra) not in [cp_model.FEASIBLE, cp_model.OPTIMAL]:
+                    break
+                roster, penalty = self.roster_of(check.ResponseProto().solution)
+                selected.append((penalty, roster))
+
+        shift_codes = np.array(self.shifts)
+        solutions = []
+        for rank, (penalty, roster) in enumerate(selected, 1):
+            solutions.append({
+                'rank': rank,
+                'penalty': penalty,
+                'schedules': {name: shift_codes[roster[e]].tolist() for e, name in enumerate(self.employees)},
+                'distances': [int((roster != other).sum()) for _, other in selected]
+            })
+        message = f"共找到 {len(solutions)} 個不同的班表，懲罰分數: {', '.join(str(item['penalty']) for item in solutions)}"
+        if len(solutions) < k:
+            message += f"（要求 {k} 個，時間內找不到更多相差 {min_distance} 格以上的班表）"
+        return {'status': 'success', 'solutions': solutions, 'message': message}
+
     def print_results(self, solver, status):
         result = {
             'status': 'success' if status in [cp_model.FEASIBLE, cp_model.OPTIMAL] else 'error',
@@ -230,23 +359,27 @@ class CPMODEL:
         }
 
         if status in [cp_model.FEASIBLE, cp_model.OPTIMAL]:
-            # 收集每個員工的排班結果
-            for e in self.employees:
-                schedule = []
-                for d in range(1, self.days+1):
-                    for s in self.shifts:
-                        if solver.Value(self.shifts_var[e,d,s]):
-                            schedule.append(s)
-                result['schedules'][e] = schedule
+            # 收集每個員工的排班結果（一次取出所有變數值，每人每天恰有一個班別為 1）
+            shift_codes = np.array(self.shifts)[solution_values(solver, self.x_index).argmax(axis=2)]
+            for e, name in enumerate(self.employees):
+                result['schedules'][name] = shift_codes[e].tolist()
 
             # 計算總懲罰分數
-            total_penalty = 0
-            for var, weight in self.penalties:
-                if solver.Value(var):
-                    total_penalty += weight
+            total_penalty = int(solution_values(solver, self.penalty_index) @ self.penalty_weights)
             result['penalty'] = total_penalty
             result['message'] = f"排班成功完成，總懲罰分數(越低越好): {total_penalty}"
 
+        elif status == cp_model.INFEASIBLE and self.explain:
+            # 以 assumption 找出互相衝突的硬限制，對應回員工與日期
+            conflicts = self.explain_infeasibility(solver, status)
+            result['conflicts'] = conflicts
+            if conflicts:
+                result['message'] = "找不到可行解，以下硬限制無法同時成立：\n" + "\n".join(
+                    conflict['message'] for conflict in conflicts)
+            else:
+                # 衝突核心為空：無解來自未加 assumption 的限制
+                result['message'] = ("找不到可行解，衝突來自未納入診斷的限制："
+                                     + "、".join(UNGUARDED_CONSTRAINTS))
         elif status not in [cp_model.FEASIBLE, cp_model.OPTIMAL]:
             result['message'] = "找不到可行解，開始診斷軟限制問題..."
             violation_summary = {'連續7天工作':0, 'C班非連續':0, '大夜後非雙休':0}
@@ -254,12 +387,13 @@ class CPMODEL:
             for var, weight in self.penalties:
                 if 'work7' in var.Name():
                     violation_summary['連續7天工作'] += 1
-                elif 'non_cont_C' in var.Name():
+                elif 'interrupted_C' in var.Name():
                     violation_summary['C班非連續'] += 1
                 elif 'double_off_after_C' in var.Name():
                     violation_summary['大夜後非雙休'] += 1
 
             result['violations'] = violation_summary
+            result['diagnostic_info'] = self.get_diagnostic_info()
             result['message'] += "\n建議降低限制數量多的限制的權重或移除部分限制條件。"
         else:
             result['message'] = "找不到可行解"
@@ -267,6 +401,95 @@ class CPMODEL:
 
         return result
 
+    def explain_infeasibility(self, solver=None, status=None, time_limit=60):
+        """
+        找出一組互相衝突的硬限制（需以 explain=True 建立模型）。
+        先取 CP-SAT 回傳的 sufficient assumptions（通常包含全部限制），再以 QuickXplain 二分縮小，
+        得到的集合中任一條限制放寬都會讓模型有解（在時間上限內完成時）。
+        @param solver: cp_model.CpSolver, 已求解且無解的 solver（可選），未提供時重新求解
+        @param status: solver 的求解狀態
+        @param time_limit: float, 整個診斷的時間上限（秒）
+        @return: list, [{'rule', 'message', 'employee', 'date', 'shift', ...}]；模型有解或無法判斷時回傳空清單；衝突僅來自 UNGUARDED_CONSTRAINTS 時亦回傳空清單
+        """
+        if not self.explain:
+            raise ValueError("需以 CPMODEL(..., explain=True) 建立模型才能診斷衝突限制")
+        started = time.time()
+        literals = {literal.Index(): literal for literal in self.assumption_literals}
+
+        def solve_with(indices):
+            check = cp_model.CpSolver()
+            check.parameters.max_time_in_seconds = max(1.0, time_limit - (time.time() - started))
+            # 只需判斷是否可行，找到第一個解即停止
+            check.parameters.stop_after_first_solution = True
+            check.parameters.num_search_workers = 1
+            self.model.ClearAssumptions()
+            self.model.AddAssumptions([literals[index] for index in indices])
+            return check, check.Solve(self.model)
+
+        if solver is None or status != cp_model.INFEASIBLE:
+            solver, status = solve_with(list(literals))
+        if status != cp_model.INFEASIBLE:
+            self.restore_assumptions()
+            return []
+        core = list(solver.SufficientAssumptionsForInfeasibility())
+
+        def infeasible(indices):
+            # 超過時間上限時視為可行（保留限制），結果只會偏大不會漏掉衝突
+            if time.time() - started >= time_limit:
+                return False
+            return solve_with(indices)[1] == cp_model.INFEASIBLE
+
+        def quick_xplain(background, checked, candidates):
+            # QuickXplain：在 background 一定成立的前提下，找出 candidates 中必要的最小衝突子集
+            if not candidates:
+                return []
+            if checked and infeasible(background):
+                return []
+            if len(candidates) == 1:
+                return candidates
+            half = len(candidates) // 2
+            first, second = candidates[:half], candidates[half:]
+            needed_second = quick_xplain(background + first, bool(first), second)
+            needed_first = quick_xplain(background + needed_second, bool(needed_second), first)
+            return needed_first + needed_second
+
+        # QuickXplain 偏好保留排在前面的限制：休假與每日需求最容易由主管調整，排在最前面
+        order = ('offday', 'daily_demand', 'required_days', 'rest_window', 'shift_connection')
+        core.sort(key=lambda index: order.index(self.assumption_info[index]['rule']))
+        core = quick_xplain([], False, core)
+        self.restore_assumptions()
+        return [self.describe_assumption(self.assumption_info[index]) for index in core]
+
+    def restore_assumptions(self):
+        """診斷結束後恢復完整的 assumption"""
+        self.model.ClearAssumptions()
+        self.model.AddAssumptions(self.assumption_literals)
+
+    def describe_assumption(self, info):
+        """將 assumption 對應的限制資訊加上中文說明"""
+        rule = info['rule']
+        if rule == 'daily_demand':
+            message = f"{info['date']} {info['shift']} 班需 {info['required']} 人"
+        elif rule == 'required_days':
+            message = f"{info['employee']} {info['shift']} 班需排 {info['required']} 天"
+        elif rule == 'rest_window':
+            message = f"{info['employee']} 在 {info['start']} ~ {info['end']} 至少休 {info['rest']} 天"
+        elif rule == 'offday':
+            message = f"{info['employee']} 於 {info['date']} {info['type']}"
+        else:
+            message = f"{info['employee']} 班與班之間需休息 11 小時"
+        return {**info, 'message': message}
+
+    def precheck(self):
+        """
+        建模前的可行性檢查（每日各班別人數與每人各班別天數皆為等式）
+        @return: dict, feasibility.analyze_feasibility 的結果
+        """
+        return analyze_feasibility(
+            self.date_list, self.employees, self.shift_requirements_data, self.offdays_data,
+            [self.daily_requirements[d] for d in range(1, self.days + 1)], strict=True
+        )
+
     def get_diagnostic_info(self):
         # 員工總班次統計
         employee_totals = {e: {'A': 0, 'B': 0, 'C': 0} for e in self.employees}
@@ -281,22 +504,11 @@ class CPMODEL:
             for s in ['A', 'B', 'C']:
                 total_supplied[s] += employee_totals[e][s]
 
-        # 計算每日班次需求
+        # 計算每日班次需求（與模型使用相同的每日需求，週期可跨月）
         daily_requirements_summary = {'A': 0, 'B': 0, 'C': 0}
         for day in range(1, self.days + 1):
-            weekday = datetime(self.start_date.year, self.start_date.month, day).weekday()
-            if weekday == 5:  # 週六
-                daily_requirements_summary['A'] += 2
-                daily_requirements_summary['B'] += 1
-                daily_requirements_summary['C'] += 1
-            elif weekday == 6:  # 週日
-                daily_requirements_summary['A'] += 1
-                daily_requirements_summary['B'] += 1
-                daily_requirements_summary['C'] += 1
-            else:
-                daily_requirements_summary['A'] += 3
-                daily_requirements_summary['B'] += 2
-                daily_requirements_summary['C'] += 1
+            for s in ['A', 'B', 'C']:
+                daily_requirements_summary[s] += self.daily_requirements[day][s]
 
         # 比較供給與需求差異
         supply_demand_diff = {}
@@ -306,18 +518,45 @@ class CPMODEL:
                 'diff': diff,
                 'status': "足夠" if diff == 0 else ("多出" if diff > 0 else "不足")
             }
-        print({
+        diagnostic_info = {
             'employee_totals': employee_totals,
             'total_supplied': total_supplied,
             'daily_requirements': daily_requirements_summary,
-            'supply_demand_diff': supply_demand_diff
-        })
-        return {
-            'employee_totals': employee_totals,
-            'total_supplied': total_supplied,
-            'daily_requirements': daily_requirements_summary,
-            'supply_demand_diff': supply_demand_diff
+            'supply_demand_diff': supply_demand_diff,
+            'feasibility': self.precheck()
         }
+        print(diagnostic_info)
+        return diagnostic_info
+
+class RosterCollector(cp_model.CpSolverSolutionCallback):
+    """收集求解過程中每個更佳的中間解 {班表 bytes: (懲罰分數, 班別索引矩陣)}"""
+    def __init__(self, cp):
+        """
+        @param cp: CPMODEL, 已呼叫 add_preferences 的模型
+        """
+        super().__init__()
+        self.cp = cp
+        self.rosters = {}
+
+    def on_solution_callback(self):
+        roster, penalty = self.cp.roster_of(self.Response().solution)
+        self.rosters.setdefault(roster.tobytes(), (penalty, roster))
+
+
+def select_diverse(candidates, k, min_distance=1):
+    """
+    依懲罰分數由低到高挑選 k 個班表，與已選班表的 Hamming 距離皆需 >= min_distance
+    @param candidates: iterable, [(懲罰分數, 班別索引矩陣), ...]
+    @return: list, [(懲罰分數, 班別索引矩陣), ...]
+    """
+    selected = []
+    for penalty, roster in sorted(candidates, key=lambda item: item[0]):
+        if all((roster != other).sum() >= min_distance for _, other in selected):
+            selected.append((penalty, roster))
+            if len(selected) == k:
+                break
+    return selected
+
 
 def main():
     # 這裡請傳入 cycle_id，例如 1
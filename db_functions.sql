@@ -0,0 +1,190 @@
+-- 排班求解器使用的資料庫函式（於 Supabase SQL Editor 執行）
+
+-- get_cycle_bundle：一次回傳單一週期的排班輸入（JSON），取代 supabase_client 的六個查詢
+-- 只包含週期成員的員工資料與偏好；格式對應 supabase_client.fetch_cycle_inputs：
+-- {
+--   "cycle": {cycle_id, start_date, end_date, status, shift_group, cycle_comment},
+--   "employees": [{"id", "name"}],
+--   "shift_requirements": {snapshot_name: {"A": n, "B": n, "C": n}},
+--   "preferences": {name: {"max_continuous_days", "continuous_C", "double_off_after_C"}},
+--   "offdays": {name: [{"date", "type"}]},
+--   "shift_group": {weekday: [{"shift_name", "shift_subname", "shift_group", "amount"}]}
+-- }
+-- 找不到週期時回傳 NULL
+CREATE OR REPLACE FUNCTION public.get_cycle_bundle(p_cycle_id integer)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+  WITH cycle AS (
+    SELECT cycle_id, start_date, end_date, status, shift_group, cycle_comment
+    FROM public.schedule_cycles
+    WHERE cycle_id = p_cycle_id
+  ),
+  member_ids AS (
+    SELECT DISTINCT employee_id
+    FROM public.schedule_cycle_members
+    WHERE cycle_id = p_cycle_id
+  )
+  SELECT jsonb_build_object(
+    'cycle', (SELECT to_jsonb(c) FROM cycle c),
+    'employees', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object('id', e.id, 'name', e.name) ORDER BY e.id)
+      FROM public.employees e
+      JOIN member_ids m ON m.employee_id = e.id
+    ), '[]'::jsonb),
+    'shift_requirements', COALESCE((
+      SELECT jsonb_object_agg(r.snapshot_name, r.requirement)
+      FROM (
+        SELECT snapshot_name, jsonb_object_agg(shift_type, required_days) AS requirement
+        FROM public.schedule_cycle_members
+        WHERE cycle_id = p_cycle_id AND shift_type IS NOT NULL
+        GROUP BY snapshot_name
+      ) r
+    ), '{}'::jsonb),
+    'preferences', COALESCE((
+      SELECT jsonb_object_agg(e.name, jsonb_build_object(
+        'max_continuous_days', p.max_continuous_days,
+        'continuous_C', p.continuous_c,
+        'double_off_after_C', p.double_off_after_c
+      ))
+      FROM public.employee_preferences p
+      JOIN public.employees e ON e.id = p.employee_id
+      JOIN member_ids m ON m.employee_id = p.employee_id
+    ), '{}'::jsonb),
+    'offdays', COALESCE((
+      SELECT jsonb_object_agg(o.name, o.items)
+      FROM (
+        SELECT e.name, jsonb_agg(jsonb_build_object('date', t.offdate, 'type', t.offtype) ORDER BY t.offdate) AS items
+        FROM public.schedule_cycle_temp_offdays t
+        JOIN public.employees e ON e.id = t.employee_id
+        WHERE t.cycle_id = p_cycle_id
+        GROUP BY e.name
+      ) o
+    ), '{}'::jsonb),
+    'shift_group', (
+      SELECT jsonb_object_agg(g.weekday, g.items)
+      FROM (
+        SELECT sg.weekday, jsonb_agg(jsonb_build_object(
+          'shift_name', st.shift_name,
+          'shift_subname', st.shift_subname,
+          'shift_group', st.shift_group,
+          'amount', sg.amount
+        )) AS items
+        FROM public.shift_group sg
+        JOIN public.shift_type st ON st.id = sg.shift_id
+        JOIN cycle c ON c.shift_group = sg.group_name
+        GROUP BY sg.weekday
+      ) g
+    )
+  )
+  WHERE EXISTS (SELECT 1 FROM cycle);
+$$;
+
+-- update_cycle_requirements：以單次呼叫套用一個週期的多筆班別需求變更
+-- p_changes: [{"employee_id": 3, "employee_name": "張小明", "shift_type": "A", "required_days": 5}, ...]
+--            employee_id 可省略，缺少時以 employee_name 對應 employees.name
+-- 依 (cycle_id, employee_id, shift_type) 更新 schedule_cycle_members.required_days，
+-- 依輸入順序回傳每筆的結果 status：updated | unknown_employee | not_found（週期中沒有該成員與班別）
+CREATE OR REPLACE FUNCTION public.update_cycle_requirements(p_cycle_id integer, p_changes jsonb)
+RETURNS TABLE (employee_id integer, employee_name text, shift_type text, required_days integer, status text)
+LANGUAGE sql
+AS $$
+  WITH changes AS (
+    SELECT
+      c.position,
+      COALESCE((c.item->>'employee_id')::integer, e.id) AS employee_id,
+      c.item->>'employee_name' AS employee_name,
+      c.item->>'shift_type' AS shift_type,
+      (c.item->>'required_days')::integer AS required_days
+    FROM jsonb_array_elements(p_changes) WITH ORDINALITY AS c(item, position)
+    LEFT JOIN LATERAL (
+      SELECT id FROM public.employees
+      WHERE c.item->>'employee_id' IS NULL AND name = c.item->>'employee_name'
+      ORDER BY id
+      LIMIT 1
+    ) e ON true
+  ),
+  updated AS (
+    UPDATE public.schedule_cycle_members m
+    SET required_days = ch.required_days
+    FROM changes ch
+    WHERE m.cycle_id = p_cycle_id
+      AND m.employee_id = ch.employee_id
+      AND m.shift_type = ch.shift_type
+    RETURNING m.employee_id, m.shift_type
+  )
+  SELECT
+    ch.employee_id,
+    ch.employee_name,
+    ch.shift_type,
+    ch.required_days,
+    CASE
+      WHEN ch.employee_id IS NULL THEN 'unknown_employee'
+      WHEN EXISTS (
+        SELECT 1 FROM updated u WHERE u.employee_id = ch.employee_id AND u.shift_type = ch.shift_type
+      ) THEN 'updated'
+      ELSE 'not_found'
+    END
+  FROM changes ch
+  ORDER BY ch.position;
+$$;
+
+-- save_cycle_leaves：以差異寫入週期休假（單一交易）
+-- p_upserts : [{"employee_id", "offdate", "offtype"}, ...] 應存在的休假；不存在則新增，offtype 不同則更新，相同則不動
+-- p_removals: [{"employee_id", "offdate"}, ...] 要刪除的休假
+-- p_replace : true 時 p_upserts 為完整集合，週期中不在其中的休假一律刪除（忽略 p_removals）
+-- 以 (cycle_id, employee_id, offdate) 對應既有資料列，既有列的 uuid 不變
+-- 回傳 {"inserted", "updated", "deleted", "unchanged"}
+CREATE OR REPLACE FUNCTION public.save_cycle_leaves(
+  p_cycle_id integer,
+  p_upserts jsonb,
+  p_removals jsonb DEFAULT '[]'::jsonb,
+  p_replace boolean DEFAULT false
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_inserted integer := 0;
+  v_updated integer := 0;
+  v_deleted integer := 0;
+BEGIN
+  IF p_replace THEN
+    DELETE FROM public.schedule_cycle_temp_offdays t
+    WHERE t.cycle_id = p_cycle_id
+      AND NOT EXISTS (
+        SELECT 1 FROM jsonb_to_recordset(p_upserts) AS u(employee_id integer, offdate date, offtype text)
+        WHERE u.employee_id = t.employee_id AND u.offdate = t.offdate
+      );
+  ELSE
+    DELETE FROM public.schedule_cycle_temp_offdays t
+    USING jsonb_to_recordset(p_removals) AS r(employee_id integer, offdate date)
+    WHERE t.cycle_id = p_cycle_id AND t.employee_id = r.employee_id AND t.offdate = r.offdate;
+  END IF;
+  GET DIAGNOSTICS v_deleted = ROW_COUNT;
+
+  UPDATE public.schedule_cycle_temp_offdays t
+  SET offtype = u.offtype
+  FROM jsonb_to_recordset(p_upserts) AS u(employee_id integer, offdate date, offtype text)
+  WHERE t.cycle_id = p_cycle_id AND t.employee_id = u.employee_id AND t.offdate = u.offdate
+    AND t.offtype IS DISTINCT FROM u.offtype;
+  GET DIAGNOSTICS v_updated = ROW_COUNT;
+
+  INSERT INTO public.schedule_cycle_temp_offdays (cycle_id, employee_id, offdate, offtype)
+  SELECT p_cycle_id, u.employee_id, u.offdate, u.offtype
+  FROM jsonb_to_recordset(p_upserts) AS u(employee_id integer, offdate date, offtype text)
+  WHERE NOT EXISTS (
+    SELECT 1 FROM public.schedule_cycle_temp_offdays t
+    WHERE t.cycle_id = p_cycle_id AND t.employee_id = u.employee_id AND t.offdate = u.offdate
+  );
+  GET DIAGNOSTICS v_inserted = ROW_COUNT;
+
+  RETURN jsonb_build_object(
+    'inserted', v_inserted,
+    'updated', v_updated,
+    'deleted', v_deleted,
+    'unchanged', jsonb_array_length(p_upserts) - v_inserted - v_updated
+  );
+END;
+$$;
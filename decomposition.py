@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+decomposition.py
+
+依班別群組拆解同一日期區間內的排班：每個週期對應一個 shift_group 與一組成員，
+成員互不重疊的週期是彼此獨立的子問題，可同時在不同行程中求解，最後合併成一份回應並以單次 upsert 寫入 employee_schedules。
+
+1. 找出與日期區間重疊的所有週期，以 fetch_cycles_inputs 一次載入
+2. 日期重疊且有共用成員的週期無法獨立求解，整組回報衝突（不求解、不寫入）
+3. 其餘週期以 ProcessPoolExecutor 同時執行 run_auto_scheduling，CPU 執行緒平均分配
+4. 成功的週期合併為 {員工: {日期: 班別}}，一次 upsert
+
+用法：
+    python decomposition.py 2025-09-01 2025-09-30 --workers 3
+    python decomposition.py 2025-09-01 2025-09-30 --no-save
+"""
+
+import io
+import os
+import sys
+import argparse
+import contextlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from supabase_client import fetch_cycle_ids_in_range, fetch_cycles_inputs, upsert_employee_schedules
+
+
+class SubproblemReporter:
+    """把子問題的進度與中間解轉交給整體的 reporter，並標上週期 ID（需可 pickle 傳入 worker 行程）"""
+    def __init__(self, reporter, cycle_id):
+        self.reporter = reporter
+        self.cycle_id = cycle_id
+
+    def progress(self, stage, message):
+        self.reporter.progress(stage, f'週期 #{self.cycle_id}：{message}')
+
+    def solution(self, event):
+        self.reporter.solution({**event, 'cycle_id': self.cycle_id})
+
+    def should_stop(self):
+        return self.reporter.should_stop()
+
+
+def _solve_subproblem(cycle_id, inputs, deadline, num_workers, force, reporter=None):
+    """worker 行程的進入點：以 run_auto_scheduling 求解單一週期"""
+    # 延遲匯入，避免主行程載入求解器
+    from test_plup import run_auto_scheduling
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return run_auto_scheduling(cycle_id, reporter=reporter, inputs=inputs, deadline=deadline,
+                                       num_workers=num_workers, force=force)
+    except Exception as e:
+        return {'success': False, 'message': str(e), 'stage': 'error', 'data': None}
+
+
+def find_subproblems(inputs_by_cycle):
+    """
+    將週期分為可獨立求解的子問題，日期重疊且有共用成員的週期併為同一組
+    @param inputs_by_cycle: dict, {cycle_id: fetch_cycle_inputs 格式的輸入}
+    @return: (list 可獨立求解的週期 ID, list 衝突組 [{'cycle_ids': [...], 'employees': [...]}])
+    """
+    members = {cycle_id: set(inputs['shift_requirements']) for cycle_id, inputs in inputs_by_cycle.items()}
+    spans = {
+        cycle_id: (str(inputs['cycle']['start_date']), str(inputs['cycle']['end_date']))
+        for cycle_id, inputs in inputs_by_cycle.items()
+    }
+    parent = {cycle_id: cycle_id for cycle_id in inputs_by_cycle}
+
+    def find(cycle_id):
+        while parent[cycle_id] != cycle_id:
+            parent[cycle_id] = parent[parent[cycle_id]]
+            cycle_id = parent[cycle_id]
+        return cycle_id
+
+    cycle_ids = sorted(inputs_by_cycle)
+    for i, a in enumerate(cycle_ids):
+        for b in cycle_ids[i + 1:]:
+            overlaps = spans[a][0] <= spans[b][1] and spans[b][0] <= spans[a][1]
+            if overlaps and members[a] & members[b]:
+                parent[find(b)] = find(a)
+
+    groups = {}
+    for cycle_id in cycle_ids:
+        groups.setdefault(find(cycle_id), []).append(cycle_id)
+    independent, conflicts = [], []
+    for ids in groups.values():
+        if len(ids) == 1:
+            independent.append(ids[0])
+            continue
+        shared = set()
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                shared |= members[a] & members[b]
+        conflicts.append({'cycle_ids': ids, 'employees': sorted(shared)})
+    return independent, conflicts
+
+
+def schedule_rows(schedule, dates, employees):
+    """
+    將班表轉為 employee_schedules 的資料列
+    @param schedule: dict, {員工: [班別, ...]}
+    @param dates: list, 與班表對齊的日期字串
+    @param employees: list, [{'id', 'name'}, ...]
+    """
+    employee_ids = {emp['name']: emp['id'] for emp in employees}
+    now = datetime.now().isoformat()
+    return [
+        {'employee_id': int(employee_ids[name]), 'work_date': day, 'shift_type': shift,
+         'shift_subtype': '', 'updated_at': now}
+        for name, row in schedule.items() if name in employee_ids
+        for day, shift in zip(dates, row)
+    ]
+
+
+def run_decomposition(start_date, end_date, workers=None, threads=None, deadline=None, force=False, save=True,
+                      reporter=None):
+    """
+    同一日期區間內的多個班別群組同時排班
+    @param start_date: 區間開始日（YYYY-MM-DD）
+    @param end_date: 區間結束日（含）
+    @param workers: int, 同時求解的子問題數，預設 min(子問題數, CPU 核心數 // 4)
+    @param threads: int, 所有子問題合計的求解執行緒數，預設為 CPU 核心數
+    @param deadline: float, 每個子問題的求解時間上限（秒，可選）
+    @param force: bool, 忽略排班結果快取
+    @param save: bool, 是否將成功的班表以單次 upsert 寫入 employee_schedules
+    @param reporter: ScheduleReporter, 進度回報物件（可選，需可 pickle），各子問題的進度與中間解會標上週期 ID
+    @return: dict, {'success', 'message', 'stage', 'data'}
+    """
+    cycle_ids = fetch_cycle_ids_in_range(start_date, end_date)
+    inputs_by_cycle = fetch_cycles_inputs(cycle_ids) if cycle_ids else {}
+    if not inputs_by_cycle:
+        return {'success': False, 'message': f'{start_date} ~ {end_date} 沒有需要排班的週期', 'stage': 'error',
+                'data': None}
+    independent, conflicts = find_subproblems(inputs_by_cycle)
+
+    results = {}
+    if independent:
+        threads = threads or os.cpu_count() or 1
+        workers = max(1, min(workers or max(1, threads // 4), len(independent)))
+        num_workers = max(1, threads // workers)
+        if reporter:
+            reporter.progress('range', f'{len(independent)} 個週期求解中')
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+            futures = {
+                executor.submit(_solve_subproblem, cycle_id, inputs_by_cycle[cycle_id], deadline, num_workers,
+                                force, reporter and SubproblemReporter(reporter, cycle_id)): cycle_id
+                for cycle_id in independent
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                if reporter:
+                    reporter.progress('range', f'{len(results)}/{len(independent)} 個週期求解完成')
+
+    # 合併各子問題的結果
+    subproblems, schedule, rows = [], {}, []
+    for cycle_id in sorted(results):
+        result, inputs = results[cycle_id], inputs_by_cycle[cycle_id]
+        subproblems.append({
+            'cycle_id': cycle_id,
+            'shift_group': inputs['cycle'].get('shift_group'),
+            'employees': sorted(inputs['shift_requirements']),
+            'success': result['success'],
+            'stage': result['stage'],
+            'message': result['message']
+        })
+        if result['success']:
+            data = result['data']
+            for name, row in data['schedule'].items():
+                schedule.setdefault(name, {}).update(zip(data['dates'], row))
+            rows += schedule_rows(data['schedule'], data['dates'], inputs['employees'])
+
+    saved = 0
+    message = None
+    if save and rows:
+        try:
+            saved = upsert_employee_schedules(rows)
+        except Exception as e:
+            message = f'班表寫入失敗: {e}'
+
+    solved = sum(1 for item in subproblems if item['success'])
+    success = message is None and not conflicts and solved == len(subproblems)
+    if message is None:
+        message = f'{solved}/{len(inputs_by_cycle)} 個週期排班成功'
+        if conflicts:
+            message += f"，{sum(len(group['cycle_ids']) for group in conflicts)} 個週期因共用成員無法獨立求解"
+    return {
+        'success': success,
+        'message': message,
+        'stage': 'complete' if success else 'partial',
+        'data': {
+            'start_date': str(start_date),
+            'end_date': str(end_date),
+            'subproblems': subproblems,
+            'conflicts': conflicts,
+            'schedule': schedule,
+            'saved': saved
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='依班別群組拆解同一日期區間的排班並同時求解')
+    parser.add_argument('start_date')
+    parser.add_argument('end_date')
+    parser.add_argument('--workers', type=int, help='同時求解的子問題數')
+    parser.add_argument('--threads', type=int, help='合計求解執行緒數（預設為 CPU 核心數）')
+    parser.add_argument('--deadline', type=float, help='每個子問題的求解時間上限（秒）')
+    parser.add_argument('--force', action='store_true', help='忽略排班結果快取')
+    parser.add_argument('--no-save', action='store_true', help='不寫入 employee_schedules')
+    args = parser.parse_args()
+
+    result = run_decomposition(args.start_date, args.end_date, args.workers, args.threads, args.deadline,
+                               args.force, save=not args.no_save)
+    print(result['message'])
+    if result['data']:
+        for item in result['data']['subproblems']:
+            print(f"週期 #{item['cycle_id']} ({item['shift_group']}, {len(item['employees'])} 人): {item['message']}")
+        for group in result['data']['conflicts']:
+            print(f"衝突: 週期 {group['cycle_ids']} 共用成員 {', '.join(group['employees'])}")
+    return 0 if result['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
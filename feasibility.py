@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+feasibility.py
+
+求解前的可行性檢查：只看輸入資料（O(員工數 x 天數)），不建立 CP-SAT 模型，
+在毫秒內找出「一定無解」的週期，避免求解器耗盡整個時間上限才回報失敗。
+
+檢查項目（皆為必要條件，回報 error 代表模型一定無解）：
+- missing_data         : 缺少週期、成員需求或班別群組資料
+- total_supply         : 所有人需求上班天數合計 < 每日需求人數合計
+- shift_supply         : 某班別所有人可排天數合計 < 該班別需求合計（兩階段允許每人偏差 ±3 天）
+- daily_capacity       : 某天扣除休假後可上班人數 < 當天需求人數
+- daily_shift_capacity : 某天某班別可排該班別（需求天數 > 0）且未休假的人數 < 當天該班別需求
+- employee_capacity    : 某員工需求上班天數 > 扣除休假與 7 天休 1 天、14 天休 2 天後的上限
+
+strict=True 對應 CPMODEL 的寫法（每日各班別人數與每人各班別天數皆為等式，只有紅O/特休為硬性休假）；
+strict=False 對應兩階段排班（第一階段所有休假類型皆不上班，第二階段班別天數可偏差）。
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from cp_utils import DEVIATION_PENALTIES
+
+SHIFTS = ('A', 'B', 'C')
+# 休息視窗：(視窗天數, 至少休假天數)，由大到小
+REST_WINDOWS = ((14, 2), (7, 1))
+# CPMODEL 只將這兩種休假視為硬性休假，藍O 為軟性偏好
+HARD_OFF_TYPES = ('紅O', '特休')
+# 兩階段排班第二階段每人各班別天數可偏差的上限
+MAX_DEVIATION = len(DEVIATION_PENALTIES) - 1
+
+
+def max_work_days(days, off_days):
+    """
+    員工在週期內最多可上班天數的上界：把週期切成不重疊的 14 天、7 天區段，
+    每段至少休 max(視窗規定天數, 該段內的固定休假天數)，剩餘不足 7 天的部分只扣固定休假
+    @param days: int, 週期天數
+    @param off_days: set, 固定休假的日期索引
+    @return: int
+    """
+    bound, start = 0, 0
+    for size, rest in REST_WINDOWS:
+        while days - start >= size:
+            fixed = sum(1 for d in off_days if start <= d < start + size)
+            bound += size - max(rest, fixed)
+            start += size
+    return bound + (days - start) - sum(1 for d in off_days if d >= start)
+
+
+def analyze_feasibility(dates, employees, shift_requirements, offdays, daily_demand, strict=False):
+    """
+    @param dates: list, 週期日期（date 或 YYYY-MM-DD 字串）
+    @param employees: list, 員工姓名
+    @param shift_requirements: dict, {員工: {'A': 天數, 'B': 天數, 'C': 天數}}
+    @param offdays: dict, {員工: [{'date': 日期, 'type': 休假類型}, ...]}
+    @param daily_demand: list, 與 dates 對齊的每日班別需求 [{'A': n, 'B': n, 'C': n}, ...]
+    @param strict: bool, True 為 CPMODEL 的等式寫法，False 為兩階段排班
+    @return: dict, {'feasible', 'issues', 'supply', 'demand', 'elapsed_ms'}
+    """
+    started = time.perf_counter()
+    dates = [str(day) for day in dates]
+    date_idx = {day: d for d, day in enumerate(dates)}
+    D = len(dates)
+    issues = []
+
+    def issue(severity, rule, message, **fields):
+        issues.append({'severity': severity, 'rule': rule, 'message': message, **fields})
+
+    requirements = {name: {s: shift_requirements.get(name, {}).get(s, 0) for s in SHIFTS} for name in employees}
+    off_index = {
+        name: {
+            date_idx[str(item['date'])] for item in offdays.get(name, [])
+            if str(item['date']) in date_idx and (not strict or item['type'] in HARD_OFF_TYPES)
+        }
+        for name in employees
+    }
+
+    supply = {s: sum(req[s] for req in requirements.values()) for s in SHIFTS}
+    supply['total'] = sum(supply[s] for s in SHIFTS)
+    demand = {s: sum(day.get(s, 0) for day in daily_demand) for s in SHIFTS}
+    demand['total'] = sum(demand[s] for s in SHIFTS)
+
+    if supply['total'] < demand['total']:
+        issue('error', 'total_supply',
+              f"需求上班天數合計 {supply['total']} 天，少於每日需求人數合計 {demand['total']} 人次",
+              supply=supply['total'], demand=demand['total'])
+
+    for s in SHIFTS:
+        if strict and supply[s] != demand[s]:
+            issue('error', 'shift_supply',
+                  f"{s} 班需求天數合計 {supply[s]} 天，與每日需求合計 {demand[s]} 人次不相等",
+                  shift=s, supply=supply[s], demand=demand[s])
+        elif not strict and supply[s] < demand[s]:
+            upper = sum(req[s] + MAX_DEVIATION for req in requirements.values() if req[s] > 0)
+            severity = 'error' if upper < demand[s] else 'warning'
+            issue(severity, 'shift_supply',
+                  f"{s} 班需求天數合計 {supply[s]} 天，少於每日需求合計 {demand[s]} 人次"
+                  f"（每人偏差 {MAX_DEVIATION} 天時最多 {upper} 天）",
+                  shift=s, supply=supply[s], demand=demand[s], upper=upper)
+
+    for d, day in enumerate(dates):
+        available = [name for name in employees if d not in off_index[name]]
+        required = sum(daily_demand[d].get(s, 0) for s in SHIFTS)
+        capacity = sum(1 for name in available if sum(requirements[name].values()) > 0)
+        if capacity < required:
+            issue('error', 'daily_capacity', f"{day} 可上班 {capacity} 人，少於需求 {required} 人",
+                  date=day, capacity=capacity, required=required)
+        for s in SHIFTS:
+            required = daily_demand[d].get(s, 0)
+            capacity = sum(1 for name in available if requirements[name][s] > 0)
+            if capacity < required:
+                issue('error', 'daily_shift_capacity',
+                      f"{day} 可排 {s} 班 {capacity} 人，少於需求 {required} 人",
+                      date=day, shift=s, capacity=capacity, required=required)
+
+    for name in employees:
+        required = sum(requirements[name].values())
+        upper = max_work_days(D, off_index[name])
+        if required > upper:
+            issue('error', 'employee_capacity',
+                  f"{name} 需上班 {required} 天，扣除休假與休息規定後最多只能上班 {upper} 天",
+                  employee=name, required=required, upper=upper)
+
+    return {
+        'feasible': not any(item['severity'] == 'error' for item in issues),
+        'issues': issues,
+        'supply': supply,
+        'demand': demand,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+    }
+
+
+def analyze_inputs(inputs, strict=False):
+    """
+    以 fetch_cycle_inputs 格式的輸入資料執行可行性檢查
+    @param inputs: dict, {'cycle', 'employees', 'shift_requirements', 'offdays', 'preferences', 'shift_group'}
+    @param strict: bool, 同 analyze_feasibility
+    @return: dict, 同 analyze_feasibility
+    """
+    missing = [key for key in ('cycle', 'shift_requirements', 'shift_group') if not inputs.get(key)]
+    if missing:
+        return {
+            'feasible': False,
+            'issues': [{'severity': 'error', 'rule': 'missing_data', 'message': f"缺少輸入資料: {', '.join(missing)}",
+                        'fields': missing}],
+            'supply': {},
+            'demand': {},
+            'elapsed_ms': 0
+        }
+    # test_plup 於排班前呼叫本模組，延遲匯入避免循環匯入
+    from test_plup import shift_group_demand
+
+    start = datetime.fromisoformat(str(inputs['cycle']['start_date'])).date()
+    end = datetime.fromisoformat(str(inputs['cycle']['end_date'])).date()
+    dates = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    weekly = shift_group_demand(inputs['shift_group'])
+    daily_demand = [weekly.get(day.weekday(), {}) for day in dates]
+    employees = [emp['name'] for emp in inputs['employees']]
+    return analyze_feasibility(dates, employees, inputs['shift_requirements'], inputs['offdays'],
+                               daily_demand, strict)
+
+
+def format_report(report, limit=5):
+    """
+    將檢查結果整理成一段訊息（只列出前 limit 項錯誤）
+    @return: str
+    """
+    errors = [item['message'] for item in report['issues'] if item['severity'] == 'error']
+    if not errors:
+        return '輸入資料檢查通過'
+    message = '；'.join(errors[:limit])
+    if len(errors) > limit:
+        message += f'；另有 {len(errors) - limit} 項'
+    return message
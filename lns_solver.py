@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+lns_solver.py
+
+第二階段 (ShiftAssignmentSolver) 的領域化 Large Neighborhood Search：
+大型團隊時 CP-SAT 內建的 LNS 找到第一個解後常停滯，改為每一輪只釋放一個「鄰域」的格子，
+其餘格子固定為目前最佳解，以很短的時間上限重新求解，有改善就接受。
+
+鄰域：
+- week  : 隨機連續 7 天的所有員工
+- shift : 隨機一個班別，需求該班別的員工中隨機抽一組（整列）
+- worst : 目前解中人數不足最多的日子（前後各 2 天）與班別天數偏差、藍O 被排班最多的員工（整列）
+
+初始解先以完整模型求解，連續一段時間（patience，預設 deadline 的 1/4）沒有改善才改由 LNS 接手，
+小型問題可直接求得最佳解。鄰域大小依上一輪結果調整（鄰域內已最佳則放大、逾時則縮小），
+連續 full_after 輪沒有改善時以目前最佳解為 hint 重新求解完整模型一次。
+
+注意：此模組為選用工具，run_auto_scheduling 不會使用。在單核心環境的合成資料上
+（100x30、200x30，8 workers），CP-SAT 內建的 LNS 通常仍比這裡的鄰域更快改善，
+較早交給 LNS 時結果明顯較差（200x30/60s：6380 對 1110）；目前的預設值讓完整模型持續求解，
+結果與直接求解相當。只有在完整模型確實停滯時才可能有幫助，採用前請以 --sizes 在目標規模上比較。
+到達時間上限，或連續 plateau 輪沒有改善時停止。
+
+用法（合成資料，與直接求解同樣時間比較，可列多組規模）：
+    python lns_solver.py --sizes 40x28 200x30 --deadline 60
+"""
+
+import io
+import sys
+import time
+import threading
+import random
+import argparse
+import contextlib
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from schedule_index import var_indices, solution_values, weekdays_of, weekly_demand_matrix
+
+NEIGHBORHOODS = ('worst', 'week', 'shift')
+# 鄰域大小的縮放範圍：一輪內證明最佳（鄰域太小）時放大，逾時仍無改善（鄰域太大）時縮小
+SCALE_RANGE = (0.5, 4.0)
+SCALE_STEP = 1.5
+
+
+class StallStopper(cp_model.CpSolverSolutionCallback):
+    """找到解之後，連續 patience 秒沒有更佳解即停止搜尋（由背景執行緒檢查，沒有新解時也會生效）"""
+    def __init__(self, patience, interval=0.2):
+        """
+        @param patience: float, 沒有改善多久（秒）即停止
+        @param interval: float, 檢查間隔（秒）
+        """
+        super().__init__()
+        self.patience = patience
+        self.interval = interval
+        self.last_improvement = None
+
+    def on_solution_callback(self):
+        self.last_improvement = time.time()
+
+    def solve(self, solver, model):
+        done = threading.Event()
+
+        def poll():
+            while not done.wait(self.interval):
+                if self.last_improvement is not None and time.time() - self.last_improvement > self.patience:
+                    self.StopSearch()
+                    return
+
+        watcher = threading.Thread(target=poll, daemon=True)
+        watcher.start()
+        try:
+            return solver.Solve(model, self)
+        finally:
+            done.set()
+            watcher.join()
+
+
+class ShiftLNS:
+    def __init__(self, shift_solver, seed=0, num_workers=None):
+        """
+        @param shift_solver: ShiftAssignmentSolver, 已呼叫 add_constraints 與 add_soft_constraints
+        @param seed: int, 鄰域抽樣的亂數種子
+        @param num_workers: int, 每一輪的求解執行緒數（可選），預設同 shift_solver.num_workers
+        """
+        self.shift_solver = shift_solver
+        self.random = random.Random(seed)
+        self.num_workers = num_workers or shift_solver.num_workers
+        self.employees = shift_solver.employees
+        self.shifts = shift_solver.shifts
+        self.D = shift_solver.D
+        # 變數清單與 (員工, 日) 索引，供一次取值與依鄰域固定
+        self.keys = list(shift_solver.x)
+        self.var_index = var_indices([shift_solver.x[key] for key in self.keys])
+        self.cell_e = np.array([e for e, _, _ in self.keys], dtype=np.int64)
+        self.cell_d = np.array([d for _, d, _ in self.keys], dtype=np.int64)
+        self.cell_s = np.array([self.shifts.index(s) for _, _, s in self.keys], dtype=np.int64)
+        self.demand = weekly_demand_matrix(shift_solver.shift_group_raw)[weekdays_of(shift_solver.dates)]
+        # 藍O 日期統一為 'YYYY-MM-DD' 字串，與 dates 比對（offdays 的日期為 datetime.date）
+        self.blue_off = {name: {str(day) for day in days} for name, days in shift_solver.blue_off.items()}
+        self.values = None
+        self.objective = None
+        self.scale = 1.0
+        self.history = []
+
+    def roster(self, values=None):
+        """
+        @param values: np.ndarray, 與 self.keys 對齊的變數值，預設為目前最佳解
+        @return: np.ndarray, 員工 x 天數的班別索引（-1 為休假）
+        """
+        values = self.values if values is None else values
+        roster = np.full((len(self.employees), self.D), -1, dtype=np.int64)
+        chosen = values.astype(bool)
+        roster[self.cell_e[chosen], self.cell_d[chosen]] = self.cell_s[chosen]
+        return roster
+
+    def schedule(self):
+        """@return: dict, {員工: [班別或 'O', ...]}，格式同 ShiftAssignmentSolver.get_result"""
+        codes = np.array(list(self.shifts) + ['O'])
+        roster = self.roster()
+        return {name: codes[roster[e]].tolist() for e, name in enumerate(self.employees)}
+
+    # ---------------------------------------------------------------- 鄰域
+    def neighborhood(self, kind):
+        """
+        @param kind: str, 'week' | 'shift' | 'worst'
+        @return: (np.ndarray 員工 x 天數的 bool 遮罩（True 為釋放）, str 說明)；大小依 self.scale 調整
+        """
+        E, D = len(self.employees), self.D
+        free = np.zeros((E, D), dtype=bool)
+
+        def scaled(size, upper):
+            return max(1, min(upper, round(size * self.scale)))
+
+        if kind == 'worst':
+            roster = self.roster()
+            staffed = np.stack([(roster == k).sum(axis=0) for k in range(len(self.shifts))], axis=1)
+            shortage = np.maximum(self.demand - staffed, 0).sum(axis=1)
+            deviation = np.zeros(E, dtype=np.int64)
+            for e, name in enumerate(self.employees):
+                requirement = self.shift_solver.shift_requirements[name]
+                deviation[e] = sum(abs(int((roster[e] == k).sum()) - requirement[s]) for k, s in enumerate(self.shifts))
+                deviation[e] += sum(1 for d in range(D) if roster[e, d] >= 0
+                                    and str(self.shift_solver.dates[d]) in self.blue_off.get(name, set()))
+            days = [int(d) for d in np.argsort(-shortage)[:3] if shortage[d] > 0]
+            employees = [int(e) for e in np.argsort(-deviation)[:scaled(max(4, E // 10), E)] if deviation[e] > 0]
+            if days or employees:
+                for d in days:
+                    free[:, max(0, d - 2):d + 3] = True
+                free[employees, :] = True
+                return free, f'worst (days={len(days)}, employees={len(employees)})'
+            kind = 'week'
+        if kind == 'week':
+            length = scaled(7, D)
+            start = self.random.randrange(max(1, D - length + 1))
+            free[:, start:start + length] = True
+            return free, f'week (day {start}, {length} days)'
+        s = self.random.choice(self.shifts)
+        eligible = [e for e, name in enumerate(self.employees) if self.shift_solver.shift_requirements[name][s] > 0]
+        chosen = self.random.sample(eligible, scaled(max(8, E // 8), len(eligible))) if eligible else []
+        free[chosen, :] = True
+        return free, f'shift {s} (employees={len(chosen)})'
+
+    # ---------------------------------------------------------------- 求解
+    def solve_initial(self, time_limit, patience=None):
+        """
+        以完整模型求得初始解；回傳求解狀態
+        @param time_limit: float, 時間上限（秒）
+        @param patience: float, 找到解後連續幾秒沒有改善即改由 LNS 接手（可選），未提供時求解到時間上限
+        """
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = time_limit
+        if self.num_workers:
+            solver.parameters.num_search_workers = self.num_workers
+        if patience is None:
+            status = solver.Solve(self.shift_solver.model)
+        else:
+            status = StallStopper(patience).solve(solver, self.shift_solver.model)
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            self.values = solution_values(solver, self.var_index)
+            self.objective = solver.ObjectiveValue()
+        return status
+
+    def improve(self, free, time_limit):
+        """
+        固定鄰域以外的格子後（在模型副本上）重新求解，目標值改善時更新目前最佳解
+        @param free: np.ndarray, 員工 x 天數的 bool 遮罩
+        @return: (bool 是否改善, int 求解狀態)
+        """
+        model = self.shift_solver.model.Clone()
+        model.ClearHints()
+        released = free[self.cell_e, self.cell_d]
+        for index, value, is_free in zip(self.var_index.tolist(), self.values.tolist(), released.tolist()):
+            var = model.GetBoolVarFromProtoIndex(index)
+            if is_free:
+                model.AddHint(var, value)
+            else:
+                model.Add(var == value)
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = time_limit
+        if self.num_workers:
+            solver.parameters.num_search_workers = self.num_workers
+        status = solver.Solve(model)
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) and solver.ObjectiveValue() < self.objective - 1e-6:
+            self.values = solution_values(solver, self.var_index)
+            self.objective = solver.ObjectiveValue()
+            return True, status
+        return False, status
+
+    def run(self, deadline=60, step_time=2.0, plateau=30, initial_time=None, patience=None, full_after=5):
+        """
+        @param deadline: float, 整體時間上限（秒，含初始解）
+        @param step_time: float, 每一輪的求解時間上限（秒）
+        @param plateau: int, 連續幾輪沒有改善即停止
+        @param initial_time: float, 初始解的時間上限，預設為整個 deadline
+        @param patience: float, 初始解連續幾秒沒有改善即改由 LNS 接手，預設為 max(2 * step_time, deadline / 4)；
+                         完整模型仍持續改善時不會被打斷，小型問題可直接求得最佳解
+        @param full_after: int, 連續幾輪沒有改善時，改以目前最佳解為 hint 重新求解完整模型一次（時間為 4 輪）
+        @return: dict, {'status', 'objective', 'schedule', 'iterations', 'history'}
+        """
+        started = time.time()
+        if patience is None:
+            patience = max(2 * step_time, deadline / 4)
+        status = self.solve_initial(initial_time or deadline, patience)
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            return {'status': 'error', 'objective': None, 'schedule': {}, 'iterations': 0, 'history': []}
+        self.history = [{'iteration': 0, 'neighborhood': 'initial', 'objective': self.objective,
+                         'elapsed': round(time.time() - started, 2), 'improved': True}]
+        stall, iteration = 0, 0
+        # 懲罰皆非負，目標值為 0 即為最佳解
+        while status != cp_model.OPTIMAL and self.objective > 0 and stall < plateau:
+            remaining = deadline - (time.time() - started)
+            if remaining < 0.5:
+                break
+            iteration += 1
+            if full_after and stall and stall % full_after == 0:
+                # 鄰域連續停滯：以目前最佳解為 hint 釋放全部格子
+                free, label = np.ones((len(self.employees), self.D), dtype=bool), 'full'
+                improved, round_status = self.improve(free, min(4 * step_time, remaining))
+            else:
+                free, label = self.neighborhood(NEIGHBORHOODS[iteration % len(NEIGHBORHOODS)])
+                improved, round_status = self.improve(free, min(step_time, remaining))
+                if not improved:
+                    # 鄰域內已是最佳 -> 放大；逾時仍無改善 -> 縮小
+                    step = SCALE_STEP if round_status == cp_model.OPTIMAL else 1 / SCALE_STEP
+                    self.scale = min(SCALE_RANGE[1], max(SCALE_RANGE[0], self.scale * step))
+            stall = 0 if improved else stall + 1
+            self.history.append({'iteration': iteration, 'neighborhood': label, 'objective': self.objective,
+                                 'elapsed': round(time.time() - started, 2), 'improved': improved})
+        return {
+            'status': 'success',
+            'objective': self.objective,
+            'schedule': self.schedule(),
+            'iterations': iteration,
+            'history': self.history
+        }
+
+
+# ===================== 與直接求解比較 =====================
+
+def build_shift_solver(first_stage, planner, num_workers):
+    # 延遲匯入，避免只使用 ShiftLNS 時載入第一階段
+    from test_plup import ShiftAssignmentSolver
+    shift_solver = ShiftAssignmentSolver(first_stage, planner.shift_req_data, planner.offdays_raw,
+                                         planner.shift_group_raw, dates=planner.dates, num_workers=num_workers)
+    shift_solver.add_constraints()
+    shift_solver.add_soft_constraints()
+    return shift_solver
+
+
+def compare(employees, days, args):
+    """在一組合成資料上比較直接求解與 LNS（同樣的時間上限）"""
+    from test_plup import OffdayPlanner
+    from synthetic_instances import make_cycle_inputs
+
+    print(f"=== {employees} 位員工 x {days} 天，各 {args.deadline:g}s ===")
+    inputs = make_cycle_inputs(employees=employees, days=days, seed=args.seed,
+                               red_off_ratio=0.05, blue_off_ratio=0.05)
+    with contextlib.redirect_stdout(io.StringIO()):
+        planner = OffdayPlanner(0, inputs=inputs, num_workers=args.workers)
+        first_stage = planner.run(time_limit=args.deadline)
+    if first_stage['status'] != 'success':
+        print('第一階段無可行解')
+        return
+
+    started = time.time()
+    solver, status = build_shift_solver(first_stage['schedule'], planner, args.workers).solve(time_limit=args.deadline)
+    plain = solver.ObjectiveValue() if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None
+    print(f"直接求解: {solver.StatusName(status)} 目標值 {plain} ({time.time() - started:.1f}s)")
+
+    lns = ShiftLNS(build_shift_solver(first_stage['schedule'], planner, args.workers), seed=args.seed)
+    result = lns.run(deadline=args.deadline, step_time=args.step_time)
+    if result['status'] != 'success':
+        print('LNS     : 時間內找不到初始解')
+        return
+    improved = [item for item in result['history'] if item['improved']]
+    print(f"LNS     : 目標值 {result['objective']} ({result['history'][-1]['elapsed']}s, "
+          f"{result['iterations']} 輪, {len(improved) - 1} 次改善)")
+    for item in improved:
+        print(f"  {item['elapsed']:>7}s  {item['objective']:>10}  {item['neighborhood']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='第二階段 LNS 與直接求解比較（合成資料）')
+    parser.add_argument('--sizes', nargs='+', default=['40x28', '200x30'],
+                        help='員工數x天數，可列多組（預設 40x28 200x30）')
+    parser.add_argument('--deadline', type=float, default=60, help='兩種方式各自的時間上限（秒）')
+    parser.add_argument('--step-time', type=float, default=2.0, help='LNS 每一輪的時間上限（秒）')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        employees, days = (int(value) for value in size.lower().split('x'))
+        compare(employees, days, args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+model_cache.py
+
+已建好的 CP-SAT 模型快取：同一組輸入資料建出的模型完全相同，
+把 CpModelProto 與變數索引對照表存到本機磁碟（SCHEDULE_CACHE_DIR/models），
+再次排班或只改變求解時間時直接載入，跳過 Python 迴圈建模。
+
+- 快取鍵：週期日期、成員、班別需求、休假、偏好、班別群組的正規化 JSON 雜湊，
+  加上模型種類、限制寫法 (encoding) 與 MODEL_CACHE_VERSION
+- 檔案內容：zlib 壓縮的「JSON 標頭 + 模型 proto」，標頭記錄 proto 格式與變數索引
+- 容量上限：SCHEDULE_MODEL_CACHE_MB（預設 256MB），超過時刪除最久未使用的檔案
+- 模型一律在加入 hint 與驗證限制之前存入，載入後再各自加入
+"""
+
+import os
+import json
+import zlib
+import hashlib
+from pathlib import Path
+
+from ortools.sat.python import cp_model
+
+# 建模邏輯變更時請遞增，讓舊快取自動失效
+MODEL_CACHE_VERSION = 1
+
+
+def canonical_inputs(inputs):
+    """
+    將 fetch_cycle_inputs 格式的輸入整理成與順序、型別無關的結構
+    （日期一律轉字串、清單排序），相同內容一定得到相同雜湊
+    """
+    members = sorted(emp['name'] for emp in inputs['employees'])
+    return {
+        'start_date': str(inputs['cycle']['start_date']),
+        'end_date': str(inputs['cycle']['end_date']),
+        'members': members,
+        'shift_requirements': {name: inputs['shift_requirements'].get(name) for name in members},
+        'offdays': {
+            name: sorted((str(item['date']), item['type']) for item in inputs['offdays'].get(name, []))
+            for name in members
+        },
+        'preferences': {name: inputs['preferences'].get(name) for name in members},
+        'shift_group': {
+            str(weekday): sorted((item['shift_group'], item['amount']) for item in items)
+            for weekday, items in inputs['shift_group'].items()
+        }
+    }
+
+
+def inputs_hash(payload, **params):
+    """
+    @param payload: 可 JSON 化的輸入資料（通常為 canonical_inputs 的結果）
+    @param params: 其他影響模型的參數，如 kind、encoding
+    @return: str, sha256 十六進位字串
+    """
+    text = json.dumps(
+        {'version': MODEL_CACHE_VERSION, 'params': params, 'payload': payload},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _serialize_model(model):
+    """
+    新版 ortools (>=9.12) 的 Proto() 不是 protobuf 物件，只能以文字格式輸出；
+    舊版則直接使用 protobuf 二進位格式
+    """
+    proto = model.Proto()
+    if hasattr(proto, 'SerializeToString'):
+        return 'binary', proto.SerializeToString()
+    return 'text', str(proto).encode('utf-8')
+
+
+def _deserialize_model(proto_format, data):
+    model = cp_model.CpModel()
+    proto = model.Proto()
+    if proto_format == 'binary':
+        proto.ParseFromString(data)
+    elif hasattr(proto, 'parse_text_format'):
+        proto.parse_text_format(data.decode('utf-8'))
+    else:
+        from google.protobuf import text_format
+        text_format.Parse(data.decode('utf-8'), proto)
+    return model
+
+
+class ModelCache:
+    def __init__(self, directory=None, max_bytes=None):
+        """
+        @param directory: 快取目錄，預設為 SCHEDULE_CACHE_DIR/models
+        @param max_bytes: 快取容量上限（位元組），預設讀取環境變數 SCHEDULE_MODEL_CACHE_MB
+        """
+        self.directory = Path(directory or Path(os.getenv('SCHEDULE_CACHE_DIR', '.schedule_cache')) / 'models')
+        self.max_bytes = max_bytes or int(float(os.getenv('SCHEDULE_MODEL_CACHE_MB', '256')) * 1024 * 1024)
+
+    def _path(self, key):
+        return self.directory / f'{key}.model'
+
+    def get(self, key):
+        """
+        @return: tuple (cp_model.CpModel, dict 變數索引等資訊)；找不到或檔案損毀時回傳 None
+        """
+        path = self._path(key)
+        try:
+            raw = zlib.decompress(path.read_bytes())
+            header, data = raw.split(b'\n', 1)
+            header = json.loads(header)
+            model = _deserialize_model(header['format'], data)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"模型快取 {path.name} 無法載入，改為重新建模: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        # 更新存取時間，供 LRU 淘汰使用
+        os.utime(path)
+        return model, header['meta']
+
+    def put(self, key, model, meta):
+        """
+        @param key: str, 快取鍵（inputs_hash 的結果）
+        @param model: cp_model.CpModel, 尚未加入 hint 的模型
+        @param meta: dict, 可 JSON 化的變數索引對照表
+        """
+        proto_format, data = _serialize_model(model)
+        header = json.dumps({'format': proto_format, 'meta': meta}, ensure_ascii=False).encode('utf-8')
+        path = self._path(key)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp.write_bytes(zlib.compress(header + b'\n' + data))
+            tmp.replace(path)
+            self._evict()
+        except OSError as e:
+            # 快取只影響建模時間，寫入失敗時不中斷排班
+            print(f"保存模型快取失敗: {e}")
+
+    def _evict(self):
+        files = []
+        for path in self.directory.glob('*.model'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.directory.glob('*.model'):
+            path.unlink(missing_ok=True)
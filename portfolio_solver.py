@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+portfolio_solver.py
+
+排班求解器組合 (portfolio)：在同一個時間上限內，以獨立行程同時執行多種模型，
+持續收集通過驗證的班表，直到時間上限、所有引擎結束，或某個引擎證明最佳解（或計分為 0）為止，
+再以共同的計分函式 (score_schedule) 選出分數最低的班表，其餘行程立即終止。
+
+參與的引擎：
+- two_phase : test_plup 的兩階段排班（OffdayPlanner + ShiftAssignmentSolver），正式環境使用
+- cpmodel   : cpmodel_2025 的單一 CP-SAT 模型 (CPMODEL)
+- mip       : 以 pywraplp (SCIP) 建立的混合整數規劃模型（可選，沿用 test_pj.py 的嘗試）
+
+輸入資料只在主行程查詢一次 (fetch_cycle_inputs)，再傳給各引擎，
+所有引擎的結果都以同一份班別群組需求驗證 (verify_shift_violations)；
+各引擎的目標函數不完全相同（例如 CPMODEL 另含連續上班等偏好），因此只以共同計分比較。
+"""
+
+import io
+import sys
+import time
+import json
+import argparse
+import contextlib
+import multiprocessing
+from datetime import datetime, timedelta
+from queue import Empty
+
+from ortools.linear_solver import pywraplp
+from ortools.sat.python import cp_model
+
+from supabase_client import fetch_cycle_inputs
+from test_plup import run_auto_scheduling, shift_group_demand
+from cpmodel_2025 import CPMODEL
+from verify_shift import verify_shift_violations
+from cp_utils import DEVIATION_PENALTIES, penalty_segments, deviation_penalty
+
+SHIFTS = ['A', 'B', 'C']
+# 藍O 上班的懲罰分數（與第二階段 ShiftAssignmentSolver 相同）
+BLUE_OFF_PENALTY = 50
+
+
+def prepare_inputs(inputs):
+    """只保留週期成員，並補齊缺少的偏好設定，讓各引擎面對同一組員工"""
+    members = [emp for emp in inputs['employees'] if emp['name'] in inputs['shift_requirements']]
+    default_pref = {'max_continuous_days': False, 'continuous_C': False, 'double_off_after_C': False}
+    return {
+        **inputs,
+        'employees': members,
+        'preferences': {emp['name']: inputs['preferences'].get(emp['name'], default_pref) for emp in members}
+    }
+
+
+def cycle_dates(inputs):
+    start = datetime.fromisoformat(str(inputs['cycle']['start_date']))
+    end = datetime.fromisoformat(str(inputs['cycle']['end_date']))
+    return [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+
+
+def score_schedule(schedule, inputs):
+    """
+    各引擎共有的軟限制計分，用於比較不同引擎通過驗證的班表（越低越好）：
+    各班別天數與需求的分段偏差懲罰 (cp_utils.deviation_penalty) + 藍O 上班每天 BLUE_OFF_PENALTY
+    """
+    dates = cycle_dates(inputs)
+    score = 0
+    for name, row in schedule.items():
+        requirement = inputs['shift_requirements'].get(name, {})
+        score += sum(deviation_penalty(row.count(s) - requirement.get(s, 0)) for s in SHIFTS)
+        blue_off = {str(item['date']) for item in inputs['offdays'].get(name, []) if item['type'] == '藍O'}
+        score += BLUE_OFF_PENALTY * sum(1 for date_str, shift in zip(dates, row)
+                                        if shift != 'O' and date_str in blue_off)
+    return score
+
+
+# ===================== 各引擎 =====================
+
+def run_two_phase(cycle_id, inputs, time_limit):
+    result = run_auto_scheduling(cycle_id, use_hints=False, inputs=inputs, deadline=time_limit)
+    if not result['success']:
+        return None
+    return {'schedule': result['data']['schedule'], 'objective': None, 'optimal': False}
+
+
+def run_cpmodel(cycle_id, inputs, time_limit):
+    model = CPMODEL(cycle_id, inputs=inputs)
+    if not model.precheck()['feasible']:
+        return None
+    model.add_constraints()
+    model.add_preferences()
+    solver, status = model.solve(time_limit=time_limit)
+    result = model.print_results(solver, status)
+    if result['status'] != 'success':
+        return None
+    return {'schedule': result['schedules'], 'objective': result['penalty'], 'optimal': status == cp_model.OPTIMAL}
+
+
+def run_mip(cycle_id, inputs, time_limit):
+    """
+    混合整數規劃版本：x[e, d, s] 為 0/1 變數
+    硬限制：每日至多一班、紅O/特休不上班、每人總上班天數、班與班之間休息 11 小時、
+            7 天至少休 1 天、14 天至少休 2 天、需求為 0 的班別禁止
+    軟限制：每日班別人數不足（權重 100）、各班別天數偏差（與 CP-SAT 引擎相同的 15/30/50 分段懲罰）、藍O 上班（50）
+    """
+    dates = cycle_dates(inputs)
+    D = len(dates)
+    employees = [emp['name'] for emp in inputs['employees']]
+    requirements = inputs['shift_requirements']
+    demand = shift_group_demand(inputs['shift_group'])
+    offdays = {
+        name: {str(item['date']): item['type'] for item in inputs['offdays'].get(name, [])}
+        for name in employees
+    }
+
+    # 分段懲罰為凸函數，最小化時取各段線性下界的最大值即為原本的分段值
+    segments = penalty_segments(DEVIATION_PENALTIES)
+    if not segments:
+        raise ValueError("MIP 模型需要凸的偏差懲罰 (DEVIATION_PENALTIES)")
+
+    solver = pywraplp.Solver.CreateSolver('SCIP')
+    if not solver:
+        raise Exception("找不到求解器！")
+    solver.SetTimeLimit(int(time_limit * 1000))
+
+    x = {(e, d, s): solver.BoolVar(f'x[{e},{d},{s}]')
+         for e in range(len(employees)) for d in range(D) for s in SHIFTS}
+    penalties = []
+    for e, name in enumerate(employees):
+        work = [sum(x[e, d, s] for s in SHIFTS) for d in range(D)]
+        for d in range(D):
+            solver.Add(work[d] <= 1)
+            if offdays[name].get(dates[d]) in ('紅O', '特休'):
+                solver.Add(work[d] == 0)
+            elif offdays[name].get(dates[d]) == '藍O':
+                penalties.append(50 * work[d])
+        for d in range(D - 1):
+            solver.Add(x[e, d, 'C'] + x[e, d + 1, 'A'] <= 1)
+            solver.Add(x[e, d, 'C'] + x[e, d + 1, 'B'] <= 1)
+            solver.Add(x[e, d, 'B'] + x[e, d + 1, 'A'] <= 1)
+        for start in range(D - 6):
+            solver.Add(sum(work[start:start + 7]) <= 6)
+        for start in range(D - 13):
+            solver.Add(sum(work[start:start + 14]) <= 12)
+        solver.Add(sum(work) == sum(requirements[name].values()))
+        for s in SHIFTS:
+            total = sum(x[e, d, s] for d in range(D))
+            if requirements[name][s] == 0:
+                solver.Add(total == 0)
+            else:
+                deviation = solver.NumVar(0, len(DEVIATION_PENALTIES) - 1, f'dev[{e},{s}]')
+                solver.Add(deviation >= total - requirements[name][s])
+                solver.Add(deviation >= requirements[name][s] - total)
+                penalty = solver.NumVar(0, DEVIATION_PENALTIES[-1], f'dev_penalty[{e},{s}]')
+                for k, slope, base in segments:
+                    solver.Add(penalty >= slope * (deviation - k) + base)
+                penalties.append(penalty)
+    for d, date_str in enumerate(dates):
+        weekday = datetime.strptime(date_str, '%Y-%m-%d').weekday()
+        for s in SHIFTS:
+            required = demand.get(weekday, {}).get(s, 0)
+            if required > 0:
+                shortage = solver.NumVar(0, required, f'shortage[{d},{s}]')
+                solver.Add(sum(x[e, d, s] for e in range(len(employees))) + shortage >= required)
+                penalties.append(100 * shortage)
+    solver.Minimize(sum(penalties))
+
+    status = solver.Solve()
+    if status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        return None
+    schedule = {}
+    for e, name in enumerate(employees):
+        schedule[name] = [
+            next((s for s in SHIFTS if x[e, d, s].solution_value() > 0.5), 'O')
+            for d in range(D)
+        ]
+    return {'schedule': schedule, 'objective': solver.Objective().Value(),
+            'optimal': status == pywraplp.Solver.OPTIMAL}
+
+
+ENGINES = {
+    'two_phase': run_two_phase,
+    'cpmodel': run_cpmodel,
+    'mip': run_mip,
+}
+
+
+def _engine_worker(engine, cycle_id, inputs, time_limit, queue):
+    """子行程進入點：執行引擎、驗證並計分，將結果放入 queue"""
+    started = time.time()
+    try:
+        # 各引擎會輸出大量除錯訊息，子行程中不需要
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcome = ENGINES[engine](cycle_id, inputs, time_limit)
+            passed, violations = (False, [])
+            if outcome:
+                passed, violations = verify_shift_violations(
+                    outcome['schedule'], cycle_dates(inputs), shift_group_demand(inputs['shift_group'])
+                )
+        queue.put({
+            'engine': engine,
+            'found': outcome is not None,
+            'verified': passed,
+            'violations': violations,
+            'objective': outcome['objective'] if outcome else None,
+            'optimal': bool(outcome and outcome['optimal']),
+            'score': score_schedule(outcome['schedule'], inputs) if passed else None,
+            'schedule': outcome['schedule'] if outcome else None,
+            'wall_time': round(time.time() - started, 3)
+        })
+    except Exception as e:
+        queue.put({'engine': engine, 'found': False, 'verified': False, 'error': str(e),
+                   'wall_time': round(time.time() - started, 3)})
+
+
+# ===================== 組合求解 =====================
+
+def run_portfolio(cycle_id, deadline=300, engines=('two_phase', 'cpmodel'), include_mip=False, inputs=None):
+    """
+    以獨立行程同時執行多個排班引擎，回傳共同計分 (score_schedule) 最低且通過驗證的班表；
+    時間上限內持續等待其他引擎，某個通過驗證的引擎證明最佳解或計分為 0 時提前結束
+    @param cycle_id: 週期 ID
+    @param deadline: float, 所有引擎共用的時間上限（秒）
+    @param engines: tuple, 參與的引擎名稱
+    @param include_mip: bool, 是否加入 pywraplp 的 MIP 模型
+    @param inputs: dict, 預先取得的輸入資料（可選）
+    @return: dict, 格式同 run_auto_scheduling，data 內另含 engine 與各引擎摘要 (portfolio)
+    """
+    started = time.time()
+    inputs = prepare_inputs(inputs or fetch_cycle_inputs(cycle_id))
+    if not inputs['cycle']:
+        raise ValueError(f"找不到 cycle_id={cycle_id} 的週期資料")
+    engines = list(engines) + (['mip'] if include_mip and 'mip' not in engines else [])
+
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    processes = {
+        engine: ctx.Process(target=_engine_worker, args=(engine, cycle_id, inputs, deadline, queue), daemon=True)
+        for engine in engines
+    }
+    for process in processes.values():
+        process.start()
+
+    reports = {}
+    winner = None
+    # 多留一點時間給子行程啟動與結果驗證
+    grace = 15
+    try:
+        while len(reports) < len(processes):
+            remaining = deadline + grace - (time.time() - started)
+            if remaining <= 0:
+                break
+            try:
+                report = queue.get(timeout=min(remaining, 1.0))
+            except Empty:
+                if not any(p.is_alive() for p in processes.values()) and queue.empty():
+                    break
+                continue
+            reports[report['engine']] = report
+            if report['verified']:
+                if winner is None or report['score'] < winner['score']:
+                    winner = report
+                # 已證明最佳解，或計分已達下界 0：不必再等其他引擎
+                if report['optimal'] or report['score'] == 0:
+                    break
+    finally:
+        # 終止落敗或逾時的引擎
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            process.join(timeout=5)
+
+    summary = [
+        {
+            'engine': engine,
+            'status': ('winner' if winner and winner['engine'] == engine else
+                       'cancelled' if engine not in reports else
+                       'error' if reports[engine].get('error') else
+                       'verified' if reports[engine]['verified'] else
+                       'unverified' if reports[engine]['found'] else 'no_solution'),
+            'wall_time': reports.get(engine, {}).get('wall_time'),
+            'objective': reports.get(engine, {}).get('objective'),
+            'score': reports.get(engine, {}).get('score'),
+            'optimal': reports.get(engine, {}).get('optimal'),
+            'error': reports.get(engine, {}).get('error')
+        }
+        for engine in engines
+    ]
+
+    if winner:
+        return {
+            'success': True,
+            'message': f'自動排班成功！由 {winner["engine"]} 引擎產生並通過驗證（計分 {winner["score"]}）',
+            'stage': 'complete',
+            'data': {
+                'cycle_id': cycle_id,
+                'start_date': str(inputs['cycle']['start_date']),
+                'end_date': str(inputs['cycle']['end_date']),
+                'dates': cycle_dates(inputs),
+                'schedule': winner['schedule'],
+                'engine': winner['engine'],
+                'score': winner['score'],
+                'verification_passed': True,
+                'wall_time': round(time.time() - started, 3),
+                'portfolio': summary
+            }
+        }
+    return {
+        'success': False,
+        'message': '所有引擎皆未在時間內產生通過驗證的班表',
+        'stage': 'portfolio',
+        'data': {'cycle_id': cycle_id, 'portfolio': summary}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同時執行多個排班引擎，取計分最低且通過驗證的班表')
+    parser.add_argument('cycle_id', type=int, help='週期 ID')
+    parser.add_argument('--deadline', type=float, default=300, help='共用時間上限（秒）')
+    parser.add_argument('--engines', nargs='+', default=['two_phase', 'cpmodel'], choices=list(ENGINES))
+    parser.add_argument('--mip', action='store_true', help='加入 pywraplp MIP 模型')
+    args = parser.parse_args()
+
+    result = run_portfolio(args.cycle_id, args.deadline, tuple(args.engines), args.mip)
+    summary = result['data']['portfolio']
+    for row in summary:
+        print(f"{row['engine']:<10} {row['status']:<12} {row['wall_time']} {row['score']}")
+    print(json.dumps({k: v for k, v in result.items() if k != 'data'}, ensure_ascii=False))
+    return 0 if result['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+result_store.py
+
+排班結果快取：輸入資料與求解參數都沒變時，/api/run-schedule 直接回傳上次通過驗證的班表，不再求解。
+
+- 鍵值：model_cache.canonical_inputs 的雜湊 + 求解參數 (encoding、deadline...) + ENGINE_VERSION
+- 位置：SCHEDULE_CACHE_DIR/results/<cycle_id>/<key>.json
+- 只保存通過驗證且未被提前停止的結果
+- api.py 中會改動週期輸入的寫入端點（休假、成員、需求、班別群組、偏好）呼叫 invalidate_results 清除
+"""
+
+import os
+import json
+import shutil
+from pathlib import Path
+
+from model_cache import canonical_inputs, inputs_hash
+
+# 排班流程或驗證規則變更時請遞增，讓舊結果失效
+ENGINE_VERSION = 1
+
+
+def _results_dir():
+    return Path(os.getenv('SCHEDULE_CACHE_DIR', '.schedule_cache')) / 'results'
+
+
+def result_key(inputs, **params):
+    """
+    @param inputs: dict, fetch_cycle_inputs 格式的輸入資料
+    @param params: 影響結果的求解參數
+    @return: str, 結果快取鍵
+    """
+    return inputs_hash(canonical_inputs(inputs), kind='result', engine=ENGINE_VERSION, **params)
+
+
+def load_result(cycle_id, key):
+    """
+    @return: dict, run_auto_scheduling 格式的結果；找不到時回傳 None
+    """
+    path = _results_dir() / str(cycle_id) / f'{key}.json'
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        path.unlink(missing_ok=True)
+        return None
+
+
+def save_result(cycle_id, key, result):
+    cycle_dir = _results_dir() / str(cycle_id)
+    cycle_dir.mkdir(parents=True, exist_ok=True)
+    path = cycle_dir / f'{key}.json'
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(result, ensure_ascii=False, default=str), encoding='utf-8')
+    tmp.replace(path)
+
+
+def invalidate_results(cycle_id=None):
+    """
+    清除排班結果快取
+    @param cycle_id: 週期 ID；None 表示清除所有週期（員工、偏好、班別群組等跨週期資料變更時）
+    """
+    target = _results_dir() if cycle_id is None else _results_dir() / str(cycle_id)
+    shutil.rmtree(target, ignore_errors=True)
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+rolling_horizon.py
+
+長週期（季度、跨多月）的分段排班：兩階段模型的大小隨週期天數成長，求解時間成長得更快，
+改為以重疊的視窗逐段求解，每段只最佳化 window 天、確定前 commit 天，求解時間約與週期長度成正比。
+
+1. 第一階段（上班/休假）：每個視窗前方帶入已確定的最後 13 天並固定，
+   讓 7 天休 1 天、14 天休 2 天的滑動視窗跨過視窗邊界
+2. 第二階段（班別）：每個視窗前方帶入已確定的最後 1 天並固定，讓 C 後不接 A/B、B 後不接 A 跨過視窗邊界
+3. 每人上班總天數與各班別天數依剩餘可上班天數按比例分配到各視窗，最後一個視窗補足剩餘天數；
+   中間視窗的上班總天數允許偏差 WINDOW_TOTAL_SLACK 天，差額由後續視窗吸收
+4. 全部視窗完成後以 verify_shift_violations 驗證整個週期
+
+用法：
+    python rolling_horizon.py <cycle_id> --window 14 --commit 7 --time-limit 10
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from supabase_client import fetch_cycle_inputs
+from test_plup import OffdayPlanner, ShiftAssignmentSolver, ScheduleReporter, shift_group_demand
+from verify_shift import verify_shift_violations
+from schedule_hints import save_draft_result
+from feasibility import analyze_inputs, format_report
+
+SHIFTS = ('A', 'B', 'C')
+# 視窗前方需帶入的已確定天數：第一階段 14 天休 2 天需看前 13 天，第二階段班別銜接只看前 1 天
+OFFDAY_LOOKBACK = 13
+SHIFT_LOOKBACK = 1
+# 中間視窗上班總天數允許的偏差天數（最後一個視窗先以等式求解，無解時才放寬）
+WINDOW_TOTAL_SLACK = 2
+
+
+def window_spans(days, window, commit):
+    """
+    @param days: int, 週期天數
+    @param window: int, 每個視窗最佳化的天數
+    @param commit: int, 每個視窗確定的天數（最後一個視窗確定到週期結束）
+    @return: list, [(開始, 結束, 確定到), ...]，皆為日期索引，結束與確定到不含
+    """
+    if not 0 < commit <= window:
+        raise ValueError(f"commit={commit} 需介於 1 與 window={window} 之間")
+    spans, start = [], 0
+    while start < days:
+        end = min(start + window, days)
+        committed = end if end == days else start + commit
+        spans.append((start, end, committed))
+        start = committed
+    return spans
+
+
+def apportion(remaining, window_days, remaining_days):
+    """
+    依比例分配剩餘天數到目前視窗（四捨五入，介於 0 與 min(remaining, window_days) 之間）
+    @param remaining: int, 剩餘需排的天數
+    @param window_days: int, 視窗內可排的天數
+    @param remaining_days: int, 視窗開始到週期結束可排的天數
+    """
+    if remaining_days <= 0:
+        return 0
+    share = int(round(remaining * window_days / remaining_days))
+    return max(0, min(share, remaining, window_days))
+
+
+def split_days(total, weights):
+    """
+    以最大餘數法將 total 天依 weights 比例分給各班別，合計恰為 total
+    @param total: int
+    @param weights: dict, {班別: 權重（剩餘需求天數）}
+    @return: dict, {班別: 天數}
+    """
+    positive = {s: w for s, w in weights.items() if w > 0}
+    if not positive or total <= 0:
+        return {s: 0 for s in weights}
+    scale = sum(positive.values())
+    exact = {s: total * w / scale for s, w in positive.items()}
+    days = {s: int(exact.get(s, 0)) for s in weights}
+    for s in sorted(exact, key=lambda s: exact[s] - days[s], reverse=True)[:total - sum(days.values())]:
+        days[s] += 1
+    return days
+
+
+def window_inputs(inputs, dates, start, end):
+    """以原週期的輸入資料建立 [start, end) 視窗的輸入（只替換週期起訖日）"""
+    return dict(inputs, cycle=dict(inputs['cycle'], start_date=dates[start], end_date=dates[end - 1]))
+
+
+def solve_offday_windows(inputs, planner, spans, time_limit, encoding, num_workers, reporter):
+    """
+    第一階段分段求解
+    @return: (np.ndarray 員工 x 天數的 0/1 上班矩陣, list 各視窗摘要)；某視窗無解時矩陣為 None
+    """
+    E, D = planner.E, planner.D
+    work = np.zeros((E, D), dtype=np.int64)
+    # 各視窗皆不可上班的日子（所有休假類型）
+    available = ~planner.index.offday_mask()
+    required = np.array([planner.total_days_req[name] for name in planner.emp_names], dtype=np.int64)
+    windows = []
+    for number, (start, end, committed) in enumerate(spans, 1):
+        reporter.progress('first', f'第一階段：視窗 {number}/{len(spans)} ({planner.dates[start]} ~ {planner.dates[end - 1]})')
+        lookback = max(0, start - OFFDAY_LOOKBACK)
+        remaining = required - work[:, :start].sum(axis=1)
+        last = end == D
+        targets = {
+            name: int(work[e, lookback:start].sum()) + (
+                int(remaining[e]) if last else
+                apportion(int(remaining[e]), int(available[e, start:end].sum()), int(available[e, start:].sum()))
+            )
+            for e, name in enumerate(planner.emp_names)
+        }
+        started = time.time()
+        # 最後一個視窗需補足剩餘天數，先以等式求解
+        for slack in ((0, WINDOW_TOTAL_SLACK) if last else (WINDOW_TOTAL_SLACK,)):
+            window = OffdayPlanner(planner.cycle_id, inputs=window_inputs(inputs, planner.dates, lookback, end),
+                                   encoding=encoding, num_workers=num_workers)
+            window.total_days_req = targets
+            window.total_days_slack = slack
+            window.build_model()
+            # 已確定的天數固定
+            for e in range(E):
+                for d in range(lookback, start):
+                    window.model.Add(window.x[e, d - lookback] == int(work[e, d]))
+            solver, status = window.solve(time_limit=time_limit)
+            if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                break
+        windows.append({
+            'stage': 'first',
+            'start': planner.dates[start],
+            'end': planner.dates[end - 1],
+            'committed': planner.dates[committed - 1],
+            'status': solver.StatusName(status),
+            'objective': solver.ObjectiveValue() if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None,
+            'wall_time': round(time.time() - started, 2)
+        })
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            return None, windows
+        values = window.format_result(solver, status)['schedule']
+        for e, name in enumerate(planner.emp_names):
+            work[e, start:committed] = values[name][start - lookback:committed - lookback]
+    return work, windows
+
+
+def solve_shift_windows(inputs, planner, work, spans, time_limit, encoding, num_workers, reporter):
+    """
+    第二階段分段求解
+    @param work: np.ndarray, 第一階段的 0/1 上班矩陣
+    @return: (dict {員工: [班別, ...]}, list 各視窗摘要)；某視窗無解時班表為 None
+    """
+    names, D = planner.emp_names, planner.D
+    schedule = {name: ['O'] * D for name in names}
+    requirements = {name: {s: planner.shift_req_data.get(name, {}).get(s, 0) for s in SHIFTS} for name in names}
+    windows = []
+    for number, (start, end, committed) in enumerate(spans, 1):
+        reporter.progress('second', f'第二階段：視窗 {number}/{len(spans)} ({planner.dates[start]} ~ {planner.dates[end - 1]})')
+        lookback = max(0, start - SHIFT_LOOKBACK)
+        targets = {}
+        for e, name in enumerate(names):
+            remaining = {s: requirements[name][s] - schedule[name][:start].count(s) for s in SHIFTS}
+            if end == D:
+                share = {s: max(0, remaining[s]) for s in SHIFTS}
+            else:
+                # 視窗內的上班天數依各班別剩餘天數比例分配
+                share = split_days(int(work[e, start:end].sum()), {s: max(0, remaining[s]) for s in SHIFTS})
+            targets[name] = {s: schedule[name][lookback:start].count(s) + share[s] for s in SHIFTS}
+        started = time.time()
+        shift_solver = ShiftAssignmentSolver(
+            {name: work[e, lookback:end].tolist() for e, name in enumerate(names)},
+            requirements, planner.offdays_raw, planner.shift_group_raw,
+            dates=planner.dates[lookback:end], encoding=encoding, num_workers=num_workers
+        )
+        # 班別是否可排（需求為 0 的班別禁止）依整個週期的需求判斷，天數目標則使用視窗分配的天數
+        shift_solver.add_constraints()
+        shift_solver.shift_requirements = targets
+        shift_solver.add_soft_constraints()
+        for e, name in enumerate(names):
+            for d in range(lookback, start):
+                var = shift_solver.x.get((e, d - lookback, schedule[name][d]))
+                if var is not None:
+                    shift_solver.model.Add(var == 1)
+        solver, status = shift_solver.solve(time_limit=time_limit)
+        windows.append({
+            'stage': 'second',
+            'start': planner.dates[start],
+            'end': planner.dates[end - 1],
+            'committed': planner.dates[committed - 1],
+            'status': solver.StatusName(status),
+            'objective': solver.ObjectiveValue() if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None,
+            'wall_time': round(time.time() - started, 2)
+        })
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            return None, windows
+        result = shift_solver.get_result(solver, status)
+        for name in names:
+            schedule[name][start:committed] = result[name][start - lookback:committed - lookback]
+    return schedule, windows
+
+
+def run_rolling_horizon(cycle_id, inputs=None, window=14, commit=7, time_limit=10, encoding='pairwise',
+                        num_workers=None, reporter=None):
+    """
+    分段排班，回傳格式同 test_plup.run_auto_scheduling
+    @param cycle_id: 週期 ID
+    @param inputs: dict, 預先取得的輸入資料（可選，格式同 fetch_cycle_inputs）
+    @param window: int, 每個視窗最佳化的天數
+    @param commit: int, 每個視窗確定的天數
+    @param time_limit: float, 每個視窗每個階段的求解時間上限（秒）
+    @param encoding: str, 'pairwise' 或 'automaton'
+    @param num_workers: int, 求解執行緒數（可選）
+    @param reporter: ScheduleReporter, 進度回報物件（可選）
+    @return: dict, {'success', 'message', 'stage', 'data'}
+    """
+    reporter = reporter or ScheduleReporter()
+    started = time.time()
+    inputs = inputs or fetch_cycle_inputs(cycle_id)
+    feasibility = analyze_inputs(inputs)
+    if not feasibility['feasible']:
+        return {
+            'success': False,
+            'message': f'輸入資料無法排班: {format_report(feasibility)}',
+            'stage': 'precheck',
+            'data': {'cycle_id': cycle_id, 'feasibility': feasibility}
+        }
+    planner = OffdayPlanner(cycle_id, inputs=inputs, encoding=encoding, num_workers=num_workers)
+    spans = window_spans(planner.D, window, commit)
+
+    work, windows = solve_offday_windows(inputs, planner, spans, time_limit, encoding, num_workers, reporter)
+    if work is None:
+        failed = windows[-1]
+        return {
+            'success': False,
+            'message': f"第一階段排班失敗: {failed['start']} ~ {failed['end']} 視窗無可行解",
+            'stage': 'first',
+            'data': {'cycle_id': cycle_id, 'windows': windows}
+        }
+    schedule, shift_windows = solve_shift_windows(inputs, planner, work, spans, time_limit, encoding,
+                                                  num_workers, reporter)
+    windows += shift_windows
+    if schedule is None:
+        failed = windows[-1]
+        return {
+            'success': False,
+            'message': f"第二階段排班失敗: {failed['start']} ~ {failed['end']} 視窗無可行解",
+            'stage': 'second',
+            'data': {'cycle_id': cycle_id, 'windows': windows}
+        }
+
+    passed, violations = verify_shift_violations(schedule, planner.dates, shift_group_demand(planner.shift_group_raw))
+    # 每人各班別天數與需求的差距（分段分配無法保證每人天數完全符合需求）
+    deviations = {
+        name: {s: schedule[name].count(s) - planner.shift_req_data.get(name, {}).get(s, 0) for s in SHIFTS}
+        for name in planner.emp_names
+    }
+    data = {
+        'cycle_id': cycle_id,
+        'start_date': planner.start_date.strftime('%Y-%m-%d'),
+        'end_date': planner.end_date.strftime('%Y-%m-%d'),
+        'dates': planner.dates,
+        'schedule': schedule,
+        'first_stage_result': {name: work[e].tolist() for e, name in enumerate(planner.emp_names)},
+        'windows': windows,
+        'deviations': {name: dev for name, dev in deviations.items() if any(dev.values())},
+        'verification_passed': passed,
+        'violations': violations,
+        'wall_time': round(time.time() - started, 2)
+    }
+    if not passed:
+        return {'success': False, 'message': f'分段排班結果未通過驗證（{len(violations)} 項）',
+                'stage': 'verify', 'data': data}
+    try:
+        save_draft_result(cycle_id, planner.dates, schedule, inputs)
+    except OSError as e:
+        print(f"保存排班草稿失敗: {e}")
+    reporter.progress('complete', '分段排班完成')
+    return {'success': True, 'message': f'分段排班成功（{len(spans)} 個視窗）', 'stage': 'complete', 'data': data}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='長週期分段排班')
+    parser.add_argument('cycle_id', type=int)
+    parser.add_argument('--window', type=int, default=14, help='每個視窗最佳化的天數')
+    parser.add_argument('--commit', type=int, default=7, help='每個視窗確定的天數')
+    parser.add_argument('--time-limit', type=float, default=10, help='每個視窗每個階段的求解時間上限（秒）')
+    parser.add_argument('--encoding', choices=['pairwise', 'automaton'], default='pairwise')
+    args = parser.parse_args()
+
+    result = run_rolling_horizon(args.cycle_id, window=args.window, commit=args.commit,
+                                 time_limit=args.time_limit, encoding=args.encoding)
+    print(result['message'])
+    for item in (result['data'] or {}).get('windows', []):
+        print(f"{item['stage']:<7} {item['start']} ~ {item['end']} {item['status']:<10} "
+              f"{item['objective']} {item['wall_time']}s")
+    return 0 if result['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
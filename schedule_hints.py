@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+schedule_hints.py
+
+排班暖啟動：以前一份班表作為 CP-SAT 的 solution hint (AddHint)。
+
+班表來源（依序）：
+1. 同一 cycle_id 上次成功排班的草稿結果（存於本機 SCHEDULE_CACHE_DIR/drafts）
+2. employee_schedules 中已發佈的班表（週期開始前五週至週期結束）
+
+來源日期與新週期不同時，以「相同星期幾」對齊：對每個新日期，
+依序往前找 0、7、14... 天前的班別，找到即採用。
+
+草稿同時保存產生它的輸入資料快照，修補模式 (repair_scope) 以此判斷哪些員工、日期需要重新安排。
+"""
+
+import os
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from supabase_client import fetch_published_schedules
+from model_cache import canonical_inputs
+
+# 往前找已發佈班表的週數
+LOOKBACK_WEEKS = 5
+
+
+def _cache_dir():
+    return Path(os.getenv('SCHEDULE_CACHE_DIR', '.schedule_cache'))
+
+
+def _snapshot_inputs(inputs):
+    # 經過一次 JSON 轉換，讓 tuple/日期與從檔案讀回的快照可以直接比較
+    return json.loads(json.dumps(canonical_inputs(inputs), ensure_ascii=False, default=str))
+
+
+def save_draft_result(cycle_id, dates, schedule, inputs=None):
+    """
+    保存排班成功的草稿結果，供同一週期重新排班時作為 hint 或修補模式的基準
+    @param cycle_id: 週期 ID
+    @param dates: list, 日期字串清單 YYYY-MM-DD
+    @param schedule: dict, {員工: [班別, ...]}
+    @param inputs: dict, 產生此班表的輸入資料（可選），修補模式以此比對變更範圍
+    """
+    draft_dir = _cache_dir() / 'drafts'
+    draft_dir.mkdir(parents=True, exist_ok=True)
+    path = draft_dir / f'{cycle_id}.json'
+    tmp = path.with_suffix('.tmp')
+    draft = {'dates': dates, 'schedule': schedule}
+    if inputs is not None:
+        draft['inputs'] = _snapshot_inputs(inputs)
+    tmp.write_text(json.dumps(draft, ensure_ascii=False), encoding='utf-8')
+    tmp.replace(path)
+
+
+def load_draft_result(cycle_id):
+    """
+    讀取同一週期的草稿結果
+    @return: dict, {員工: {YYYY-MM-DD: 班別}}，找不到時回傳 {}
+    """
+    path = _cache_dir() / 'drafts' / f'{cycle_id}.json'
+    if not path.exists():
+        return {}
+    draft = json.loads(path.read_text(encoding='utf-8'))
+    return {
+        name: dict(zip(draft['dates'], shifts))
+        for name, shifts in draft['schedule'].items()
+    }
+
+
+def align_roster(roster, dates):
+    """
+    將 {員工: {日期: 班別}} 以星期幾對齊到新的日期清單
+    @param roster: dict, {員工: {YYYY-MM-DD: 班別}}
+    @param dates: list, 新週期日期字串清單
+    @return: dict, {員工: [班別或 None, ...]}，找不到對應日期時為 None
+    """
+    aligned = {}
+    for name, by_date in roster.items():
+        if not by_date:
+            continue
+        row = []
+        for date_str in dates:
+            dt = datetime.strptime(date_str, '%Y-%m-%d')
+            shift = None
+            for week in range(LOOKBACK_WEEKS + 1):
+                shift = by_date.get((dt - timedelta(days=7 * week)).strftime('%Y-%m-%d'))
+                if shift is not None:
+                    break
+            row.append(shift)
+        aligned[name] = row
+    return aligned
+
+
+def load_roster_hint(cycle_id, employees, dates):
+    """
+    取得對齊到本週期日期的前次班表，作為兩階段求解的 hint
+    @param cycle_id: 週期 ID
+    @param employees: list, [{'id': int, 'name': str}, ...]
+    @param dates: list, 本週期日期字串清單
+    @return: dict, {員工: [班別或 None, ...]}；無可用班表時回傳 {}
+    """
+    roster = load_draft_result(cycle_id)
+    if not roster:
+        start = datetime.strptime(dates[0], '%Y-%m-%d') - timedelta(days=7 * LOOKBACK_WEEKS)
+        id_to_name = {emp['id']: emp['name'] for emp in employees}
+        published = fetch_published_schedules(id_to_name.keys(), start.date(), dates[-1])
+        roster = {id_to_name[emp_id]: by_date for emp_id, by_date in published.items() if emp_id in id_to_name}
+    return align_roster(roster, dates)
+
+
+def repair_scope(cycle_id, inputs, dates, employees=None, changed_dates=None):
+    """
+    取得修補模式的基準班表與需要重新安排的範圍
+    未指定範圍時，比對草稿保存時的輸入與目前輸入：
+    需求、休假、偏好有變動或新加入的員工整列重排，班別群組需求有變動的星期整欄重排
+    @param cycle_id: 週期 ID
+    @param inputs: dict, 目前的輸入資料
+    @param dates: list, 本週期日期字串清單
+    @param employees: list, 指定需重排的員工（可選）
+    @param changed_dates: list, 指定需重排的日期 YYYY-MM-DD（可選）
+    @return: tuple (基準班表 {員工: [班別或 None, ...]}, 員工集合, 日期索引集合)；
+             沒有可用的草稿或週期日期已改變時回傳 None
+    """
+    path = _cache_dir() / 'drafts' / f'{cycle_id}.json'
+    if not path.exists():
+        return None
+    draft = json.loads(path.read_text(encoding='utf-8'))
+    if draft['dates'] != dates:
+        return None
+    base = draft['schedule']
+
+    if employees is not None or changed_dates is not None:
+        day_index = {date_str: d for d, date_str in enumerate(dates)}
+        return base, set(employees or []), {day_index[day] for day in changed_dates or [] if day in day_index}
+
+    old = draft.get('inputs')
+    if old is None:
+        return None
+    new = _snapshot_inputs(inputs)
+    free_employees = {
+        name for name in new['members']
+        if name not in base or any(old[key].get(name) != new[key].get(name)
+                                   for key in ('shift_requirements', 'offdays', 'preferences'))
+    }
+    changed_weekdays = {
+        int(weekday) for weekday in set(old['shift_group']) | set(new['shift_group'])
+        if old['shift_group'].get(weekday) != new['shift_group'].get(weekday)
+    }
+    free_days = {
+        d for d, date_str in enumerate(dates)
+        if datetime.strptime(date_str, '%Y-%m-%d').weekday() in changed_weekdays
+    }
+    return base, free_employees, free_days
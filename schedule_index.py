@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+schedule_index.py
+
+排班模型共用的整數索引層，供 OffdayPlanner、ShiftAssignmentSolver 與 CPMODEL 建模使用：
+
+- ScheduleIndex : 週期日曆（NumPy datetime64）、星期、員工索引、每日班別需求矩陣 (D x 3)、休假遮罩 (E x D)
+- bool_var_array: 以整數索引（員工 x 日 [x 班別]）建立 BoolVar 陣列，取代以字串 tuple 為鍵的 dict
+- var_indices / solution_values: 一次由求解回應取出所有變數的值，取代逐一呼叫 solver.Value
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+# 班別順序即需求矩陣的欄位順序
+SHIFTS = ('A', 'B', 'C')
+SHIFT_GROUP_CONVERT = {'day': 'A', 'evening': 'B', 'night': 'C'}
+
+
+def calendar(start_date, end_date):
+    """
+    @param start_date: date、datetime 或 YYYY-MM-DD 字串
+    @param end_date: 同 start_date（含）
+    @return: np.ndarray, datetime64[D] 日期陣列
+    """
+    start = np.datetime64(datetime.fromisoformat(str(start_date)).date(), 'D')
+    end = np.datetime64(datetime.fromisoformat(str(end_date)).date(), 'D')
+    return np.arange(start, end + 1)
+
+
+def weekdays_of(dates):
+    """
+    @param dates: datetime64[D] 陣列或 YYYY-MM-DD 字串清單
+    @return: np.ndarray, 星期（0=週一），1970-01-01 為週四
+    """
+    days = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+    return (days + 3) % 7
+
+
+def weekly_demand_matrix(shift_group_raw):
+    """
+    將 fetch_shift_group 的結果整理為 7 x 3 的每週需求矩陣（列為星期，欄為 A/B/C）
+    @param shift_group_raw: dict, {星期: [{'shift_group': 'day'|'evening'|'night', 'amount': int, ...}]}
+    """
+    weekly = np.zeros((7, len(SHIFTS)), dtype=np.int64)
+    for weekday, items in (shift_group_raw or {}).items():
+        for item in items:
+            weekly[int(weekday), SHIFTS.index(SHIFT_GROUP_CONVERT[item['shift_group']])] += item['amount']
+    return weekly
+
+
+class ScheduleIndex:
+    def __init__(self, start_date, end_date, employees, shift_group_raw=None, offdays=None):
+        """
+        @param start_date: 週期開始日
+        @param end_date: 週期結束日（含）
+        @param employees: list, 員工姓名（順序即員工索引）
+        @param shift_group_raw: dict, fetch_shift_group 格式的班別群組（可選）
+        @param offdays: dict, {員工: [{'date': 日期, 'type': 休假類型}, ...]}（可選）
+        """
+        self.dates = calendar(start_date, end_date)
+        self.date_strings = [str(day) for day in self.dates]
+        self.D = len(self.dates)
+        self.date_idx = {day: d for d, day in enumerate(self.date_strings)}
+        self.weekdays = weekdays_of(self.dates)
+        self.employees = list(employees)
+        self.E = len(self.employees)
+        self.emp_idx = {name: e for e, name in enumerate(self.employees)}
+        # 每日各班別需求 (D x 3)
+        self.demand = weekly_demand_matrix(shift_group_raw)[self.weekdays]
+        # 休假類型 (E x D)，沒有休假為空字串
+        self.offday_types = np.full((self.E, self.D), '', dtype=object)
+        for name, items in (offdays or {}).items():
+            e = self.emp_idx.get(name)
+            if e is None:
+                continue
+            for item in items:
+                d = self.date_idx.get(str(item['date']))
+                if d is not None:
+                    self.offday_types[e, d] = item['type']
+
+    def offday_mask(self, types=None):
+        """
+        @param types: iterable, 休假類型；None 表示任何類型
+        @return: np.ndarray, E x D 的 bool 遮罩
+        """
+        if types is None:
+            return self.offday_types != ''
+        return np.isin(self.offday_types, list(types))
+
+
+def bool_var_array(model, shape, prefix):
+    """
+    建立以整數索引的 BoolVar 陣列，x[e, d] 或 x[e, d, s] 取得變數，x[e, :] 等切片可直接傳入 LinearExpr.Sum
+    @param model: cp_model.CpModel
+    @param shape: tuple, 陣列維度
+    @param prefix: str, 變數名稱前綴（名稱為 prefix_e_d...）
+    @return: np.ndarray (dtype=object)
+    """
+    variables = np.empty(shape, dtype=object)
+    for position in np.ndindex(*shape):
+        variables[position] = model.NewBoolVar(f"{prefix}_{'_'.join(map(str, position))}")
+    return variables
+
+
+def var_indices(variables):
+    """
+    @param variables: np.ndarray 或 list, BoolVar / IntVar
+    @return: np.ndarray, 各變數在模型中的索引（形狀同輸入）
+    """
+    variables = np.asarray(variables, dtype=object)
+    return np.fromiter((var.Index() for var in variables.flat), dtype=np.int64,
+                       count=variables.size).reshape(variables.shape)
+
+
+def solution_values(solver, indices):
+    """
+    一次取出多個變數的值
+    @param solver: cp_model.CpSolver 或 CpSolverSolutionCallback（求解中的中間解）
+    @param indices: np.ndarray, var_indices 的結果
+    @return: np.ndarray, 形狀同 indices 的整數陣列
+    """
+    response = solver.ResponseProto() if hasattr(solver, 'ResponseProto') else solver.Response()
+    return np.asarray(response.solution, dtype=np.int64)[indices]
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+schedule_jobs.py
+
+排班背景工作管理：/api/run-schedule 與 /api/run-schedule-range 送出後立即回傳 job_id，
+兩階段排班 (run_auto_scheduling) 與日期區間的分組排班 (decomposition.run_decomposition)
+改在有上限的 ProcessPoolExecutor 中執行，
+前端再以 job_id 查詢狀態、進度與結果，或以 Server-Sent Events 訂閱每個更佳的中間解，
+並可要求提前停止、直接採用目前最佳解。
+
+工作狀態：
+- queued    : 已送出，等待空閒的 worker
+- running   : 求解中，progress 內有目前階段與訊息
+- succeeded : 排班成功，result 為 run_auto_scheduling（或 run_decomposition）的回傳值
+- failed    : 排班失敗或執行時發生例外
+"""
+
+import os
+import uuid
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from test_plup import ScheduleReporter, run_auto_scheduling
+
+
+class JobReporter(ScheduleReporter):
+    """在 worker 行程中執行，把進度與中間解寫回由 Manager 共享的 dict / list"""
+    def __init__(self, shared, events):
+        self.shared = shared
+        self.events = events
+
+    def progress(self, stage, message):
+        self.shared.update({
+            'status': 'running',
+            'stage': stage,
+            'message': message,
+            'updated_at': datetime.now().isoformat()
+        })
+
+    def solution(self, event):
+        self.events.append(event)
+
+    def should_stop(self):
+        return bool(self.shared.get('stop_requested'))
+
+
+def _run_schedule_job(cycle_id, shared, events, force=False, repair=None, preset=None):
+    """worker 行程的進入點（必須是模組層級函式才能被 pickle）"""
+    shared.update({'status': 'running', 'started_at': datetime.now().isoformat()})
+    return run_auto_scheduling(cycle_id, reporter=JobReporter(shared, events), force=force, repair=repair,
+                               preset=preset)
+
+
+def _run_range_job(start_date, end_date, shared, events, deadline=None, force=False, save=True):
+    """日期區間分組排班的 worker 進入點；各週期再於 run_decomposition 的子行程中求解"""
+    from decomposition import run_decomposition
+
+    shared.update({'status': 'running', 'started_at': datetime.now().isoformat()})
+    return run_decomposition(start_date, end_date, deadline=deadline, force=force, save=save,
+                             reporter=JobReporter(shared, events))
+
+
+class ScheduleJobManager:
+    def __init__(self, max_workers=None, max_jobs=100):
+        """
+        @param max_workers: 同時執行的排班工作上限，預設讀取環境變數 SCHEDULE_MAX_WORKERS
+        @param max_jobs: 保留於記憶體中的工作紀錄上限，超過時移除最舊且已結束的工作
+        """
+        self.max_workers = max_workers or int(os.getenv('SCHEDULE_MAX_WORKERS', '2'))
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.executor = None
+        self.manager = None
+
+    def _ensure_started(self):
+        # 延遲建立行程池，避免 Flask reloader 或僅匯入模組時就產生子行程
+        if self.executor is None:
+            ctx = multiprocessing.get_context('spawn')
+            self.manager = ctx.Manager()
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+
+    def submit(self, cycle_id, force=False, repair=None, preset=None):
+        """
+        送出排班工作；同一週期已有未結束的工作時直接回傳該工作
+        @param force: bool, 忽略排班結果快取，一律重新求解
+        @param repair: 修補模式參數，見 run_auto_scheduling
+        @param preset: str, 求解參數預設組名稱（如 'fast-draft'、'final'），見 solver_presets.py
+        @return: dict, 工作快照
+        """
+        return self._submit(cycle_id, None, _run_schedule_job, cycle_id, force=force, repair=repair, preset=preset)
+
+    def submit_range(self, start_date, end_date, deadline=None, force=False, save=True):
+        """
+        送出日期區間的分組排班工作（見 decomposition.run_decomposition）；同一區間已有未結束的工作時直接回傳該工作
+        @param deadline: float, 每個子問題的求解時間上限（秒，可選）
+        @param force: bool, 忽略排班結果快取
+        @param save: bool, 是否將成功的班表寫入 employee_schedules
+        @return: dict, 工作快照
+        """
+        date_range = {'start_date': str(start_date), 'end_date': str(end_date)}
+        return self._submit(None, date_range, _run_range_job, start_date, end_date, deadline=deadline, force=force,
+                            save=save)
+
+    def _submit(self, cycle_id, date_range, target, *args, **kwargs):
+        # 工作以 cycle_id（單一週期）或 date_range（日期區間）識別
+        with self.lock:
+            for job in self.jobs.values():
+                if job['cycle_id'] == cycle_id and job['range'] == date_range and not job['future'].done():
+                    return self._snapshot(job)
+
+            self._ensure_started()
+            job_id = uuid.uuid4().hex
+            shared = self.manager.dict({
+                'status': 'queued',
+                'stage': 'queued',
+                'message': '等待執行',
+                'updated_at': datetime.now().isoformat()
+            })
+            events = self.manager.list()
+            job = {
+                'job_id': job_id,
+                'cycle_id': cycle_id,
+                'range': date_range,
+                'created_at': datetime.now().isoformat(),
+                'finished_at': None,
+                'shared': shared,
+                'events': events,
+                'future': self.executor.submit(target, *args, shared, events, **kwargs)
+            }
+            job['future'].add_done_callback(lambda _f, job=job: job.update(finished_at=datetime.now().isoformat()))
+            self.jobs[job_id] = job
+            self._evict()
+            return self._snapshot(job)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def list(self, cycle_id=None):
+        with self.lock:
+            jobs = [job for job in self.jobs.values() if cycle_id is None or job['cycle_id'] == cycle_id]
+            return [self._snapshot(job, include_result=False) for job in jobs]
+
+    def events_since(self, job_id, index=0):
+        """
+        取得第 index 筆之後的中間解
+        @return: list 或 None（找不到工作）
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if not job:
+            return None
+        try:
+            return list(job['events'][index:])
+        except Exception:
+            return []
+
+    def request_stop(self, job_id):
+        """
+        要求求解器停止搜尋並採用目前最佳解
+        @return: bool, 是否找到未結束的工作
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if not job or job['future'].done():
+            return False
+        job['shared']['stop_requested'] = True
+        return True
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['future'].done()]
+        while len(self.jobs) > self.max_jobs and finished:
+            self.jobs.pop(finished.pop(0), None)
+
+    def _snapshot(self, job, include_result=True):
+        future = job['future']
+        try:
+            progress = dict(job['shared'])
+        except Exception:
+            # Manager 已關閉時只回傳基本資訊
+            progress = {}
+        snapshot = {
+            'job_id': job['job_id'],
+            'cycle_id': job['cycle_id'],
+            'range': job['range'],
+            'status': progress.get('status', 'queued'),
+            'progress': {
+                'stage': progress.get('stage'),
+                'message': progress.get('message'),
+                'updated_at': progress.get('updated_at')
+            },
+            'created_at': job['created_at'],
+            'started_at': progress.get('started_at'),
+            'finished_at': job['finished_at'],
+            'stop_requested': bool(progress.get('stop_requested')),
+            'result': None
+        }
+        if future.done():
+            error = future.exception()
+            if error is not None:
+                result = {
+                    'success': False,
+                    'message': f'執行自動排班時發生錯誤: {str(error)}',
+                    'stage': 'error',
+                    'data': None
+                }
+            else:
+                result = future.result()
+            snapshot['status'] = 'succeeded' if result['success'] else 'failed'
+            if include_result:
+                snapshot['result'] = result
+        return snapshot
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.manager.shutdown()
+            self.executor = None
+            self.manager = None
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+solver_presets.py
+
+CP-SAT 求解參數的具名預設組（preset），存放於 solver_presets.json（可用環境變數 SOLVER_PRESETS_PATH 指定）：
+
+    {
+      "default":    {"offday": {...}, "shift": {...}, "cpmodel": {...}},
+      "fast-draft": {"offday": {"max_time_in_seconds": 5, "linearization_level": 0, ...}, ...},
+      "final":      {...}
+    }
+
+每個引擎的參數為 SatParameters 欄位名稱與值，列舉欄位以名稱表示（如 "search_branching": "FIXED_SEARCH"）。
+OffdayPlanner、ShiftAssignmentSolver、CPMODEL 求解時以 configure_solver 載入；
+未指定 preset 時使用環境變數 SOLVER_PRESET，再沒有則為 "default"。
+預設組由 tune_solver.py 產生。
+"""
+
+import os
+import json
+from pathlib import Path
+
+ENGINES = ('offday', 'shift', 'cpmodel')
+# 找不到 solver_presets.json 時使用的內建參數（與原本寫死的參數相同）
+BUILTIN_PRESETS = {
+    'default': {
+        'offday': {'max_time_in_seconds': 30, 'num_search_workers': 8},
+        'shift': {'max_time_in_seconds': 300},
+        'cpmodel': {'max_time_in_seconds': 300}
+    }
+}
+
+
+def presets_path():
+    return Path(os.getenv('SOLVER_PRESETS_PATH', Path(__file__).with_name('solver_presets.json')))
+
+
+def load_presets(path=None):
+    """
+    @param path: 預設組檔案路徑（可選）
+    @return: dict, {preset 名稱: {引擎: {參數: 值}}}；檔案不存在時回傳內建預設組
+    """
+    path = Path(path) if path else presets_path()
+    if not path.exists():
+        return dict(BUILTIN_PRESETS)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_presets(presets, path=None):
+    path = Path(path) if path else presets_path()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(presets, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def preset_parameters(engine, preset=None):
+    """
+    @param engine: str, 'offday' | 'shift' | 'cpmodel'
+    @param preset: str, 預設組名稱（可選）
+    @return: dict, 該引擎的參數；找不到預設組時拋出 ValueError
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"未知的引擎 {engine}，可用：{', '.join(ENGINES)}")
+    name = preset or os.getenv('SOLVER_PRESET', 'default')
+    presets = load_presets()
+    if name not in presets:
+        raise ValueError(f"找不到求解參數預設組 {name}，可用：{', '.join(presets)}")
+    return dict(presets[name].get(engine, {}))
+
+
+def preset_time_limit(engine, preset=None, default=None):
+    """預設組中該引擎的求解時間上限（秒），未設定時回傳 default"""
+    return preset_parameters(engine, preset).get('max_time_in_seconds', default)
+
+
+def parameters_text(parameters):
+    """將 {參數: 值} 轉為 SatParameters 的文字格式"""
+    def value_text(value):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return str(value)
+    return ' '.join(f'{key}: {value_text(value)}' for key, value in parameters.items())
+
+
+def apply_parameters(solver, parameters):
+    """
+    將參數套用到 CpSolver（列舉欄位可用名稱）
+    @param solver: cp_model.CpSolver
+    @param parameters: dict, {SatParameters 欄位: 值}
+    """
+    if not parameters:
+        return
+    text = parameters_text(parameters)
+    if hasattr(solver.parameters, 'merge_text_format'):
+        # ortools >= 9.12：parameters 為 C++ 物件
+        if not solver.parameters.merge_text_format(text):
+            raise ValueError(f"無效的求解參數：{text}")
+    else:
+        from google.protobuf import text_format
+        text_format.Merge(text, solver.parameters)
+
+
+def configure_solver(solver, engine, preset=None, time_limit=None, num_workers=None):
+    """
+    套用預設組，再以明確指定的時間上限與執行緒數覆寫
+    @param solver: cp_model.CpSolver
+    @param engine: str, 'offday' | 'shift' | 'cpmodel'
+    @param preset: str, 預設組名稱（可選）
+    @param time_limit: float, 求解時間上限（秒，可選）
+    @param num_workers: int, 求解執行緒數（可選）
+    """
+    parameters = preset_parameters(engine, preset)
+    if time_limit is not None:
+        parameters['max_time_in_seconds'] = time_limit
+    if num_workers:
+        parameters['num_search_workers'] = num_workers
+    apply_parameters(solver, parameters)
+    return solver
@@ -2,6 +2,8 @@ from supabase import create_client
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor
 
 
 # 載入環境變數
@@ -46,6 +48,20 @@ def fetch_shift_requirements(cycle_id: int):
         print(f"Error fetching shift requirements: {e}")
         return {}
 
+def fetch_cycle_member_ids(cycle_id: int):
+    """取得週期成員的員工 ID"""
+    try:
+        response = (supabase
+            .from_('schedule_cycle_members')
+            .select('employee_id')
+            .eq('cycle_id', cycle_id)
+            .execute()
+        )
+        return {row['employee_id'] for row in response.data}
+    except Exception as e:
+        print(f"Error fetching cycle members: {e}")
+        return set()
+
 def fetch_employee_preferences():
     """獲取所有員工偏好設定"""
     try:
@@ -109,19 +125,23 @@ def fetch_schedule_cycle(cycle_id: int):
         print(f"Error fetching schedule cycle: {e}")
         return None 
     
-def fetch_shift_group(cycle_id: int):
-    """根據shift_group_name調取該班別群組的每週上班狀態"""
+def fetch_shift_group(cycle_id: int, shift_group_name=None):
+    """
+    根據shift_group_name調取該班別群組的每週上班狀態
+    @param shift_group_name: str, 班別群組名稱（可選）；已知時省去查詢 schedule_cycles 的一次往返
+    """
     try:
-        # 先查 cycle_id 取得 shift_group 名稱
-        cycle = (
-            supabase
-            .from_("schedule_cycles")
-            .select("shift_group")
-            .eq("cycle_id", cycle_id)   # cycle_id 改成實際的參數
-            .single()
-            .execute()
-        )
-        shift_group_name = cycle.data["shift_group"]
+        if shift_group_name is None:
+            # 先查 cycle_id 取得 shift_group 名稱
+            cycle = (
+                supabase
+                .from_("schedule_cycles")
+                .select("shift_group")
+                .eq("cycle_id", cycle_id)   # cycle_id 改成實際的參數
+                .single()
+                .execute()
+            )
+            shift_group_name = cycle.data["shift_group"]
         response = (
             supabase
             .from_('shift_group')
@@ -146,4 +166,255 @@ def fetch_shift_group(cycle_id: int):
             return None
     except Exception as e:
         print(f"Error fetching shift_group: {e}")
-        return None 
\ No newline at end of file
+        return None 
+
+def fetch_published_schedules(employee_ids, start_date, end_date):
+    """取得指定員工在日期區間內已發佈的班表（employee_schedules）"""
+    try:
+        response = (
+            supabase
+            .from_('employee_schedules')
+            .select('employee_id, work_date, shift_type')
+            .in_('employee_id', list(employee_ids))
+            .gte('work_date', str(start_date))
+            .lte('work_date', str(end_date))
+            .execute()
+        )
+        # 轉換為 {employee_id: {YYYY-MM-DD: 班別}}
+        schedules = {}
+        for row in response.data:
+            schedules.setdefault(row['employee_id'], {})[str(row['work_date'])] = row['shift_type'].strip()
+        return schedules
+    except Exception as e:
+        print(f"Error fetching published schedules: {e}")
+        return {}
+
+@dataclass
+class CycleInputs:
+    """單一週期的排班輸入，欄位與 fetch_cycle_inputs 回傳的 dict 相同"""
+    cycle: dict
+    employees: list
+    shift_requirements: dict
+    offdays: dict
+    preferences: dict
+    shift_group: dict
+
+    def to_dict(self):
+        """@return: dict, 可直接傳給 OffdayPlanner / CPMODEL 的 inputs 參數"""
+        return asdict(self)
+
+
+def member_inputs(employees, preferences, member_ids):
+    """
+    員工與偏好只保留週期成員（依員工 ID 排序），與 get_cycle_bundle 回傳的範圍一致
+    @param employees: list, fetch_employees 的結果
+    @param preferences: dict, fetch_employee_preferences 的結果
+    @param member_ids: set, 週期成員的員工 ID
+    @return: (list 員工, dict 偏好)
+    """
+    members = sorted((emp for emp in employees if emp['id'] in member_ids), key=lambda emp: emp['id'])
+    names = {emp['name'] for emp in members}
+    return members, {name: preference for name, preference in preferences.items() if name in names}
+
+
+def load_cycle_inputs(cycle_id: int, max_workers=6):
+    """
+    以執行緒池同時送出各項輸入查詢，等待時間約為最慢的一個查詢，而不是全部查詢的總和；
+    班別群組需要週期的 shift_group 名稱，於週期資料取得後立即查詢（不再另查 schedule_cycles）；
+    員工與偏好只保留週期成員，與 get_cycle_bundle 相同
+    @param cycle_id: 週期 ID
+    @param max_workers: int, 同時進行的查詢數
+    @return: CycleInputs
+    """
+    def shift_group_task(cycle_future):
+        cycle = cycle_future.result()
+        if not cycle:
+            return None
+        return fetch_shift_group(cycle_id, cycle['shift_group'])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        cycle = executor.submit(fetch_schedule_cycle, cycle_id)
+        employees = executor.submit(fetch_employees)
+        requirements = executor.submit(fetch_shift_requirements, cycle_id)
+        offdays = executor.submit(fetch_temp_offdays, cycle_id)
+        preferences = executor.submit(fetch_employee_preferences)
+        member_ids = executor.submit(fetch_cycle_member_ids, cycle_id)
+        # 在呼叫端執行緒等待週期資料，不佔用查詢用的執行緒
+        shift_group = shift_group_task(cycle)
+        members, member_preferences = member_inputs(employees.result(), preferences.result(), member_ids.result())
+        return CycleInputs(
+            cycle=cycle.result(),
+            employees=members,
+            shift_requirements=requirements.result(),
+            offdays=offdays.result(),
+            preferences=member_preferences,
+            shift_group=shift_group
+        )
+
+def fetch_cycle_bundle(cycle_id: int):
+    """
+    以資料庫函式 get_cycle_bundle（db_functions.sql）單次查詢取得週期的全部排班輸入，
+    只包含週期成員；函式尚未部署或呼叫失敗時改以 load_cycle_inputs 分別查詢
+    @param cycle_id: 週期 ID
+    @return: CycleInputs；找不到週期時 cycle 為 None
+    """
+    try:
+        bundle = supabase.rpc('get_cycle_bundle', {'p_cycle_id': cycle_id}).execute().data
+    except Exception as e:
+        print(f"Error fetching cycle bundle, falling back to separate queries: {e}")
+        return load_cycle_inputs(cycle_id)
+    if not bundle:
+        return CycleInputs(cycle=None, employees=[], shift_requirements={}, offdays={}, preferences={},
+                           shift_group=None)
+
+    # 轉換為與分別查詢相同的格式（休假日期為 date、星期為 int、缺少的班別需求補 0）
+    requirements = {
+        name: {'A': 0, 'B': 0, 'C': 0, **requirement}
+        for name, requirement in bundle['shift_requirements'].items()
+    }
+    offdays = {
+        name: [{'date': datetime.fromisoformat(item['date']).date(), 'type': item['type']} for item in items]
+        for name, items in bundle['offdays'].items()
+    }
+    shift_group = {int(weekday): items for weekday, items in bundle['shift_group'].items()} \
+        if bundle['shift_group'] else None
+    return CycleInputs(
+        cycle=bundle['cycle'],
+        employees=bundle['employees'],
+        shift_requirements=requirements,
+        offdays=offdays,
+        preferences=bundle['preferences'],
+        shift_group=shift_group
+    )
+
+def fetch_cycle_inputs(cycle_id: int):
+    """
+    一次取得排班模型所需的全部輸入，可直接傳給 OffdayPlanner / CPMODEL 的 inputs 參數，
+    讓多個求解器（例如 portfolio）共用同一份資料而不必各自查詢；
+    優先以 get_cycle_bundle 單次查詢（見 fetch_cycle_bundle），否則各查詢同時進行（見 load_cycle_inputs）
+    """
+    return fetch_cycle_bundle(cycle_id).to_dict()
+
+def fetch_draft_cycle_ids():
+    """取得所有尚未完成 (status = draft) 的週期 ID"""
+    try:
+        response = (
+            supabase
+            .from_('schedule_cycles')
+            .select('cycle_id')
+            .eq('status', 'draft')
+            .order('cycle_id')
+            .execute()
+        )
+        return [row['cycle_id'] for row in response.data]
+    except Exception as e:
+        print(f"Error fetching draft cycles: {e}")
+        return []
+
+def fetch_cycle_ids_in_range(start_date, end_date):
+    """取得與日期區間重疊的所有週期 ID（start_date <= 區間結束 且 end_date >= 區間開始）"""
+    try:
+        response = (
+            supabase
+            .from_('schedule_cycles')
+            .select('cycle_id')
+            .lte('start_date', str(end_date))
+            .gte('end_date', str(start_date))
+            .order('cycle_id')
+            .execute()
+        )
+        return [row['cycle_id'] for row in response.data]
+    except Exception as e:
+        print(f"Error fetching cycles in range: {e}")
+        return []
+
+def upsert_employee_schedules(rows):
+    """
+    以單次 upsert 寫入 employee_schedules，相同 (employee_id, work_date) 覆寫
+    @param rows: list, [{'employee_id', 'work_date', 'shift_type', 'shift_subtype', 'updated_at'}, ...]
+    @return: int, 寫入筆數
+    """
+    if not rows:
+        return 0
+    response = supabase.table('employee_schedules').upsert(rows, on_conflict='employee_id,work_date').execute()
+    return len(response.data) if response.data else len(rows)
+
+def fetch_cycles_inputs(cycle_ids):
+    """
+    批次取得多個週期的排班輸入，每張資料表只查詢一次（以 in_ 條件），
+    供批次排班 (batch_schedule.py) 預先載入
+    @return: dict, {cycle_id: 格式同 fetch_cycle_inputs}；找不到的週期不會出現在結果中
+    """
+    cycle_ids = list(cycle_ids)
+    try:
+        cycles = (
+            supabase
+            .from_('schedule_cycles')
+            .select('cycle_id, start_date, end_date, status, shift_group, cycle_comment')
+            .in_('cycle_id', cycle_ids)
+            .execute()
+        ).data
+        members = (
+            supabase
+            .from_('schedule_cycle_members')
+            .select('cycle_id, employee_id, snapshot_name, shift_type, required_days')
+            .in_('cycle_id', cycle_ids)
+            .execute()
+        ).data
+        offdays = (
+            supabase
+            .from_('schedule_cycle_temp_offdays')
+            .select('cycle_id, employees(name), offdate, offtype')
+            .in_('cycle_id', cycle_ids)
+            .execute()
+        ).data
+        group_names = sorted({cycle['shift_group'] for cycle in cycles if cycle['shift_group']})
+        groups = (
+            supabase
+            .from_('shift_group')
+            .select('group_name, weekday, shift_type(shift_name,shift_subname,shift_group),amount')
+            .in_('group_name', group_names)
+            .execute()
+        ).data if group_names else []
+    except Exception as e:
+        print(f"Error fetching cycles inputs: {e}")
+        return {}
+
+    # 員工與偏好為共用資料，只查詢一次，再依各週期成員篩選
+    employees = fetch_employees()
+    preferences = fetch_employee_preferences()
+
+    requirements, member_ids = {}, {}
+    for row in members:
+        member_ids.setdefault(row['cycle_id'], set()).add(row['employee_id'])
+        requirements.setdefault(row['cycle_id'], {}) \
+            .setdefault(row['snapshot_name'], {'A': 0, 'B': 0, 'C': 0})[row['shift_type']] = row['required_days']
+    off_date = {}
+    for row in offdays:
+        off_date.setdefault(row['cycle_id'], {}).setdefault(row['employees']['name'], []).append({
+            'date': datetime.fromisoformat(row['offdate']).date(),
+            'type': row['offtype']
+        })
+    shift_groups = {}
+    for row in groups:
+        shift_groups.setdefault(row['group_name'], {}).setdefault(row['weekday'], []).append({
+            'shift_name': row['shift_type']['shift_name'],
+            'shift_subname': row['shift_type']['shift_subname'],
+            'shift_group': row['shift_type']['shift_group'],
+            'amount': row['amount']
+        })
+
+    result = {}
+    for cycle in cycles:
+        # 員工與偏好只保留該週期的成員，與 get_cycle_bundle 相同
+        cycle_employees, cycle_preferences = member_inputs(employees, preferences,
+                                                           member_ids.get(cycle['cycle_id'], set()))
+        result[cycle['cycle_id']] = {
+            'cycle': cycle,
+            'employees': cycle_employees,
+            'shift_requirements': requirements.get(cycle['cycle_id'], {}),
+            'offdays': off_date.get(cycle['cycle_id'], {}),
+            'preferences': cycle_preferences,
+            'shift_group': shift_groups.get(cycle['shift_group'])
+        }
+    return result
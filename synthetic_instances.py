@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+synthetic_instances.py
+
+產生不需連線 Supabase 的合成排班週期，格式與 fetch_cycle_inputs 相同，
+供效能測試腳本 (bench_*.py) 直接傳入 OffdayPlanner / CPMODEL / run_auto_scheduling 的 inputs。
+"""
+
+import random
+from datetime import date, timedelta
+
+# 每週各日各班別需求（0=週一）
+DEFAULT_WEEKLY_DEMAND = {
+    weekday: ({'day': 3, 'evening': 2, 'night': 1} if weekday < 5 else
+              {'day': 2, 'evening': 1, 'night': 1} if weekday == 5 else
+              {'day': 1, 'evening': 1, 'night': 1})
+    for weekday in range(7)
+}
+SHIFT_GROUP_CONVERT = {'day': 'A', 'evening': 'B', 'night': 'C'}
+
+
+def make_cycle_inputs(employees=8, days=30, start=date(2025, 9, 1), seed=0, weekly_demand=None,
+                      red_off_ratio=0.5, blue_off_ratio=0.25, cycle_id=0):
+    """
+    產生一個可行的合成週期
+    @param employees: int, 員工人數
+    @param days: int, 週期天數
+    @param start: date, 週期開始日
+    @param seed: int, 亂數種子
+    @param weekly_demand: dict, {星期: {'day': n, 'evening': n, 'night': n}}，需求會依人數等比例放大
+    @param red_off_ratio: float, 有一天紅O的員工比例
+    @param blue_off_ratio: float, 有一天藍O的員工比例
+    @return: dict, {'cycle', 'employees', 'shift_requirements', 'offdays', 'preferences', 'shift_group'}
+    """
+    rnd = random.Random(seed)
+    scale = max(1, employees // 8)
+    weekly_demand = weekly_demand or {
+        weekday: {group: amount * scale for group, amount in demand.items()}
+        for weekday, demand in DEFAULT_WEEKLY_DEMAND.items()
+    }
+    shift_group = {
+        weekday: [
+            {'shift_name': group, 'shift_subname': group, 'shift_group': group, 'amount': amount}
+            for group, amount in demand.items()
+        ]
+        for weekday, demand in weekly_demand.items()
+    }
+
+    # 週期總需求依序平均分配給員工（先分 C 班，避免同一人 C 班過多）
+    totals = {'A': 0, 'B': 0, 'C': 0}
+    for i in range(days):
+        for group, amount in weekly_demand[(start + timedelta(days=i)).weekday()].items():
+            totals[SHIFT_GROUP_CONVERT[group]] += amount
+    names = [f'E{i:03d}' for i in range(employees)]
+    requirements = {name: {'A': 0, 'B': 0, 'C': 0} for name in names}
+    i = 0
+    for s in ['C', 'B', 'A']:
+        for _ in range(totals[s]):
+            requirements[names[i % employees]][s] += 1
+            i += 1
+
+    offdays = {}
+    for name in rnd.sample(names, int(employees * red_off_ratio)):
+        offdays.setdefault(name, []).append({'date': start + timedelta(days=rnd.randrange(days)), 'type': '紅O'})
+    for name in rnd.sample(names, int(employees * blue_off_ratio)):
+        offdays.setdefault(name, []).append({'date': start + timedelta(days=rnd.randrange(days)), 'type': '藍O'})
+
+    return {
+        'cycle': {
+            'cycle_id': cycle_id,
+            'start_date': start.isoformat(),
+            'end_date': (start + timedelta(days=days - 1)).isoformat(),
+            'status': 'draft',
+            'shift_group': 'synthetic'
+        },
+        'employees': [{'id': i + 1, 'name': name} for i, name in enumerate(names)],
+        'shift_requirements': requirements,
+        'offdays': offdays,
+        'preferences': {
+            name: {'max_continuous_days': False, 'continuous_C': False, 'double_off_after_C': False}
+            for name in names
+        },
+        'shift_group': shift_group
+    }
@@ -35,59 +35,105 @@ The script prints a CSV‑like table and writes **schedule.json** with
 """
 
 import json
-from datetime import datetime, timedelta
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
+import numpy as np
 from ortools.sat.python import cp_model
-from supabase_client import (
-    fetch_employees,
-    fetch_shift_requirements,
-    fetch_employee_preferences,
-    fetch_temp_offdays,
-    fetch_schedule_cycle,
-    fetch_shift_group
+from supabase_client import fetch_cycle_inputs
+from verify_shift import verify_shift_assignment, verify_shift_violations
+from schedule_hints import load_roster_hint, save_draft_result, repair_scope
+from cp_utils import (
+    add_tiered_deviation_penalty, add_sequence_automaton, check_encoding, SHIFT_LABELS,
+    symmetry_groups, add_lex_chain
+)
+from model_cache import ModelCache, canonical_inputs, inputs_hash
+from result_store import result_key, load_result, save_result
+from feasibility import analyze_inputs, format_report
+from solver_presets import configure_solver, preset_time_limit
+from schedule_index import (
+    ScheduleIndex, bool_var_array, var_indices, solution_values, weekdays_of, weekly_demand_matrix
 )
-from verify_shift import verify_shift_assignment
 from collections import defaultdict
 
+SHIFT_GROUP_CONVERT = {"day": "A", "evening": "B", "night": "C"}
+# 修補模式 penalty 時，未受變更影響的格子每改變一格的懲罰
+REPAIR_CHANGE_WEIGHT = 20
+# total_days_slack > 0 時，上班總天數每偏差一天的懲罰
+TOTAL_DAYS_DEVIATION_WEIGHT = 20
+
+def shift_group_demand(shift_group_raw):
+    """
+    將 fetch_shift_group 的結果整理為每週各日的班別需求
+    @param shift_group_raw: dict, {星期: [{'shift_group': 'day'|'evening'|'night', 'amount': int, ...}]}
+    @return: dict, {星期(0=週一): {'A': 人數, 'B': 人數, 'C': 人數}}
+    """
+    demand = {}
+    for weekday, shifts in shift_group_raw.items():
+        counter = defaultdict(int)
+        for value in shifts:
+            counter[value["shift_group"]] += value["amount"]
+        demand[int(weekday)] = dict((SHIFT_GROUP_CONVERT[key], value) for (key, value) in counter.items())
+    return demand
+
 # ===================== 第一階段：休假分配 =====================
 class OffdayPlanner:
-    def __init__(self, cycle_id):
+    def __init__(self, cycle_id, inputs=None, encoding='pairwise', num_workers=None, symmetry=False, preset=None):
+        """
+        @param cycle_id: 週期 ID
+        @param inputs: dict, 預先取得的輸入資料（格式同 supabase_client.fetch_cycle_inputs），
+                       未提供時由 Supabase 查詢
+        @param encoding: str, 'pairwise' 以 7 天滑動視窗限制連續上班；
+                         'automaton' 改為每位員工一條 AddAutomaton（最多連續上班 6 天）
+        @param num_workers: int, 求解執行緒數，預設依求解參數預設組（8）；批次同時求解多個週期時應調低
+        @param symmetry: bool, 是否對可互換的員工（需求、偏好、休假皆相同）加入字典序限制，預設關閉
+                         （CP-SAT 本身的對稱性偵測已涵蓋多數情況）；修補模式需關閉（各員工的基準班表不同）
+        @param preset: str, 求解參數預設組名稱（見 solver_presets.py），預設為 SOLVER_PRESET 或 'default'
+        """
         self.cycle_id = cycle_id
+        self.encoding = check_encoding(encoding)
+        self.num_workers = num_workers
+        self.preset = preset
+        self.symmetry = symmetry
+        # 上班總天數允許的偏差天數，預設為等式；分段求解 (rolling_horizon) 的中間視窗會放寬
+        self.total_days_slack = 0
         self.model = cp_model.CpModel()
-        self.load_data()
+        self.load_data(inputs)
 
-    def load_data(self):
+    def load_data(self, inputs=None):
+        if inputs is None:
+            # 各項輸入同時查詢
+            inputs = fetch_cycle_inputs(self.cycle_id)
         # 取得週期資訊
-        cycle_info = fetch_schedule_cycle(self.cycle_id)
+        cycle_info = inputs['cycle']
         if not cycle_info:
             raise ValueError(f"找不到 cycle_id={self.cycle_id} 的週期資料")
+        self.inputs = inputs
         self.start_date = datetime.fromisoformat(str(cycle_info['start_date']))
         self.end_date = datetime.fromisoformat(str(cycle_info['end_date']))
-        self.dates = [
-            (self.start_date + timedelta(days=i)).strftime('%Y-%m-%d')
-            for i in range((self.end_date - self.start_date).days + 1)
-        ]
-        self.D = len(self.dates)
 
         # 取得人員、需求、偏好、休假資料
-        self.employees_data = fetch_employees()
-        self.shift_req_data = fetch_shift_requirements(self.cycle_id)
-        self.offdays_raw = fetch_temp_offdays(self.cycle_id)
-        self.prefs_raw = fetch_employee_preferences()
-        self.shift_group_raw = fetch_shift_group(self.cycle_id)
+        self.employees_data = inputs['employees']
+        self.shift_req_data = inputs['shift_requirements']
+        self.offdays_raw = inputs['offdays']
+        self.prefs_raw = inputs['preferences']
+        self.shift_group_raw = inputs['shift_group']
         self.emp_names = [e['name'] for e in self.employees_data]
         self.E = len(self.emp_names)
         self.emp_idx = {name: i for i, name in enumerate(self.emp_names)}
 
+        # 日曆、每日需求矩陣、休假遮罩（整數索引）
+        self.index = ScheduleIndex(self.start_date, self.end_date, self.emp_names,
+                                   self.shift_group_raw, self.offdays_raw)
+        self.dates = self.index.date_strings
+        self.D = self.index.D
+
         # 需求、休假、偏好
-        #星期幾要上幾天的dict
-        #格式:{int(星期):int(天數)} =>星期使用星期一:0表示
-        self.shift_group_days={}
-        for weekday_num, shifts_amount in self.shift_group_raw.items():
-            counter = 0
-            for shiftsitem in shifts_amount:
-                counter+=shiftsitem['amount']
-            self.shift_group_days[weekday_num] = counter
+        #每日需要上班的總人數
+        #格式:np.ndarray(D)
+        self.daily_required = self.index.demand.sum(axis=1)
         #每個員工的上班總天數
         #格式:{str(員工):int(天數)}
         self.total_days_req = {
@@ -112,44 +158,62 @@ class OffdayPlanner:
             name: self.prefs_raw.get(name, {}).get('double_off_after_C', False)
             for name in self.emp_names
         }
+        #可互換的員工群組：班別需求、偏好、休假完全相同
+        #格式:[[str(員工), ...], ...]
+        self.symmetry_groups = symmetry_groups({
+            name: (
+                self.shift_req_data.get(name),
+                self.prefs_raw.get(name),
+                sorted((str(item['date']), item['type']) for item in self.offdays_raw.get(name, []))
+            )
+            for name in self.emp_names
+        }) if self.symmetry else []
+        self.symmetry_group_of = {name: names for names in self.symmetry_groups for name in names}
+
     def build_model(self):
-        # 建立決策變數
-        self.x = {
-            (e, d): self.model.NewBoolVar(f'x_{e}_{d}')
-            for e in range(self.E) for d in range(self.D)
-        }
+        # 建立決策變數 x[e, d]：員工 e 第 d 天是否上班
+        self.x = bool_var_array(self.model, (self.E, self.D), 'x')
+        self.x_index = var_indices(self.x)
+        rows = [self.x[e].tolist() for e in range(self.E)]
         # 硬性限制
         # 1. 硬限制:員工休假(紅O及特休)
-        for name, dates in self.offday_set.items():
-            e = self.emp_idx[name]
-            for d, date_str in enumerate(self.dates):
-                if date_str in dates:
-                    self.model.Add(self.x[e, d] == 0)
+        for e, d in zip(*np.nonzero(self.index.offday_mask())):
+            self.model.Add(self.x[e, d] == 0)
         # 2. 硬限制:每日需求(每日上班人數)
-        for d, date_str in enumerate(self.dates):
-            dt = datetime.strptime(date_str, '%Y-%m-%d')
-            # required = 6 if dt.weekday() <= 4 else (4 if dt.weekday() == 5 else 3)
-            required = self.shift_group_days[dt.weekday()]
-            self.model.Add(sum(self.x[e, d] for e in range(self.E)) >= required)
-        # 3. 硬限制:員工每月上班天數加總
-        for name in self.emp_names:
-            e = self.emp_idx[name]
-            self.model.Add(sum(self.x[e, d] for d in range(self.D)) == self.total_days_req[name])
+        for d in range(self.D):
+            self.model.Add(cp_model.LinearExpr.Sum(self.x[:, d].tolist()) >= int(self.daily_required[d]))
+        # 3. 硬限制:員工每月上班天數加總（total_days_slack > 0 時允許偏差，偏差天數加入懲罰）
+        total_deviations = []
+        for e, name in enumerate(self.emp_names):
+            total = cp_model.LinearExpr.Sum(rows[e])
+            if self.total_days_slack:
+                deviation = self.model.NewIntVar(0, self.total_days_slack, f'total_dev_{e}')
+                self.model.AddAbsEquality(deviation, total - self.total_days_req[name])
+                total_deviations.append(deviation)
+            else:
+                self.model.Add(total == self.total_days_req[name])
         # 4. 硬限制:14天連續上班天數(應休兩天) & 7天連續上班天數(應休一天)
         for e in range(self.E):
             for start in range(self.D - 13):
-                self.model.Add(sum(self.x[e, d] for d in range(start, start + 14)) <= 12)
-            for start in range(self.D - 6):
-                self.model.Add(sum(self.x[e, d] for d in range(start, start + 7)) <= 6)
+                self.model.Add(cp_model.LinearExpr.Sum(rows[e][start:start + 14]) <= 12)
+            if self.encoding == 'automaton':
+                # 7 天至少休 1 天等同最多連續上班 6 天
+                add_sequence_automaton(self.model, rows[e], labels={'O': 0, 'W': 1}, forbidden=(), max_run=6)
+            else:
+                for start in range(self.D - 6):
+                    self.model.Add(cp_model.LinearExpr.Sum(rows[e][start:start + 7]) <= 6)
+        # 5. 對稱性破除:可互換員工的上班/休假列依字典序遞減排列
+        for i, names in enumerate(self.symmetry_groups):
+            add_lex_chain(self.model, [rows[self.emp_idx[name]] for name in names], f'sym_{i}')
         # 軟性限制
-        self.penalties = []
+        self.penalties = [deviation * TOTAL_DAYS_DEVIATION_WEIGHT for deviation in total_deviations]
         # 5. 軟性限制:如果有選擇連續上班天數上限的員工，自動設置不超過五天
         for name in self.emp_names:
             if self.pref_max_cont[name]:
                 e = self.emp_idx[name]
                 for start in range(self.D - 5):
                     over = self.model.NewIntVar(0, 6, f'over_{e}_{start}')
-                    self.model.Add(over >= sum(self.x[e, d] for d in range(start, start + 6)) - 5)
+                    self.model.Add(over >= cp_model.LinearExpr.Sum(rows[e][start:start + 6]) - 5)
                     self.penalties.append(over)
         # 6. 軟性限制:盡量不出現OWO，也就是休假-上班-休假這種情況
         for e in range(self.E):
@@ -180,18 +244,156 @@ class OffdayPlanner:
                     self.penalties.append(not_double_off)
 
         if self.penalties:
-            self.model.Minimize(sum(self.penalties))
+            self.model.Minimize(cp_model.LinearExpr.Sum(self.penalties))
         else:
             self.model.Minimize(0)
 
+    def load_or_build_model(self, cache=None):
+        """
+        由模型快取載入第一階段模型，找不到時建模並存入快取
+        @param cache: model_cache.ModelCache（可選），None 時直接建模
+        @return: bool, 是否由快取載入
+        """
+        if cache is None:
+            self.build_model()
+            return False
+        key = inputs_hash(canonical_inputs(self.inputs), kind='offday', encoding=self.encoding,
+                          symmetry=self.symmetry, total_days_slack=self.total_days_slack)
+        cached = cache.get(key)
+        if cached:
+            self.model, meta = cached
+            self.x = np.empty((self.E, self.D), dtype=object)
+            for e, name in enumerate(self.emp_names):
+                for d, index in enumerate(meta['x'][name]):
+                    self.x[e, d] = self.model.GetBoolVarFromProtoIndex(index)
+            self.x_index = var_indices(self.x)
+            return True
+        self.build_model()
+        cache.put(key, self.model, {
+            'x': {name: self.x_index[e].tolist() for e, name in enumerate(self.emp_names)}
+        })
+        return False
+
+    def add_hints(self, hint):
+        """
+        以前次班表作為第一階段的 solution hint
+        @param hint: dict, {員工: [班別或 None, ...]}，來自 schedule_hints.load_roster_hint
+        """
+        hint = self.symmetric_hint(hint)
+        for name, row in hint.items():
+            e = self.emp_idx.get(name)
+            if e is None:
+                continue
+            for d, shift in enumerate(row[:self.D]):
+                if shift is None:
+                    continue
+                # 紅O/特休日一律提示為休假，避免提示值與硬限制衝突
+                works = shift in ('A', 'B', 'C') and self.dates[d] not in self.offday_set[name]
+                self.model.AddHint(self.x[e, d], int(works))
+
+    def symmetric_hint(self, hint):
+        """
+        可互換員工之間交換 hint 的列，使其符合字典序限制（組內任何排列都是等價的解）
+        @param hint: dict, {員工: [班別或 None, ...]}
+        @return: dict, 重新排列後的 hint
+        """
+        hint = dict(hint)
+        for names in self.symmetry_groups:
+            if not all(name in hint for name in names):
+                continue
+            rows = sorted((hint[name] for name in names), reverse=True,
+                          key=lambda row: [int(shift in ('A', 'B', 'C')) for shift in row[:self.D]])
+            hint.update(zip(names, rows))
+        return hint
+
+    def add_repair(self, base, free_employees=(), free_days=(), mode='fix', weight=REPAIR_CHANGE_WEIGHT):
+        """
+        修補模式：以現有班表為基準，只重新安排受變更影響的員工（整列）與日期（整欄），
+        其餘格子固定 (fix) 或允許改變但每格加權懲罰 (penalty)。需在 build_model 之後呼叫。
+        @param base: dict, {員工: [班別或 None, ...]}，對齊本週期日期的現有班表
+        @param free_employees: iterable, 可重新安排的員工
+        @param free_days: iterable, 可重新安排的日期索引
+        @param mode: str, 'fix' 或 'penalty'
+        @param weight: int, penalty 模式下每改變一格的懲罰
+        """
+        free_employees, free_days = set(free_employees), set(free_days)
+        changes = []
+        for name, row in base.items():
+            e = self.emp_idx.get(name)
+            if e is None or name in free_employees:
+                continue
+            for d, shift in enumerate(row[:self.D]):
+                if shift is None or d in free_days:
+                    continue
+                works = int(shift in ('A', 'B', 'C'))
+                if mode == 'fix':
+                    self.model.Add(self.x[e, d] == works)
+                else:
+                    changes.append(1 - self.x[e, d] if works else self.x[e, d])
+        if changes:
+            Sum = cp_model.LinearExpr.Sum
+            self.model.Minimize(Sum(self.penalties) + weight * Sum(changes))
+
+    def add_solution_hint(self, schedule):
+        """
+        以上一次的第一階段解取代現有 hint，供加入新限制後重新求解
+        @param schedule: dict, {員工: [0/1, ...]}
+        """
+        self.model.ClearHints()
+        for name, row in schedule.items():
+            e = self.emp_idx[name]
+            for d, value in enumerate(row):
+                self.model.AddHint(self.x[e, d], int(value))
+
+    def add_violation_cuts(self, violations, schedule):
+        """
+        將驗證失敗項目中屬於第一階段（上班/休假）的部分轉為限制條件。
+        只加入目前第一階段解 (schedule) 確實違反的限制，回傳新增數量；
+        回傳 0 代表第一階段解不需要更動。
+        @param violations: list, 來自 verify_shift_violations
+        @param schedule: dict, {員工: [0/1, ...]}，目前的第一階段解
+        """
+        if not hasattr(self, 'cut_keys'):
+            self.cut_keys = set()
+        added = 0
+        for v in violations:
+            if v['rule'] == 'continuous_work':
+                # 連續上班超過7天：區間內任意連續8天至少休1天
+                # 有字典序限制時同組員工一併加入，維持組內對稱
+                row = schedule[v['employee']]
+                for start in range(v['start_index'], v['end_index'] - 6):
+                    if sum(row[start:start + 8]) <= 7:
+                        continue
+                    for name in self.symmetry_group_of.get(v['employee'], [v['employee']]):
+                        e = self.emp_idx[name]
+                        key = ('continuous', e, start)
+                        if key in self.cut_keys:
+                            continue
+                        self.cut_keys.add(key)
+                        self.model.Add(sum(self.x[e, d] for d in range(start, start + 8)) <= 7)
+                        added += 1
+            elif v['rule'] == 'daily_staffing':
+                # 某班別人數不足：當天能上該班別（需求天數>0）的上班人數至少要達到需求
+                d, s = v['date_index'], v['shift']
+                eligible = [name for name in self.emp_names if self.shift_req_data.get(name, {}).get(s, 0) > 0]
+                key = ('staffing', d, s)
+                if key in self.cut_keys or sum(schedule[name][d] for name in eligible) >= v['required']:
+                    continue
+                self.cut_keys.add(key)
+                self.model.Add(sum(self.x[self.emp_idx[name], d] for name in eligible) >= v['required'])
+                added += 1
+        return added
+
 # ---------------------------------------------------------------------------
 # Solve
 # ---------------------------------------------------------------------------
-    def solve(self):
-        solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 30
-        solver.parameters.num_search_workers = 8
-        status = solver.Solve(self.model)
+    def solve(self, callback=None, time_limit=None):
+        """
+        @param callback: cp_model.CpSolverSolutionCallback, 每找到更佳解時呼叫（可選）
+        @param time_limit: float, 求解時間上限（秒），未提供時依求解參數預設組
+        """
+        solver = configure_solver(cp_model.CpSolver(), 'offday', self.preset, time_limit, self.num_workers)
+        status = solver.Solve(self.model, callback)
         return solver, status
 
     def format_result(self, solver, status):
@@ -203,8 +405,9 @@ class OffdayPlanner:
             'raw_table': []
         }
         if result['status'] == 'success':
+            values = solution_values(solver, self.x_index)
             for e, name in enumerate(self.emp_names):
-                row = [int(solver.Value(self.x[e, d])) for d in range(self.D)]
+                row = values[e].tolist()
                 result['schedule'][name] = row
                 result['raw_table'].append([name] + row)
             result['message'] = '排班成功'
@@ -219,9 +422,15 @@ class OffdayPlanner:
         for row in result['raw_table']:
             print(','.join([str(x) for x in row]))
 
-    def run(self):
-        self.build_model()
-        solver, status = self.solve()
+    def run(self, callback=None, hint=None, time_limit=None, cache=None):
+        self.load_or_build_model(cache)
+        if hint:
+            self.add_hints(hint)
+        return self.resolve(callback, time_limit)
+
+    def resolve(self, callback=None, time_limit=None):
+        """在現有模型（含後續加入的限制與 hint）上求解，不重建模型"""
+        solver, status = self.solve(callback, time_limit)
         result = self.format_result(solver, status)
         self.print_table(result)
         return result
@@ -229,22 +438,32 @@ class OffdayPlanner:
 # ===================== 第二階段：班別分配 =====================
 
 class ShiftAssignmentSolver:
-    def __init__(self, first_stage_result, shift_requirements, offdays_raw, shift_group, dates=None):
+    def __init__(self, first_stage_result, shift_requirements, offdays_raw, shift_group, dates=None,
+                 encoding='pairwise', num_workers=None, symmetry=False, preset=None):
         """
         first_stage_result: dict, 來自第一階段的 result['schedule']，格式 {員工: [0/1, ...]}
         shift_requirements: dict, 來自第一階段的shift_req_data
         offdays_raw: dict, 來自第一階段的offdays_raw
         dates: list, 日期字串清單（可選，若有則用於藍O判斷）
         shift_group:dict, 來自第一階段的shift_group_raw
+        encoding: str, 'pairwise' 以逐對約束限制班別銜接；'automaton' 改為每位員工一條 AddAutomaton
+        num_workers: int, 求解執行緒數（可選），未提供時由 CP-SAT 依 CPU 核心數決定
+        symmetry: bool, 是否對可互換的員工（第一階段上班日、班別需求、藍O 皆相同）加入字典序限制
+        preset: str, 求解參數預設組名稱（見 solver_presets.py）
         """
         self.model = cp_model.CpModel()
+        self.encoding = check_encoding(encoding)
+        self.num_workers = num_workers
+        self.preset = preset
+        self.symmetry = symmetry
+        self.first_stage_result = first_stage_result
         self.employees = list(first_stage_result.keys())
         self.D = len(next(iter(first_stage_result.values())))
         self.shifts = ['A', 'B', 'C']
         self.shift_requirements = shift_requirements
         self.offdays_raw = offdays_raw
         self.shift_group_raw = shift_group
-        self.shift_group_convert = {"day":"A","evening":"B","night":"C"}
+        self.shift_group_convert = SHIFT_GROUP_CONVERT
         self.dates = dates if dates is not None else [str(i) for i in range(self.D)]
         
         # print(self.employees)
@@ -253,12 +472,17 @@ class ShiftAssignmentSolver:
         # 取得藍O日期
         self.blue_off = {name: set(item['date'] for item in offdays_raw.get(name, []) if item['type'] == '藍O') for name in self.employees}
         #整理shift_group_raw
-        self.shift_group={}
-        for weekday,shifts in self.shift_group_raw.items():
-            counter = defaultdict(int)
-            for value in shifts:
-                counter[value["shift_group"]] += value["amount"]
-            self.shift_group[weekday] = dict((self.shift_group_convert[key], value) for (key, value) in counter.items())
+        self.shift_group = shift_group_demand(self.shift_group_raw)
+        # 可互換的員工群組
+        self.symmetry_groups = symmetry_groups({
+            name: (
+                [int(value) for value in first_stage_result[name]],
+                self.shift_requirements[name],
+                sorted(str(day) for day in self.blue_off[name])
+            )
+            for name in self.employees
+        }) if symmetry else []
+        self.symmetry_group_of = {name: names for names in self.symmetry_groups for name in names}
         # 只針對 W 的日子建立班別決策變數
         self.x = {}  # (e, d, s): BoolVar
         for e, name in enumerate(self.employees):
@@ -271,53 +495,40 @@ class ShiftAssignmentSolver:
         # 1. 每個 W 的日子只能排一種班
         for e, name in enumerate(self.employees):
             for d in range(self.D):
-                if any(self.x.get((e, d, s)) is not None for s in self.shifts):
-                    self.model.Add(sum(self.x[(e, d, s)] for s in self.shifts if self.x.get((e, d, s)) is not None) == 1)
+                if self.x.get((e, d, 'A')) is not None:
+                    self.model.Add(cp_model.LinearExpr.Sum([self.x[(e, d, s)] for s in self.shifts]) == 1)
         
         # 2. 硬限制:每日需求(每日上班人數)
         # 改為軟限制，避免與其他限制衝突導致無解
+        # 每日各班別需求矩陣 (D x 3)，依日期的星期幾對應班別群組設定
+        demand = weekly_demand_matrix(self.shift_group_raw)[weekdays_of(self.dates)]
+        staff = defaultdict(list)
+        for (e, d, s), var in self.x.items():
+            staff[d, s].append(var)
         self.daily_penalties = []
         for d in range(self.D):
-            # 取得該日期對應的星期幾
-            date_str = self.dates[d]
-            dt = datetime.strptime(date_str, '%Y-%m-%d')
-            weekday = dt.weekday()  # Monday = 0, Sunday = 6
-            
-            # 根據星期幾設定每日班別需求
-            daily_req = self.shift_group[weekday]
-            # if weekday <= 4:  # 週一到週五
-            #     daily_req = {'A': 3, 'B': 2, 'C': 1}
-            # elif weekday == 5:  # 週六
-            #     daily_req = {'A': 2, 'B': 1, 'C': 1}
-            # else:  # 週日
-            #     daily_req = {'A': 1, 'B': 1, 'C': 1}
             # 加入每日班別需求限制（懲罰不足的情況）
-            for s in self.shifts:
-                # if daily_req[s] > 0:
-                #     pol=sum(self.x[(e, d, s)] for e, name in enumerate(self.employees) if self.x.get((e, d, s)) is not None) == daily_req[s]
-                #     # print(pol)
-                #     self.model.Add(pol)
-
-                if daily_req[s] > 0:
-                    actual = sum(self.x[(e, d, s)] for e, name in enumerate(self.employees) if self.x.get((e, d, s)) is not None)
-                    # print(actual)
-                    shortage = self.model.NewIntVar(0, daily_req[s], f'shortage_{d}_{s}')
-                    self.model.Add(shortage >= daily_req[s] - actual)
+            for k, s in enumerate(self.shifts):
+                required = int(demand[d, k])
+                if required > 0:
+                    shortage = self.model.NewIntVar(0, required, f'shortage_{d}_{s}')
+                    self.model.Add(shortage >= required - cp_model.LinearExpr.Sum(staff[d, s]))
                     self.daily_penalties.append(shortage * 100)  # 每日需求不足的懲罰權重
 
-        
-        
         # 3. 硬限制: 班與班之間必須休息超過11小時
-        for e, name in enumerate(self.employees):
-            for d in range(self.D - 1):
-                # C班後不可A/B
-                if self.x.get((e, d, 'C')) is not None and self.x.get((e, d+1, 'A')) is not None:
-                    self.model.Add(self.x[(e, d, 'C')] + self.x[(e, d+1, 'A')] <= 1)
-                if self.x.get((e, d, 'C')) is not None and self.x.get((e, d+1, 'B')) is not None:
-                    self.model.Add(self.x[(e, d, 'C')] + self.x[(e, d+1, 'B')] <= 1)
-                # B班後不可A
-                if self.x.get((e, d, 'B')) is not None and self.x.get((e, d+1, 'A')) is not None:
-                    self.model.Add(self.x[(e, d, 'B')] + self.x[(e, d+1, 'A')] <= 1)
+        if self.encoding == 'automaton':
+            self.add_transition_automata()
+        else:
+            for e, name in enumerate(self.employees):
+                for d in range(self.D - 1):
+                    # C班後不可A/B
+                    if self.x.get((e, d, 'C')) is not None and self.x.get((e, d+1, 'A')) is not None:
+                        self.model.Add(self.x[(e, d, 'C')] + self.x[(e, d+1, 'A')] <= 1)
+                    if self.x.get((e, d, 'C')) is not None and self.x.get((e, d+1, 'B')) is not None:
+                        self.model.Add(self.x[(e, d, 'C')] + self.x[(e, d+1, 'B')] <= 1)
+                    # B班後不可A
+                    if self.x.get((e, d, 'B')) is not None and self.x.get((e, d+1, 'A')) is not None:
+                        self.model.Add(self.x[(e, d, 'B')] + self.x[(e, d+1, 'A')] <= 1)
 
         # 4. 硬限制: shift_requirements==0 的班別嚴格禁止
         for e, name in enumerate(self.employees):
@@ -327,34 +538,157 @@ class ShiftAssignmentSolver:
                         if self.x.get((e, d, s)) is not None:
                             self.model.Add(self.x[(e, d, s)] == 0)
 
+        # 5. 對稱性破除: 可互換員工在上班日的班別代碼 (A=1, B=2, C=3) 依字典序遞減排列
+        for i, names in enumerate(self.symmetry_groups):
+            rows = []
+            for name in names:
+                e = self.employees.index(name)
+                rows.append([
+                    sum(SHIFT_LABELS[s] * self.x[(e, d, s)] for s in self.shifts)
+                    for d in range(self.D) if self.x.get((e, d, 'A')) is not None
+                ])
+            if rows[0]:
+                add_lex_chain(self.model, rows, f'shift_sym_{i}')
+
+    def load_or_build_model(self, cache=None):
+        """
+        由模型快取載入第二階段模型（硬限制 + 軟限制），找不到時建模並存入快取
+        @param cache: model_cache.ModelCache（可選），None 時直接建模
+        @return: bool, 是否由快取載入
+        """
+        if cache is None:
+            self.add_constraints()
+            self.add_soft_constraints()
+            return False
+        key = inputs_hash({
+            'dates': self.dates,
+            'first_stage': self.first_stage_result,
+            'shift_requirements': {name: self.shift_requirements[name] for name in self.employees},
+            'blue_off': {name: sorted(str(day) for day in days) for name, days in self.blue_off.items()},
+            'shift_group': self.shift_group
+        }, kind='shift', encoding=self.encoding, symmetry=self.symmetry)
+        cached = cache.get(key)
+        if cached:
+            self.model, meta = cached
+            self.x = {(e, d, s): self.model.GetBoolVarFromProtoIndex(index) for e, d, s, index in meta['x']}
+            return True
+        self.add_constraints()
+        self.add_soft_constraints()
+        cache.put(key, self.model, {'x': [[e, d, s, var.Index()] for (e, d, s), var in self.x.items()]})
+        return False
+
+    def add_transition_automata(self):
+        """每位員工以每日班別整數變數（O=0, A=1, B=2, C=3）加入一條班別銜接自動機"""
+        for e, name in enumerate(self.employees):
+            day_shifts = []
+            for d in range(self.D):
+                work = [(SHIFT_LABELS[s], self.x[(e, d, s)]) for s in self.shifts if self.x.get((e, d, s)) is not None]
+                if not work:
+                    day_shifts.append(SHIFT_LABELS['O'])
+                    continue
+                shift_var = self.model.NewIntVar(1, 3, f'shift_{name}_{d}')
+                for label, var in work:
+                    self.model.Add(shift_var == label).OnlyEnforceIf(var)
+                day_shifts.append(shift_var)
+            add_sequence_automaton(self.model, day_shifts)
+
+    def add_hints(self, hint):
+        """
+        以前次班表作為第二階段的 solution hint，只提示本次需上班的日子
+        @param hint: dict, {員工: [班別或 None, ...]}
+        """
+        hint = dict(hint)
+        for names in self.symmetry_groups:
+            # 組內依字典序限制重新分配 hint 的列
+            if all(name in hint for name in names):
+                rows = sorted((hint[name] for name in names), reverse=True,
+                              key=lambda row: [SHIFT_LABELS.get(shift, 0) for shift in row[:self.D]])
+                hint.update(zip(names, rows))
+        for e, name in enumerate(self.employees):
+            row = hint.get(name)
+            if not row:
+                continue
+            for d, shift in enumerate(row[:self.D]):
+                if shift not in self.shifts or self.x.get((e, d, shift)) is None:
+                    continue
+                for s in self.shifts:
+                    if self.x.get((e, d, s)) is not None:
+                        self.model.AddHint(self.x[(e, d, s)], int(s == shift))
+
+    def add_repair(self, base, free_employees=(), free_days=(), mode='fix', weight=REPAIR_CHANGE_WEIGHT):
+        """
+        修補模式：本次仍需上班且原本班別可排的格子維持原班別 (fix)，或改變時加權懲罰 (penalty)。
+        需在 add_soft_constraints 之後呼叫；參數同 OffdayPlanner.add_repair
+        """
+        free_employees, free_days = set(free_employees), set(free_days)
+        changes = []
+        for e, name in enumerate(self.employees):
+            if name in free_employees or name not in base:
+                continue
+            for d, shift in enumerate(base[name][:self.D]):
+                var = self.x.get((e, d, shift))
+                if var is None or d in free_days:
+                    continue
+                if mode == 'fix':
+                    self.model.Add(var == 1)
+                else:
+                    changes.append(1 - var)
+        if changes:
+            Sum = cp_model.LinearExpr.Sum
+            self.model.Minimize(Sum(self.penalties + self.daily_penalties) + weight * Sum(changes))
+
+    def add_solution_hint(self, shift_result):
+        """以上一次的第二階段解取代現有 hint，供加入新限制後重新求解"""
+        self.model.ClearHints()
+        self.add_hints(shift_result)
+
+    def add_violation_cuts(self, violations):
+        """
+        將驗證失敗項目中屬於第二階段（班別分配）的部分轉為硬限制，回傳新增數量。
+        同一條限制只會加入一次，回傳 0 代表沒有新的限制可加（重新求解不會有進展）。
+        @param violations: list, 來自 verify_shift_violations
+        """
+        if not hasattr(self, 'cut_keys'):
+            self.cut_keys = set()
+        added = 0
+        for v in violations:
+            if v['rule'] == 'shift_connection':
+                # C班後接A/B班：禁止這個員工在這兩天出現同樣的銜接（同組可互換員工一併加入）
+                d = v['date_index']
+                for name in self.symmetry_group_of.get(v['employee'], [v['employee']]):
+                    e = self.employees.index(name)
+                    key = ('connection', e, d, v['next_shift'])
+                    first = self.x.get((e, d, v['shift']))
+                    second = self.x.get((e, d + 1, v['next_shift']))
+                    if key in self.cut_keys or first is None or second is None:
+                        continue
+                    self.cut_keys.add(key)
+                    self.model.Add(first + second <= 1)
+                    added += 1
+            elif v['rule'] == 'daily_staffing':
+                # 某班別人數不足：由軟限制改為當天該班別的硬性下限
+                d, s = v['date_index'], v['shift']
+                key = ('staffing', d, s)
+                if key in self.cut_keys:
+                    continue
+                self.cut_keys.add(key)
+                self.model.Add(sum(self.x[(e, d, s)] for e in range(len(self.employees))
+                                   if self.x.get((e, d, s)) is not None) >= v['required'])
+                added += 1
+        return added
+
     def add_soft_constraints(self):
         self.penalties = []
 
         # 5. 軟限制: 各班別總和與需求相差0不罰，正負1/2/3天分別懲罰
+        assigned = defaultdict(list)
+        for (e, d, s), var in self.x.items():
+            assigned[e, s].append(var)
         for e, name in enumerate(self.employees):
             for s in self.shifts:
-                total = sum(self.x[(e, d, s)] for d in range(self.D) if self.x.get((e, d, s)) is not None)
+                total = cp_model.LinearExpr.Sum(assigned[e, s])
                 required = self.shift_requirements[name][s]
-                diff = self.model.NewIntVar(-self.D, self.D, f'diff_{name}_{s}')
-                self.model.Add(diff == total - required)
-                # 懲罰正負1天
-                penalty1 = self.model.NewBoolVar(f'penalty1_{name}_{s}')
-                self.model.AddAbsEquality(penalty1, diff)
-                self.model.Add(penalty1 == 1).OnlyEnforceIf(penalty1)
-                self.model.Add(penalty1 != 1).OnlyEnforceIf(penalty1.Not())
-                self.penalties.append(penalty1 * 15)
-                # 懲罰正負2天
-                penalty2 = self.model.NewBoolVar(f'penalty2_{name}_{s}')
-                self.model.AddAbsEquality(penalty2, diff)
-                self.model.Add(penalty2 == 2).OnlyEnforceIf(penalty2)
-                self.model.Add(penalty2 != 2).OnlyEnforceIf(penalty2.Not())
-                self.penalties.append(penalty2 * 30)
-                # 懲罰正負3天
-                penalty3 = self.model.NewBoolVar(f'penalty3_{name}_{s}')
-                self.model.AddAbsEquality(penalty3, diff)
-                self.model.Add(penalty3 == 3).OnlyEnforceIf(penalty3)
-                self.model.Add(penalty3 != 3).OnlyEnforceIf(penalty3.Not())
-                self.penalties.append(penalty3 * 50)
+                self.penalties.append(add_tiered_deviation_penalty(self.model, total, required, f'{name}_{s}'))
 
         # 6. 軟限制: 藍O日安排任何班別都罰50
         for e, name in enumerate(self.employees):
@@ -364,47 +698,206 @@ class ShiftAssignmentSolver:
                         if self.x.get((e, d, s)) is not None:
                             self.penalties.append(self.x[(e, d, s)] * 50)
 
-        if self.penalties:
-            self.model.Minimize(sum(self.penalties) + sum(self.daily_penalties))
-        else:
-            self.model.Minimize(sum(self.daily_penalties))
-    def solve(self):
-        solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 300
-        status = solver.Solve(self.model)
+        self.model.Minimize(cp_model.LinearExpr.Sum(self.penalties + self.daily_penalties))
+    def solve(self, callback=None, time_limit=None):
+        """
+        @param callback: cp_model.CpSolverSolutionCallback, 每找到更佳解時呼叫（可選）
+        @param time_limit: float, 求解時間上限（秒），未提供時依求解參數預設組
+        """
+        solver = configure_solver(cp_model.CpSolver(), 'shift', self.preset, time_limit, self.num_workers)
+        status = solver.Solve(self.model, callback)
         return solver, status
 
     def get_result(self, solver, status):
         result = {}
         if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            keys = list(self.x)
+            values = solution_values(solver, var_indices([self.x[key] for key in keys]))
+            # 未上班或上班但沒排到班的日子標記為O
+            rows = [['O'] * self.D for _ in self.employees]
+            for (e, d, s), value in zip(keys, values):
+                if value:
+                    rows[e][d] = s
             for e, name in enumerate(self.employees):
-                result[name] = []
-                for d in range(self.D):
-                    if any(self.x.get((e, d, s)) is not None for s in self.shifts):
-                        for s in self.shifts:
-                            var = self.x.get((e, d, s))
-                            if var is not None and solver.Value(var):
-                                result[name].append(s)
-                                break
-                        else:
-                            # 若該天有W但沒排到班，標記為O
-                            result[name].append('O')
-                    else:
-                        result[name].append('O')
+                result[name] = rows[e]
         return result
 
 # ===================== 主流程串接 =====================
 
-def run_auto_scheduling(cycle_id):
+class ScheduleReporter:
+    """
+    排班流程的進度回報介面，預設不做任何事。
+    背景工作 (schedule_jobs.py) 會覆寫此類別，把進度與中間解寫回 API 端可查詢的位置。
+    """
+    def progress(self, stage, message):
+        pass
+
+    def solution(self, event):
+        """求解器每找到更佳解時呼叫，event 格式見 SolutionStreamCallback"""
+        pass
+
+    def should_stop(self):
+        """回傳 True 時求解器停止搜尋並採用目前最佳解"""
+        return False
+
+# 有整體時間上限 (deadline) 時，每次求解最多使用剩餘時間的比例：
+# 第一階段保留大部分時間給第二階段，第二階段每一輪保留一部分給驗證失敗後的下一輪
+DEADLINE_SHARE = {'offday': 0.3, 'shift': 0.6}
+
+class SolutionStreamCallback(cp_model.CpSolverSolutionCallback):
+    """
+    將每個更佳的中間解轉交給 reporter
+    event 格式: {
+        "stage": "first" | "second",
+        "solution_index": int,
+        "objective": float,
+        "elapsed": float (秒),
+        "schedule": {員工: [0/1 或 班別, ...]}
+    }
+    """
+    def __init__(self, stage, reporter, extract_schedule):
+        """
+        @param stage: str, 'first' 或 'second'
+        @param reporter: ScheduleReporter
+        @param extract_schedule: callable(callback) -> dict, 由目前解取出班表矩陣
+        """
+        super().__init__()
+        self.stage = stage
+        self.reporter = reporter
+        self.extract_schedule = extract_schedule
+        self.solution_count = 0
+
+    def on_solution_callback(self):
+        self.solution_count += 1
+        self.reporter.solution({
+            'stage': self.stage,
+            'solution_index': self.solution_count,
+            'objective': self.ObjectiveValue(),
+            'elapsed': round(self.WallTime(), 3),
+            'schedule': self.extract_schedule(self)
+        })
+        if self.reporter.should_stop():
+            self.StopSearch()
+
+    @contextmanager
+    def watch_stop(self, interval=0.5):
+        """
+        求解期間定時檢查 reporter.should_stop()，使停止要求在沒有新解時也能即時生效
+        @param interval: float, 檢查間隔（秒）
+        """
+        done = threading.Event()
+
+        def poll():
+            while not done.wait(interval):
+                if self.reporter.should_stop():
+                    self.StopSearch()
+                    return
+
+        watcher = threading.Thread(target=poll, daemon=True)
+        watcher.start()
+        try:
+            yield self
+        finally:
+            done.set()
+            watcher.join()
+
+def run_auto_scheduling(cycle_id, reporter=None, use_hints=True, inputs=None, deadline=None, encoding='pairwise',
+                        use_cache=True, force=False, repair=None, num_workers=None, symmetry=False, preset=None):
     """
     執行自動排班流程，回傳 JSON 格式結果
     @param cycle_id: 週期 ID
+    @param reporter: ScheduleReporter, 進度回報物件（可選）
+    @param use_hints: bool, 是否以前次班表（同週期草稿或已發佈班表）暖啟動求解
+    @param inputs: dict, 預先取得的輸入資料（可選，格式同 fetch_cycle_inputs）
+    @param deadline: float, 整個流程的求解時間上限（秒，可選）；未提供時各階段使用預設上限
+    @param encoding: str, 班別銜接與連續上班限制的寫法，'pairwise' 或 'automaton'
+    @param use_cache: bool, 是否使用本機模型快取（輸入資料相同時跳過建模）
+    @param force: bool, 忽略排班結果快取，一律重新求解
+    @param repair: 修補模式（可選）。True 時比對上次草稿的輸入自動判斷變更範圍；
+                   dict {'employees': [...], 'dates': ['YYYY-MM-DD', ...]} 時只重排指定的員工與日期；
+                   其餘格子維持草稿班表，固定後無解時改為允許變動但加權懲罰。找不到草稿時照常完整排班
+    @param num_workers: int, 每個階段的求解執行緒數（可選），批次排班時用來分配 CPU
+    @param symmetry: bool, 是否對可互換的員工加入字典序限制（預設關閉，修補模式一律關閉）
+    @param preset: str, 求解參數預設組名稱（見 solver_presets.py），各階段的時間上限與搜尋參數取自預設組
     @return: dict, 包含排班結果的 JSON 格式資料
     """
+    reporter = reporter or ScheduleReporter()
+    cache = ModelCache() if use_cache else None
+    started = time.time()
+
+    def time_limit(engine):
+        # 各階段的求解上限取自求解參數預設組，且不超過整體剩餘時間中該階段可用的比例（見 DEADLINE_SHARE）
+        default = preset_time_limit(engine, preset)
+        if deadline is None:
+            return default
+        remaining = (deadline - (time.time() - started)) * DEADLINE_SHARE[engine]
+        return max(1.0, remaining if default is None else min(default, remaining))
+
     try:
         # 第一階段：休假安排
-        planner = OffdayPlanner(cycle_id=cycle_id)
-        first_stage_result = planner.run()
+        reporter.progress('first', '第一階段：休假安排求解中')
+        planner = OffdayPlanner(cycle_id=cycle_id, inputs=inputs, encoding=encoding, num_workers=num_workers,
+                                symmetry=symmetry, preset=preset)
+        # 輸入資料與參數都沒變時直接沿用上次通過驗證的結果
+        stored_key = result_key(planner.inputs, encoding=encoding, deadline=deadline, repair=repair,
+                                symmetry=symmetry, preset=preset)
+        stored = None if force else load_result(cycle_id, stored_key)
+        if stored:
+            stored['data']['cached'] = True
+            reporter.progress('complete', '輸入資料未變更，沿用上次的排班結果')
+            return stored
+        # 求解前先檢查輸入資料，一定無解時直接回報，不建立模型
+        feasibility = analyze_inputs(planner.inputs)
+        if not feasibility['feasible']:
+            return {
+                'success': False,
+                'message': f'輸入資料無法排班: {format_report(feasibility)}',
+                'stage': 'precheck',
+                'data': {
+                    'cycle_id': cycle_id,
+                    'feasibility': feasibility
+                }
+            }
+        scope = None
+        if repair:
+            explicit = repair if isinstance(repair, dict) else {}
+            scope = repair_scope(cycle_id, planner.inputs, planner.dates,
+                                 explicit.get('employees'), explicit.get('dates'))
+            if scope is None:
+                reporter.progress('first', '找不到可修補的草稿班表，改為完整排班')
+        hint = {}
+        if scope:
+            # 修補模式的目標函數需加入變動懲罰，不使用模型快取
+            base, free_employees, free_days = scope
+            hint = base
+            cache = None
+        elif use_hints:
+            try:
+                hint = load_roster_hint(cycle_id, planner.employees_data, planner.dates)
+            except Exception as e:
+                # hint 只影響求解速度，載入失敗時照常從頭求解
+                print(f"載入前次班表 hint 失敗: {e}")
+        # 中間解可直接沿用 format_result 取值（callback 與 solver 皆提供 Value）
+        first_callback = SolutionStreamCallback(
+            'first', reporter,
+            lambda cb: planner.format_result(cb, cp_model.FEASIBLE)['schedule']
+        )
+        if scope:
+            for first_repair_mode in ('fix', 'penalty'):
+                reporter.progress('first', f'第一階段：修補模式 ({first_repair_mode}) 求解中')
+                planner = OffdayPlanner(cycle_id=cycle_id, inputs=planner.inputs, encoding=encoding,
+                                        num_workers=num_workers, symmetry=False, preset=preset)
+                planner.build_model()
+                planner.add_repair(base, free_employees, free_days, first_repair_mode)
+                planner.add_hints(base)
+                with first_callback.watch_stop():
+                    first_stage_result = planner.resolve(first_callback, time_limit('offday'))
+                if first_stage_result['status'] == 'success':
+                    break
+        else:
+            with first_callback.watch_stop():
+                first_stage_result = planner.run(first_callback, hint=hint, time_limit=time_limit('offday'),
+                                                 cache=cache)
         
         # 檢查第一階段是否成功
         if first_stage_result['status'] != 'success':
@@ -416,82 +909,163 @@ def run_auto_scheduling(cycle_id):
             }
 
         # 第二階段：班別分配與驗證
-        max_retries = 5  # 最大重試次數
+        # 驗證失敗時不再重建相同模型重試，而是把違規項目轉為限制條件加入現有模型，
+        # 並以上一次的解作為 hint 重新求解，每一輪都排除掉上一輪被拒絕的解
+        max_retries = 5  # 最大求解輪數
         current_retry = 0
         shift_requirements = planner.shift_req_data
         offdays_raw = planner.offdays_raw
         shift_group = planner.shift_group_raw
+        all_violations = []
+        shift_repair_mode = 'fix'
 
-        while current_retry < max_retries:
-            # 建立第二階段求解器
+        def build_shift_solver(stage_hint):
             shift_solver = ShiftAssignmentSolver(
                 first_stage_result['schedule'], 
                 shift_requirements, 
                 offdays_raw,
                 shift_group, 
-                dates=planner.dates
+                dates=planner.dates,
+                encoding=encoding,
+                num_workers=num_workers,
+                symmetry=symmetry and not scope,
+                preset=preset
             )
-            shift_solver.add_constraints()
-            shift_solver.add_soft_constraints()
-            solver, status = shift_solver.solve()
+            shift_solver.load_or_build_model(cache)
+            if scope:
+                shift_solver.add_repair(base, free_employees, free_days, shift_repair_mode)
+            # 第一階段重新求解後，先前累積的第二階段限制需重新加入
+            shift_solver.add_violation_cuts(all_violations)
+            if stage_hint:
+                shift_solver.add_hints(stage_hint)
+            return shift_solver
+
+        shift_solver = build_shift_solver(hint)
+        while current_retry < max_retries:
+            reporter.progress('second', f'第二階段：班別分配求解中 (第 {current_retry + 1}/{max_retries} 輪)')
+            second_callback = SolutionStreamCallback(
+                'second', reporter,
+                lambda cb, shift_solver=shift_solver: shift_solver.get_result(cb, cp_model.FEASIBLE)
+            )
+            with second_callback.watch_stop():
+                solver, status = shift_solver.solve(second_callback, time_limit('shift'))
+            current_retry += 1
             
             # 檢查是否有解
-            if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-                shift_result = shift_solver.get_result(solver, status)
-                
-                # 驗證班別分配結果
-                verification_passed = verify_shift_assignment(shift_result, planner.dates)
-                
-                if verification_passed:
-                    # 驗證通過，回傳成功結果
-                    return {
-                        'success': True,
-                        'message': '自動排班成功！班別分配結果符合所有限制條件',
-                        'stage': 'complete',
-                        'data': {
-                            'cycle_id': cycle_id,
-                            'start_date': planner.start_date.strftime('%Y-%m-%d'),
-                            'end_date': planner.end_date.strftime('%Y-%m-%d'),
-                            'dates': planner.dates,
-                            'schedule': shift_result,
-                            'first_stage_result': first_stage_result['schedule'],
-                            'retry_count': current_retry + 1,
-                            'verification_passed': True
-                        }
-                    }
-                else:
-                    # 驗證未通過，準備重試
-                    current_retry += 1
-                    if current_retry >= max_retries:
-                        return {
-                            'success': False,
-                            'message': f'已達到最大重試次數 ({max_retries})，無法生成符合條件的班別分配',
-                            'stage': 'second',
-                            'data': {
-                                'cycle_id': cycle_id,
-                                'retry_count': current_retry,
-                                'last_result': shift_result,
-                                'verification_passed': False
-                            }
-                        }
-            else:
-                # 第二階段無可行解
+            if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE) and scope and shift_repair_mode == 'fix':
+                # 修補模式固定其餘班別後無解：改為允許變動但加權懲罰
+                shift_repair_mode = 'penalty'
+                shift_solver = build_shift_solver(base)
+                continue
+            if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                # 第二階段無可行解（第一輪之後代表加入的限制無法同時滿足），或在時間上限內找不到解
                 return {
                     'success': False,
-                    'message': '第二階段無可行解',
+                    'message': '第二階段在時間上限內找不到可行解' if status == cp_model.UNKNOWN else '第二階段無可行解',
                     'stage': 'second',
                     'data': {
                         'cycle_id': cycle_id,
                         'retry_count': current_retry,
-                        'solver_status': status
+                        'solver_status': status,
+                        'violations': all_violations
                     }
                 }
-        
+
+            shift_result = shift_solver.get_result(solver, status)
+            
+            # 驗證班別分配結果（以班別群組的每日需求為準）
+            verification_passed, violations = verify_shift_violations(
+                shift_result, planner.dates, shift_solver.shift_group
+            )
+            
+            if verification_passed:
+                # 驗證通過，保存草稿供下次暖啟動，並回傳成功結果
+                try:
+                    save_draft_result(cycle_id, planner.dates, shift_result, planner.inputs)
+                except OSError as e:
+                    print(f"保存排班草稿失敗: {e}")
+                reporter.progress('complete', '自動排班完成')
+                result = {
+                    'success': True,
+                    'message': '自動排班成功！班別分配結果符合所有限制條件',
+                    'stage': 'complete',
+                    'data': {
+                        'cycle_id': cycle_id,
+                        'start_date': planner.start_date.strftime('%Y-%m-%d'),
+                        'end_date': planner.end_date.strftime('%Y-%m-%d'),
+                        'dates': planner.dates,
+                        'schedule': shift_result,
+                        'first_stage_result': first_stage_result['schedule'],
+                        'retry_count': current_retry,
+                        'objective': solver.ObjectiveValue(),
+                        'verification_passed': True,
+                        'stopped_early': reporter.should_stop(),
+                        'cached': False,
+                        'repair': None
+                    }
+                }
+                if scope:
+                    result['data']['repair'] = {
+                        'employees': sorted(free_employees),
+                        'dates': [planner.dates[d] for d in sorted(free_days)],
+                        'first_stage_mode': first_repair_mode,
+                        'second_stage_mode': shift_repair_mode,
+                        'changed_cells': sum(
+                            1 for name, row in shift_result.items() if name in base
+                            for d, shift in enumerate(row) if base[name][d] is not None and base[name][d] != shift
+                        )
+                    }
+                if not result['data']['stopped_early']:
+                    try:
+                        save_result(cycle_id, stored_key, result)
+                    except OSError as e:
+                        print(f"保存排班結果快取失敗: {e}")
+                return result
+
+            # 驗證未通過：違規項目轉為限制條件
+            all_violations.extend(violations)
+            if reporter.should_stop():
+                # 已要求停止：不再進行下一輪求解
+                break
+            first_stage_cuts = planner.add_violation_cuts(violations, first_stage_result['schedule'])
+            if first_stage_cuts:
+                # 上班/休假安排本身需要調整：第一階段以原解為 hint 重新求解，再重建第二階段
+                reporter.progress('first', f'第一階段：加入 {first_stage_cuts} 條限制後重新求解')
+                planner.add_solution_hint(first_stage_result['schedule'])
+                with first_callback.watch_stop():
+                    first_stage_result = planner.resolve(first_callback, time_limit('offday'))
+                if first_stage_result['status'] != 'success':
+                    return {
+                        'success': False,
+                        'message': f'第一階段排班失敗: {first_stage_result["message"]}',
+                        'stage': 'first',
+                        'data': {
+                            'cycle_id': cycle_id,
+                            'retry_count': current_retry,
+                            'violations': all_violations
+                        }
+                    }
+                shift_solver = build_shift_solver(shift_result)
+            elif shift_solver.add_violation_cuts(violations):
+                shift_solver.add_solution_hint(shift_result)
+            else:
+                # 沒有新的限制可加，重新求解只會得到相同結果
+                break
+
+        stopped = reporter.should_stop()
         return {
             'success': False,
-            'message': '未知錯誤',
-            'stage': 'unknown',
-            'data': None
+            'message': (f'已求解 {current_retry} 輪後依要求停止，尚未得到符合條件的班別分配' if stopped
+                        else f'已求解 {current_retry} 輪，無法生成符合條件的班別分配'),
+            'stage': 'second',
+            'data': {
+                'cycle_id': cycle_id,
+                'retry_count': current_retry,
+                'last_result': shift_result,
+                'verification_passed': False,
+                'stopped_early': stopped,
+                'violations': all_violations
+            }
         }
         
     except Exception as e:
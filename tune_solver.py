@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+tune_solver.py
+
+CP-SAT 求解參數調校：以一組週期實例重播各引擎的求解，比較不同參數組合，
+並將結果寫入 solver_presets.json 的具名預設組，供 OffdayPlanner / ShiftAssignmentSolver / CPMODEL 執行時載入。
+
+1. 實例：合成週期（--synthetic 員工x天數）或 Supabase 週期（--cycles），每個實例每個引擎只建模一次
+   （shift 引擎以 default 預設組求得的第一階段結果建立）
+2. 搜尋空間：執行緒數、linearization_level、symmetry_level、search_branching、cp_model_presolve、probing
+   以隨機搜尋（--trials，第 0 組為目前的 default 參數）或完整網格（--grid）產生
+3. 每次求解以 callback 記錄目標值軌跡 (秒, 目標值)，量測：
+   - 第一個可行解的時間 (time-to-first)
+   - 達到目標值的時間 (time-to-target)，目標值為該實例所有組合中的最佳值（可用 --tolerance 放寬）
+   未達成者以 2 倍時間上限計分
+4. 平均 time-to-first 最短者寫為 fast-draft（時間上限 --draft-time），
+   平均 time-to-target 最短者寫為 final（時間上限沿用 default 預設組）
+
+用法：
+    python tune_solver.py --engine offday shift --synthetic 30x30 60x30 --trials 12 --time-limit 20
+    python tune_solver.py --engine cpmodel --cycles 14 15 --grid --dry-run
+"""
+
+import io
+import os
+import sys
+import copy
+import random
+import argparse
+import itertools
+import contextlib
+
+from ortools.sat.python import cp_model
+
+from solver_presets import ENGINES, BUILTIN_PRESETS, load_presets, save_presets, preset_parameters, \
+    apply_parameters
+
+SEARCH_SPACE = {
+    'num_search_workers': [1, 4, 8],
+    'linearization_level': [0, 1, 2],
+    'symmetry_level': [0, 1, 2],
+    'search_branching': ['AUTOMATIC_SEARCH', 'FIXED_SEARCH', 'PORTFOLIO_SEARCH',
+                         'PORTFOLIO_WITH_QUICK_RESTART_SEARCH'],
+    'cp_model_presolve': [True, False],
+    'cp_model_probing_level': [0, 2]
+}
+# 未達成時的計分倍數（以時間上限計）
+FAILURE_FACTOR = 2
+
+
+class TrajectoryCallback(cp_model.CpSolverSolutionCallback):
+    """記錄每個中間解的 (求解秒數, 目標值)"""
+
+    def __init__(self):
+        super().__init__()
+        self.trajectory = []
+
+    def on_solution_callback(self):
+        self.trajectory.append((self.WallTime(), self.ObjectiveValue()))
+
+
+# ===================== 實例 =====================
+
+def load_instances(synthetic=None, cycles=None, seed=0):
+    """
+    @param synthetic: list, 'EMPLOYEESxDAYS' 字串，如 ['30x30']
+    @param cycles: list, 週期 ID
+    @return: list, [(名稱, fetch_cycle_inputs 格式的輸入)]
+    """
+    instances = []
+    if synthetic:
+        from synthetic_instances import make_cycle_inputs
+        for size in synthetic:
+            employees, days = (int(value) for value in size.lower().split('x'))
+            instances.append((f'synthetic {employees}x{days}',
+                              make_cycle_inputs(employees=employees, days=days, seed=seed,
+                                                red_off_ratio=0.1, blue_off_ratio=0.1)))
+    if cycles:
+        from supabase_client import fetch_cycles_inputs
+        for cycle_id, inputs in sorted(fetch_cycles_inputs(cycles).items()):
+            instances.append((f'cycle #{cycle_id}', inputs))
+    return instances
+
+
+def build_models(inputs, engines):
+    """
+    為單一實例建立各引擎的模型
+    @return: dict, {引擎: cp_model.CpModel}；無法建立的引擎（如第一階段無解）不列入
+    """
+    # 延遲匯入，避免只讀寫預設組時載入求解器
+    from test_plup import OffdayPlanner, ShiftAssignmentSolver
+    from cpmodel_2025 import CPMODEL
+    from portfolio_solver import prepare_inputs
+
+    models = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        if 'offday' in engines or 'shift' in engines:
+            planner = OffdayPlanner(0, inputs=inputs, preset='default')
+            planner.build_model()
+            models['offday'] = planner.model
+        if 'shift' in engines:
+            first_stage = planner.resolve()
+            if first_stage['status'] == 'success':
+                shift_solver = ShiftAssignmentSolver(first_stage['schedule'], planner.shift_req_data,
+                                                     planner.offdays_raw, planner.shift_group_raw,
+                                                     dates=planner.dates, preset='default')
+                shift_solver.add_constraints()
+                shift_solver.add_soft_constraints()
+                models['shift'] = shift_solver.model
+        if 'cpmodel' in engines:
+            model = CPMODEL(0, inputs=prepare_inputs(inputs), preset='default')
+            model.add_constraints()
+            model.add_preferences()
+            models['cpmodel'] = model.model
+    return {engine: model for engine, model in models.items() if engine in engines}
+
+
+# ===================== 搜尋 =====================
+
+def candidate_parameters(trials, grid=False, seed=0, max_workers=None):
+    """
+    @param trials: int, 隨機搜尋的組合數（grid=True 時忽略）
+    @param grid: bool, 是否使用完整網格
+    @param max_workers: int, 執行緒數上限（預設為 CPU 核心數）
+    @return: list, [{參數: 值}]，第一組為空（即 default 預設組本身）
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    space = dict(SEARCH_SPACE)
+    space['num_search_workers'] = sorted({min(value, max_workers) for value in space['num_search_workers']})
+    keys = list(space)
+    if grid:
+        combos = [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+    else:
+        rnd = random.Random(seed)
+        combos, seen = [], set()
+        limit = 1
+        for key in keys:
+            limit *= len(space[key])
+        while len(combos) < min(trials - 1, limit):
+            combo = {key: rnd.choice(space[key]) for key in keys}
+            signature = tuple(combo.values())
+            if signature not in seen:
+                seen.add(signature)
+                combos.append(combo)
+    return [{}] + combos
+
+
+def run_trial(model, engine, parameters, time_limit):
+    """
+    以 default 預設組加上候選參數求解一次
+    @return: dict, {'status', 'objective', 'first', 'trajectory'}
+    """
+    solver = cp_model.CpSolver()
+    apply_parameters(solver, {**preset_parameters(engine, 'default'), **parameters,
+                              'max_time_in_seconds': time_limit})
+    callback = TrajectoryCallback()
+    status = solver.Solve(model, callback)
+    feasible = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    trajectory = callback.trajectory
+    if feasible and not trajectory:
+        trajectory = [(solver.WallTime(), solver.ObjectiveValue())]
+    return {
+        'status': solver.StatusName(status),
+        'objective': solver.ObjectiveValue() if feasible else None,
+        'first': trajectory[0][0] if trajectory else None,
+        'trajectory': trajectory
+    }
+
+
+def time_to_target(trajectory, target, tolerance):
+    """目標值軌跡第一次達到 target（含相對容許誤差）的時間，未達成回傳 None"""
+    bound = target + abs(target) * tolerance + 1e-6
+    for elapsed, objective in trajectory:
+        if objective <= bound:
+            return elapsed
+    return None
+
+
+def score(runs, time_limit, tolerance):
+    """
+    @param runs: dict, {實例名稱: [run_trial 結果（依候選參數順序）]}
+    @return: (list 各組合的平均 time-to-first, list 各組合的平均 time-to-target)
+    """
+    failed = FAILURE_FACTOR * time_limit
+    n_candidates = len(next(iter(runs.values())))
+    first = [0.0] * n_candidates
+    target = [0.0] * n_candidates
+    for results in runs.values():
+        objectives = [result['objective'] for result in results if result['objective'] is not None]
+        best = min(objectives) if objectives else None
+        for i, result in enumerate(results):
+            first[i] += result['first'] if result['first'] is not None else failed
+            reached = time_to_target(result['trajectory'], best, tolerance) if best is not None else None
+            target[i] += reached if reached is not None else failed
+    return [value / len(runs) for value in first], [value / len(runs) for value in target]
+
+
+def tune_engine(engine, models, candidates, time_limit, tolerance, reporter=print):
+    """
+    @param models: list, [(實例名稱, cp_model.CpModel)]
+    @return: dict, {'draft': 參數, 'final': 參數, 'first': [...], 'target': [...]}
+    """
+    runs = {}
+    for name, model in models:
+        runs[name] = []
+        for i, parameters in enumerate(candidates):
+            result = run_trial(model, engine, parameters, time_limit)
+            runs[name].append(result)
+            reporter(f"  [{engine}] {name} #{i:<3} {result['status']:<10} obj={result['objective']} "
+                     f"first={result['first'] if result['first'] is None else round(result['first'], 2)}")
+    first, target = score(runs, time_limit, tolerance)
+    return {
+        'draft': candidates[min(range(len(candidates)), key=lambda i: (first[i], target[i]))],
+        'final': candidates[min(range(len(candidates)), key=lambda i: (target[i], first[i]))],
+        'first': first,
+        'target': target
+    }
+
+
+def write_presets(tuned, draft_name='fast-draft', final_name='final', draft_time=10, path=None):
+    """
+    將調校結果寫入預設組檔案，保留其他預設組與未調校的引擎
+    @param tuned: dict, {引擎: tune_engine 的結果}
+    @param draft_time: float, fast-draft 的求解時間上限（秒）
+    @return: dict, 寫入後的全部預設組
+    """
+    presets = load_presets(path)
+    base = presets.get('default', BUILTIN_PRESETS['default'])
+    for name in (draft_name, final_name):
+        # 新的預設組以 default 為底，未調校的引擎仍有時間上限
+        presets.setdefault(name, copy.deepcopy(base))
+    for engine, result in tuned.items():
+        default = base.get(engine, {})
+        presets[draft_name][engine] = {**default, **result['draft'], 'max_time_in_seconds': draft_time}
+        presets[final_name][engine] = {**default, **result['final']}
+    save_presets(presets, path)
+    return presets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CP-SAT 求解參數調校，結果寫入 solver_presets.json')
+    parser.add_argument('--engine', nargs='+', choices=ENGINES, default=['offday', 'shift'])
+    parser.add_argument('--synthetic', nargs='+', help='合成實例大小，如 30x30 60x30')
+    parser.add_argument('--cycles', type=int, nargs='+', help='Supabase 週期 ID')
+    parser.add_argument('--trials', type=int, default=12, help='隨機搜尋的組合數（含 default）')
+    parser.add_argument('--grid', action='store_true', help='使用完整網格取代隨機搜尋')
+    parser.add_argument('--time-limit', type=float, default=20, help='每次求解的時間上限（秒）')
+    parser.add_argument('--tolerance', type=float, default=0.0, help='目標值相對容許誤差')
+    parser.add_argument('--draft-time', type=float, default=10, help='fast-draft 的求解時間上限（秒）')
+    parser.add_argument('--draft-name', default='fast-draft')
+    parser.add_argument('--final-name', default='final')
+    parser.add_argument('--presets-path', help='預設組檔案（預設為 solver_presets.json）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dry-run', action='store_true', help='只輸出結果，不寫入預設組')
+    args = parser.parse_args()
+
+    instances = load_instances(args.synthetic or ([] if args.cycles else ['30x30']), args.cycles, args.seed)
+    models = {engine: [] for engine in args.engine}
+    for name, inputs in instances:
+        for engine, model in build_models(inputs, args.engine).items():
+            models[engine].append((name, model))
+    candidates = candidate_parameters(args.trials, args.grid, args.seed)
+    print(f"{len(instances)} 個實例，{len(candidates)} 組參數，每次 {args.time_limit}s")
+
+    tuned = {}
+    for engine in args.engine:
+        if not models[engine]:
+            print(f"[{engine}] 沒有可用的實例，略過")
+            continue
+        result = tune_engine(engine, models[engine], candidates, args.time_limit, args.tolerance)
+        tuned[engine] = result
+        baseline = (result['first'][0], result['target'][0])
+        print(f"[{engine}] default    : first {baseline[0]:.2f}s, target {baseline[1]:.2f}s")
+        for label in ('draft', 'final'):
+            i = candidates.index(result[label])
+            print(f"[{engine}] {label:<10} : first {result['first'][i]:.2f}s, target {result['target'][i]:.2f}s "
+                  f"{result[label] or '(default)'}")
+
+    if tuned and not args.dry_run:
+        write_presets(tuned, args.draft_name, args.final_name, args.draft_time, args.presets_path)
+        print(f"已寫入預設組 {args.draft_name}, {args.final_name}")
+    return 0 if tuned else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
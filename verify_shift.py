@@ -15,21 +15,27 @@ from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 
 class ShiftVerifier:
-    def __init__(self, shift_result: Dict[str, List[str]], dates: List[str]):
+    def __init__(self, shift_result: Dict[str, List[str]], dates: List[str],
+                 daily_requirements: Optional[Dict[int, Dict[str, int]]] = None):
         """
         初始化驗證器
         
         Args:
             shift_result: 班別分配結果，格式 {員工名: [班別列表]}
             dates: 日期列表，格式 ['YYYY-MM-DD', ...]
+            daily_requirements: 每週各日的班別需求，格式 {星期(0=週一): {'A': 人數, ...}}，
+                                未提供時使用預設需求
         """
         self.shift_result = shift_result
         self.dates = dates
         self.employees = list(shift_result.keys())
         self.D = len(dates)
         
+        # 逐條記錄違規項目，供求解器轉為限制條件 (lazy constraints)
+        self.violations = []
+        
         # 每日班別需求定義
-        self.daily_requirements = {
+        self.daily_requirements = daily_requirements or {
             0: {'A': 3, 'B': 2, 'C': 1},  # 週一
             1: {'A': 3, 'B': 2, 'C': 1},  # 週二
             2: {'A': 3, 'B': 2, 'C': 1},  # 週三
@@ -71,11 +77,19 @@ class ShiftVerifier:
             day_passed = True
             day_details = []
             for shift_type in ['A', 'B', 'C']:
-                if actual[shift_type] < required[shift_type]:
+                required_count = required.get(shift_type, 0)
+                if actual[shift_type] < required_count:
                     day_passed = False
-                    day_details.append(f"{shift_type}班不足: 需要{required[shift_type]}人，實際{actual[shift_type]}人")
-                elif actual[shift_type] > required[shift_type]:
-                    day_details.append(f"{shift_type}班過多: 需要{required[shift_type]}人，實際{actual[shift_type]}人")
+                    day_details.append(f"{shift_type}班不足: 需要{required_count}人，實際{actual[shift_type]}人")
+                    self.violations.append({
+                        'rule': 'daily_staffing',
+                        'date_index': d,
+                        'shift': shift_type,
+                        'required': required_count,
+                        'actual': actual[shift_type]
+                    })
+                elif actual[shift_type] > required_count:
+                    day_details.append(f"{shift_type}班過多: 需要{required_count}人，實際{actual[shift_type]}人")
             
             if not day_passed:
                 passed = False
@@ -120,6 +134,7 @@ class ShiftVerifier:
                     if continuous_count > 7:
                         passed = False
                         details.append(f"{emp_name}: 連續上班{continuous_count}天 (超過7天限制)")
+                        self._add_continuous_violation(emp_name, d - continuous_count, d - 1)
                     max_continuous = max(max_continuous, continuous_count)
                     continuous_count = 0
             
@@ -127,6 +142,7 @@ class ShiftVerifier:
             if continuous_count > 7:
                 passed = False
                 details.append(f"{emp_name}: 連續上班{continuous_count}天 (超過7天限制)")
+                self._add_continuous_violation(emp_name, len(shifts) - continuous_count, len(shifts) - 1)
             
             if max_continuous <= 7:
                 details.append(f"{emp_name}: 最大連續上班{max_continuous}天 (符合限制)")
@@ -143,6 +159,15 @@ class ShiftVerifier:
         print(f"連續上班天數驗證: {'通過' if passed else '未通過'}")
         return passed
 
+    def _add_continuous_violation(self, emp_name: str, start: int, end: int):
+        """記錄一段超過7天的連續上班區間 (含頭尾的日期索引)"""
+        self.violations.append({
+            'rule': 'continuous_work',
+            'employee': emp_name,
+            'start_index': start,
+            'end_index': end
+        })
+
     def verify_shift_connection(self) -> bool:
         """
         驗證大夜班(C)後方是否為大夜班(C)或休假(O)
@@ -165,6 +190,13 @@ class ShiftVerifier:
                 if current_shift == 'C' and next_shift not in ['C', 'O']:
                     passed = False
                     violations.append(f"{self.dates[d]} C班後接{next_shift}班")
+                    self.violations.append({
+                        'rule': 'shift_connection',
+                        'employee': emp_name,
+                        'date_index': d,
+                        'shift': current_shift,
+                        'next_shift': next_shift
+                    })
             
             if violations:
                 details.append(f"{emp_name}: {', '.join(violations)}")
@@ -242,21 +274,45 @@ class ShiftVerifier:
         return weekday_names[weekday]
 
 
-def verify_shift_assignment(shift_result: Dict[str, List[str]], dates: List[str]) -> bool:
+def verify_shift_assignment(shift_result: Dict[str, List[str]], dates: List[str],
+                            daily_requirements: Optional[Dict[int, Dict[str, int]]] = None) -> bool:
     """
     驗證班別分配結果的便捷函數
     
     Args:
         shift_result: 班別分配結果
         dates: 日期列表
+        daily_requirements: 每週各日的班別需求（可選）
         
     Returns:
         bool: 是否通過所有驗證
     """
-    verifier = ShiftVerifier(shift_result, dates)
+    verifier = ShiftVerifier(shift_result, dates, daily_requirements)
     return verifier.verify_all()
 
 
+def verify_shift_violations(shift_result: Dict[str, List[str]], dates: List[str],
+                            daily_requirements: Optional[Dict[int, Dict[str, int]]] = None) -> Tuple[bool, List[Dict]]:
+    """
+    驗證班別分配結果並回傳逐條違規項目
+    
+    Args:
+        shift_result: 班別分配結果
+        dates: 日期列表
+        daily_requirements: 每週各日的班別需求（可選）
+        
+    Returns:
+        Tuple[bool, List[Dict]]: (是否通過所有驗證, 違規項目列表)
+        違規項目格式：
+        - {'rule': 'daily_staffing', 'date_index', 'shift', 'required', 'actual'}
+        - {'rule': 'continuous_work', 'employee', 'start_index', 'end_index'}
+        - {'rule': 'shift_connection', 'employee', 'date_index', 'shift', 'next_shift'}
+    """
+    verifier = ShiftVerifier(shift_result, dates, daily_requirements)
+    passed = verifier.verify_all()
+    return passed, verifier.violations
+
+
 if __name__ == '__main__':
     # 測試用的範例資料
     test_shift_result = {
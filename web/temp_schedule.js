@@ -33,6 +33,7 @@ class TempScheduleMode {
         
         // 儲存每個員工每天的休假狀態
         this.leaveData = new Map(); // 格式: Map<"employeeName_date", {state: number, weight: number}>
+        this.savedLeaveStates = null; // 上次載入或儲存時資料庫中的休假狀態 Map<"employeeName_date", state>，用於只送出差異
         
         // 標記是否已經執行過自動排班
         this.hasAutoScheduled = false;
@@ -727,20 +728,52 @@ class TempScheduleMode {
     async saveLeaveData() {
         const cycleId = this.cycleData.cycle_id;
         
+        // 建立姓名對 employee_id 的對照，後端不必再逐筆以姓名查詢
+        const nameToId = new Map();
+        if (Array.isArray(this.members)) {
+            this.members.forEach(m => {
+                nameToId.set(m.snapshot_name, m.employee_id);
+            });
+        }
+
         // 將 Map 轉換為陣列格式，方便傳送
-        const leaveDataArray = [];
-        this.leaveData.forEach((value, key) => {
+        const toLeaveItem = (key, state) => {
             const [employeeName, date] = key.split('_');
-            leaveDataArray.push({
+            return {
                 cycle_id: cycleId,
+                employee_id: nameToId.get(employeeName),
                 employee_name: employeeName,
                 date: date,
-                leave_state: value.state,
-                leave_weight: value.weight
+                leave_state: state,
+                leave_weight: state > 0 ? this.leaveStates[state].weight : 0
+            };
+        };
+        const currentStates = this.snapshotLeaveStates();
+        let payload;
+        if (this.savedLeaveStates) {
+            // 已知資料庫中的狀態：只送出新增、變更與刪除的格子
+            const delta = { added: [], changed: [], removed: [] };
+            currentStates.forEach((state, key) => {
+                const savedState = this.savedLeaveStates.get(key);
+                if (savedState === undefined) {
+                    delta.added.push(toLeaveItem(key, state));
+                } else if (savedState !== state) {
+                    delta.changed.push(toLeaveItem(key, state));
+                }
             });
-        });
+            this.savedLeaveStates.forEach((state, key) => {
+                if (!currentStates.has(key)) {
+                    delta.removed.push(toLeaveItem(key, 0));
+                }
+            });
+            payload = { cycle_id: cycleId, delta: delta };
+        } else {
+            const leaveDataArray = [];
+            currentStates.forEach((state, key) => leaveDataArray.push(toLeaveItem(key, state)));
+            payload = { cycle_id: cycleId, leave_data: leaveDataArray };
+        }
 
-        console.log(`正在儲存週期 #${cycleId} 的休假資料...`, leaveDataArray);
+        console.log(`正在儲存週期 #${cycleId} 的休假資料...`, payload);
 
         // ===== 新增 toast loading =====
         const toastContainer = document.querySelector('.toast-container');
@@ -764,10 +797,7 @@ class TempScheduleMode {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({
-                    cycle_id: cycleId,
-                    leave_data: leaveDataArray
-                })
+                body: JSON.stringify(payload)
             });
             
             if (!response.ok) {
@@ -777,6 +807,7 @@ class TempScheduleMode {
             
             const result = await response.json();
             console.log('休假資料儲存成功:', result);
+            this.savedLeaveStates = currentStates;
             
             // 移除 loading toast
             bsLoadingToast.hide();
@@ -790,7 +821,7 @@ class TempScheduleMode {
                     <strong class="me-auto">系統訊息</strong>
                     <button type="button" class="btn-close" data-bs-dismiss="toast" aria-label="Close"></button>
                 </div>
-                <div class="toast-body">儲存成功！共儲存 ${result.count} 筆資料。</div>
+                <div class="toast-body">儲存成功！共寫入 ${result.count} 筆、刪除 ${result.deleted || 0} 筆資料。</div>
             `;
             toastContainer.appendChild(resultToast);
             let bsResultToast = new bootstrap.Toast(resultToast);
@@ -830,6 +861,20 @@ class TempScheduleMode {
         }
     }
 
+    /**
+     * 目前各格子的休假狀態（不含無休假的格子）
+     * @returns {Map<string, number>} Map<"employeeName_date", state>
+     */
+    snapshotLeaveStates() {
+        const states = new Map();
+        this.leaveData.forEach((value, key) => {
+            if (value.state > 0) {
+                states.set(key, value.state);
+            }
+        });
+        return states;
+    }
+
     /**
      * 載入已儲存的休假資料
      */
@@ -850,7 +895,8 @@ class TempScheduleMode {
             const leavesData = await response.json();
             console.log('載入到的休假資料:', leavesData);
             
-            // 將休假資料轉換為內部格式並更新顯示
+            // 將休假資料轉換為內部格式並更新顯示，同時記錄資料庫中的狀態
+            const savedStates = new Map();
             leavesData.forEach(leaveItem => {
                 const employeeName = leaveItem.employee_name;
                 const date = leaveItem.date;
@@ -869,6 +915,7 @@ class TempScheduleMode {
                 if (state > 0) {
                     const key = `${employeeName}_${date}`;
                     const weight = this.leaveStates[state].weight;
+                    savedStates.set(key, state);
                     
                     // 更新內部資料
                     this.leaveData.set(key, {
@@ -885,6 +932,7 @@ class TempScheduleMode {
             });
             
             console.log(`成功載入 ${leavesData.length} 筆休假資料`);
+            this.savedLeaveStates = savedStates;
             
             // 更新實際班別統計
             this.updateActualShiftCounts();
@@ -935,6 +983,7 @@ class TempScheduleMode {
             
             // 清除前端顯示
             this.clearAllLeaves();
+            this.savedLeaveStates = new Map();
             
             // 更新時間軸狀態 - 清除休假後回到預/畫假階段
             this.updateTimelineStep('set-leaves', 'current');
@@ -996,7 +1045,7 @@ class TempScheduleMode {
         try {
             console.log(`開始執行週期 #${cycleId} 的自動排班...`);
             
-            // 呼叫後端 API
+            // 呼叫後端 API 送出排班工作
             const response = await fetch('/api/run-schedule', {
                 method: 'POST',
                 headers: {
@@ -1011,7 +1060,13 @@ class TempScheduleMode {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
             
-            const result = await response.json();
+            const job = await response.json();
+            console.log('已送出排班工作:', job);
+            
+            // 訂閱工作的中間解直到完成（瀏覽器不支援 SSE 時改用輪詢）
+            const result = window.EventSource
+                ? await this.streamScheduleJob(job.job_id)
+                : await this.waitForScheduleJob(job.job_id);
             console.log('自動排班結果:', result);
             
             // 隱藏載入狀態
@@ -1048,6 +1103,105 @@ class TempScheduleMode {
         }
     }
 
+    /**
+     * 以 Server-Sent Events 訂閱排班工作的中間解，直到工作結束
+     * 收到第一個中間解後顯示「採用目前結果」按鈕，可提前停止求解
+     * @param {string} jobId - 排班工作 ID
+     * @returns {Promise<Object>} run_auto_scheduling 的結果
+     */
+    streamScheduleJob(jobId) {
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`/api/schedule-jobs/${jobId}/events`);
+            const stageNames = { first: '第一階段', second: '第二階段' };
+            
+            const setMessage = (text) => {
+                const messageEl = this.container.querySelector('.loading-overlay .loading-message');
+                if (messageEl) {
+                    messageEl.textContent = text;
+                }
+            };
+            
+            source.addEventListener('progress', (e) => {
+                const progress = JSON.parse(e.data);
+                if (progress.message) {
+                    setMessage(progress.message);
+                }
+            });
+            
+            source.addEventListener('solution', (e) => {
+                const solution = JSON.parse(e.data);
+                setMessage(`${stageNames[solution.stage] || ''}找到第 ${solution.solution_index} 個解，` +
+                    `懲罰分數 ${solution.objective}（${solution.elapsed.toFixed(1)} 秒）`);
+                this.showAcceptSolutionButton(jobId);
+            });
+            
+            source.addEventListener('done', (e) => {
+                source.close();
+                resolve(JSON.parse(e.data).result);
+            });
+            
+            source.onerror = () => {
+                // 連線中斷時改用輪詢取得最終結果
+                source.close();
+                this.waitForScheduleJob(jobId).then(resolve, reject);
+            };
+        });
+    }
+
+    /**
+     * 在載入遮罩中顯示「採用目前結果」按鈕
+     * @param {string} jobId - 排班工作 ID
+     */
+    showAcceptSolutionButton(jobId) {
+        const content = this.container.querySelector('.loading-overlay .loading-content');
+        if (!content || content.querySelector('.accept-solution-btn')) return;
+        
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.className = 'btn btn-outline-primary btn-sm accept-solution-btn';
+        button.textContent = '採用目前結果';
+        button.addEventListener('click', async () => {
+            button.disabled = true;
+            button.textContent = '正在停止求解...';
+            try {
+                await fetch(`/api/schedule-jobs/${jobId}/stop`, { method: 'POST' });
+            } catch (error) {
+                console.error('停止排班工作失敗:', error);
+                button.disabled = false;
+                button.textContent = '採用目前結果';
+            }
+        });
+        content.appendChild(button);
+    }
+
+    /**
+     * 輪詢排班工作直到結束
+     * @param {string} jobId - 排班工作 ID
+     * @param {number} interval - 輪詢間隔（毫秒）
+     * @returns {Promise<Object>} run_auto_scheduling 的結果
+     */
+    async waitForScheduleJob(jobId, interval = 2000) {
+        while (true) {
+            const response = await fetch(`/api/schedule-jobs/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+            
+            const job = await response.json();
+            if (job.status === 'succeeded' || job.status === 'failed') {
+                return job.result;
+            }
+            
+            // 更新載入訊息為目前進度
+            const messageEl = this.container.querySelector('.loading-overlay .loading-message');
+            if (messageEl && job.progress && job.progress.message) {
+                messageEl.textContent = job.progress.message;
+            }
+            
+            await new Promise(resolve => setTimeout(resolve, interval));
+        }
+    }
+
     /**
      * 顯示載入遮罩
      * @param {string} message - 載入訊息
@@ -1481,6 +1635,13 @@ class TempScheduleMode {
      */
     async saveRequirementsChanges() {
         const cycleId = this.cycleData.cycle_id;
+        // 建立姓名對 employee_id 的對照，後端不必再以姓名查詢
+        const nameToId = new Map();
+        if (Array.isArray(this.members)) {
+            this.members.forEach(m => {
+                nameToId.set(m.snapshot_name, m.employee_id);
+            });
+        }
         const changes = [];
         this.currentRequirements.forEach((value, key) => {
             const originalValue = this.originalRequirements.get(key);
@@ -1488,6 +1649,7 @@ class TempScheduleMode {
                 const [employeeName, shiftType] = key.split('_');
                 changes.push({
                     cycle_id: cycleId,
+                    employee_id: nameToId.get(employeeName),
                     employee_name: employeeName,
                     shift_type: shiftType,
                     required_days: value
@@ -1534,6 +1696,10 @@ class TempScheduleMode {
 
             const result = await response.json();
             console.log('需求變更儲存成功:', result);
+            const failed = (result.results || []).filter(r => r.status !== 'updated');
+            if (failed.length > 0) {
+                console.warn('部分需求變更未套用:', failed);
+            }
 
             // 移除 loading toast
             bsLoadingToast.hide();